@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+Поток событий заказов /admin/orders/events/ - асинхронное представление
+с долгими соединениями, его нужно обслуживать ASGI-сервером, например:
+    uvicorn backend.asgi:application
 """
 
 import os
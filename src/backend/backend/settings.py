@@ -4,6 +4,7 @@ Django settings for core project.
 from datetime import timedelta
 from pathlib import Path
 import os
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -68,6 +69,10 @@ CORS_ALLOW_METHODS = [
     'PUT',
 ]
 
+# Токен гостевой корзины (main/basket.py) и ключ идемпотентности (main/idempotency.py)
+CORS_ALLOW_HEADERS = (*default_headers, "x-guest-basket", "idempotency-key", "last-event-id")
+CORS_EXPOSE_HEADERS = ["X-Guest-Basket", "Idempotent-Replayed"]
+
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
 ]
@@ -75,6 +80,7 @@ AUTHENTICATION_BACKENDS = [
 ROOT_URLCONF = "main.urls"
 
 WSGI_APPLICATION = "backend.wsgi.application"
+ASGI_APPLICATION = "backend.asgi.application"
 
 TEMPLATES = [
     {
@@ -106,6 +112,100 @@ DATABASES = {
 }
 
 
+# Кеш ответов каталога: locmem (по умолчанию), file или redis.
+# LocMemCache вытесняет записи по LRU при достижении MAX_ENTRIES, поэтому
+# подходит только для одного процесса; при нескольких воркерах нужен общий
+# file или redis (любой Redis-совместимый сервер с maxmemory-policy allkeys-lru).
+CATALOG_CACHE_BACKEND = os.getenv("CATALOG_CACHE_BACKEND", "locmem")
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 300))
+
+CATALOG_CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "catalog",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CATALOG_CACHE_DIR", BASE_DIR / "cache" / "catalog"),
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://127.0.0.1:6379/1"),
+    },
+}
+
+# Хранилище корзин (см. main/basket.py). Корзины гостей всегда живут в кеше
+# и переносятся в базу при входе или оформлении заказа; BASKET_STORAGE=cache
+# включает то же для пользователей, откладывая запись в базу до оформления.
+# Для нескольких воркеров нужен redis: locmem у каждого процесса свой.
+BASKET_STORAGES = {
+    "db": "main.basket.DatabaseBasketStorage",
+    "cache": "main.basket.CacheBasketStorage",
+}
+BASKET_STORAGE = BASKET_STORAGES[os.getenv("BASKET_STORAGE", "db")]
+BASKET_GUEST_STORAGE = BASKET_STORAGES["cache"]
+
+# Оформление заказа: sync - сразу в запросе, async - через очередь CheckoutJob
+# и воркер process_checkouts (для пиковых распродаж). Клиент может запросить
+# асинхронный режим заголовком Prefer: respond-async.
+CHECKOUT_MODE = os.getenv("CHECKOUT_MODE", "sync")
+
+# Количество шардов остатка горячих товаров (Product.product_is_hot, main/stock.py)
+STOCK_SHARD_COUNT = int(os.getenv("STOCK_SHARD_COUNT", 8))
+
+# Время жизни резерва остатка под позицию корзины, с (main/reservations.py).
+# Истёкшие резервы не учитываются и удаляются командой release_reservations.
+STOCK_RESERVATION_TTL = int(os.getenv("STOCK_RESERVATION_TTL", 15 * 60))
+
+# Время хранения ответов на запросы с Idempotency-Key, с (main/idempotency.py)
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 3600))
+
+# Поток событий заказов /admin/orders/events/ (main/events.py): интервал опроса
+# журнала, с; длительность одного соединения, с; ожидание пропусков в нумерации
+# событий, с; срок токена подключения, с; время хранения событий, с
+ORDER_EVENTS_POLL_INTERVAL = float(os.getenv("ORDER_EVENTS_POLL_INTERVAL", 1.0))
+ORDER_EVENTS_STREAM_TIMEOUT = int(os.getenv("ORDER_EVENTS_STREAM_TIMEOUT", 300))
+ORDER_EVENTS_GAP_WINDOW = int(os.getenv("ORDER_EVENTS_GAP_WINDOW", 300))
+ORDER_EVENTS_TOKEN_TTL = int(os.getenv("ORDER_EVENTS_TOKEN_TTL", 60))
+ORDER_EVENTS_TTL = int(os.getenv("ORDER_EVENTS_TTL", 7 * 24 * 3600))
+
+# Время кеширования общего количества строк в списках заказов (?count=cached), с
+PAGINATION_COUNT_CACHE_TTL = int(os.getenv("PAGINATION_COUNT_CACHE_TTL", 30))
+
+BASKET_CACHE_BACKEND = os.getenv("BASKET_CACHE_BACKEND", "locmem")
+BASKET_CACHE_TIMEOUT = int(os.getenv("BASKET_CACHE_TIMEOUT", 30 * 24 * 3600))
+
+BASKET_CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "baskets",
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("BASKET_REDIS_URL", os.getenv("REDIS_URL", "redis://127.0.0.1:6379/2")),
+    },
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalog": {
+        **CATALOG_CACHE_BACKENDS[CATALOG_CACHE_BACKEND],
+        "TIMEOUT": CATALOG_CACHE_TIMEOUT,
+        "KEY_PREFIX": "catalog",
+    },
+    "baskets": {
+        **BASKET_CACHE_BACKENDS[BASKET_CACHE_BACKEND],
+        "TIMEOUT": BASKET_CACHE_TIMEOUT,
+        "KEY_PREFIX": "basket",
+    },
+}
+
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
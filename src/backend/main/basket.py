@@ -0,0 +1,427 @@
+"""
+Изменение и хранение корзин.
+
+Список операций проверяется целиком до записи: позиции корзины и остатки
+всех затронутых товаров читаются по одному запросу, при ошибке в любой
+операции корзина не меняется. Операции:
+    {'op': 'add', 'product_id': ..., 'quantity': 1}  - добавить к количеству;
+    {'op': 'set', 'position_id' | 'product_id': ..., 'quantity': ...}
+                                                     - задать количество (< 1 - удалить);
+    {'op': 'remove', 'position_id' | 'product_id': ...} - удалить позицию.
+
+Хранилища корзин (settings.BASKET_STORAGE, BASKET_GUEST_STORAGE):
+    DatabaseBasketStorage - таблицы basket / basket_position. Строка корзины
+        блокируется (SELECT ... FOR UPDATE), новые позиции вставляются
+        bulk_create, удалённые - одним DELETE, изменённые количества - одним
+        UPDATE ... CASE с F()-выражениями;
+    CacheBasketStorage - словарь {товар: количество} в кеше 'baskets'
+        без записей в базу. Гостевая корзина адресуется токеном из заголовка
+        X-Guest-Basket и переносится в базу при входе и оформлении заказа.
+        Чтение-изменение-запись выполняется под блокировкой: ключ-замок
+        ставится через cache.add, который атомарен во всех бэкендах кеша.
+
+Корзина в базе резервирует остаток под свои позиции (reservations.py);
+проверки количества сверяются с остатком за вычетом чужих активных резервов.
+Строки затронутых товаров блокируются в порядке первичного ключа до чтения
+резервов: конкурентные корзины не резервируют один остаток дважды, а
+оформление заказа, которое доверяет резерву, видит только проверенные резервы.
+"""
+import secrets
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+
+from .models import Basket, BasketPosition, Product
+from .prefetch import optimize_queryset
+from .reservations import held_stock, release, reserve
+from .serializers import BasketSerializer, ProductBriefSerializer
+
+BATCH_OPERATIONS = ('add', 'set', 'remove')
+
+# Максимальное количество операций в одном запросе
+MAX_BATCH_OPERATIONS = 200
+
+BASKET_CACHE_ALIAS = 'baskets'
+GUEST_BASKET_HEADER = 'X-Guest-Basket'
+
+# Время жизни замка корзины в кеше, с: освобождает замок упавшего процесса
+BASKET_LOCK_TIMEOUT = 10
+
+# Ожидание замка корзины, с, и пауза между попытками
+BASKET_LOCK_WAIT = 3
+BASKET_LOCK_POLL = 0.05
+
+
+class BasketError(Exception):
+    """Ошибка операции с корзиной: текст и тело ответа в формате API"""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST, index=None, **extra):
+        super().__init__(message)
+        self.status_code = status_code
+        self.index = index
+        self.data = {'error': message, **extra}
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _resolve(operation, position_products):
+    """(операция, id товара, количество) с проверкой формата"""
+    if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+        raise BasketError(f"Операция должна быть одной из: {', '.join(BATCH_OPERATIONS)}")
+
+    op = operation['op']
+
+    if op == 'add':
+        product_id = _to_int(operation.get('product_id'))
+        if product_id is None:
+            raise BasketError('Товар не найден', status.HTTP_404_NOT_FOUND)
+    elif 'position_id' in operation:
+        product_id = position_products.get(_to_int(operation['position_id']))
+        if product_id is None:
+            raise BasketError(
+                'Позиция не найдена в корзине' if op == 'set' else 'Позиция не найдена',
+                status.HTTP_404_NOT_FOUND
+            )
+    else:
+        product_id = _to_int(operation.get('product_id'))
+
+    quantity = None
+    if op == 'add':
+        quantity = _to_int(operation.get('quantity', 1))
+        if quantity is None or quantity < 1:
+            raise BasketError('Количество должно быть не менее 1')
+    elif op == 'set':
+        quantity = _to_int(operation.get('quantity'))
+        if quantity is None:
+            raise BasketError('Некорректное количество')
+
+    return op, product_id, quantity
+
+
+def plan_operations(positions, operations, strict=True, basket=None, lock=False):
+    """
+    Итоговое содержимое корзины после операций.
+    positions - {id товара: (id позиции, количество)}.
+    Возвращает (итоговые количества, приращения, товары с заданным количеством).
+    strict=False используется при слиянии корзин: добавления недоступных
+    товаров пропускаются, а превышение остатка урезается до него.
+    Остаток уменьшается на активные резервы других корзин (для гостевой
+    корзины, basket=None, - на все резервы). lock=True блокирует строки
+    товаров до чтения резервов: так делает корзина, которая резервирует.
+    """
+    position_products = {position_id: product_id for product_id, (position_id, _) in positions.items()}
+
+    resolved = []
+    for index, operation in enumerate(operations):
+        try:
+            resolved.append(_resolve(operation, position_products))
+        except BasketError as e:
+            e.index = index
+            raise
+
+    # Остатки и резервы всех затронутых товаров - по одному запросу;
+    # резервы читаются после блокировки товаров
+    product_ids = {product_id for _, product_id, _ in resolved if product_id is not None}
+    rows = Product.objects.filter(product_id__in=product_ids)
+    if lock:
+        rows = rows.select_for_update().order_by('product_id')
+    rows = list(rows.values_list('product_id', 'product_quantity_in_stock', 'product_is_active'))
+    held = held_stock(product_ids, exclude_basket=basket)
+    products = {
+        product_id: (max(stock - held.get(product_id, 0), 0), is_active)
+        for product_id, stock, is_active in rows
+    }
+
+    final = {product_id: quantity for product_id, (_, quantity) in positions.items()}
+    increments = {}
+    absolute = set()
+
+    for index, (op, product_id, quantity) in enumerate(resolved):
+        current = final.get(product_id, 0)
+        stock, is_active = products.get(product_id, (0, False))
+
+        if op == 'add':
+            if product_id not in products or not is_active:
+                if not strict:
+                    continue
+                raise BasketError('Товар не найден', status.HTTP_404_NOT_FOUND, index)
+            if current + quantity > stock:
+                if not strict:
+                    quantity = stock - current
+                    if quantity <= 0:
+                        continue
+                elif current:
+                    raise BasketError('Превышено доступное количество', index=index,
+                                      available=stock, in_basket=current, product_id=product_id)
+                else:
+                    raise BasketError('Недостаточно товара на складе', index=index,
+                                      available=stock, product_id=product_id)
+            final[product_id] = current + quantity
+            increments[product_id] = increments.get(product_id, 0) + quantity
+            continue
+
+        if not current:
+            raise BasketError(
+                'Позиция не найдена в корзине' if op == 'set' else 'Позиция не найдена',
+                status.HTTP_404_NOT_FOUND, index
+            )
+
+        if op == 'set' and quantity >= 1:
+            if quantity > stock:
+                raise BasketError('Недостаточно товара на складе', index=index,
+                                  available=stock, product_id=product_id)
+            final[product_id] = quantity
+        else:
+            final[product_id] = 0
+        absolute.add(product_id)
+
+    return final, increments, absolute
+
+
+def apply_basket_operations(basket, operations, strict=True):
+    """Применяет список операций к корзине в базе атомарно"""
+    with transaction.atomic():
+        # Блокировка корзины упорядочивает конкурентные изменения
+        list(Basket.objects.select_for_update().filter(pk=basket.pk).values_list('pk'))
+
+        positions = {
+            product_id: (position_id, quantity)
+            for position_id, product_id, quantity in BasketPosition.objects.filter(
+                basket=basket).values_list('basket_position_id', 'product_id', 'product_quantity')
+        }
+        final, increments, absolute = plan_operations(positions, operations, strict, basket, lock=True)
+
+        to_create = [
+            BasketPosition(basket_id=basket.pk, product_id=product_id, product_quantity=quantity)
+            for product_id, quantity in final.items()
+            if product_id not in positions and quantity > 0
+        ]
+        to_delete = [
+            positions[product_id][0]
+            for product_id, quantity in final.items()
+            if product_id in positions and quantity <= 0
+        ]
+        to_update = [
+            product_id for product_id, (_, quantity) in positions.items()
+            if 0 < final[product_id] != quantity
+        ]
+
+        if to_update:
+            # Только добавления применяются приращением к текущему значению
+            BasketPosition.objects.filter(
+                pk__in=[positions[product_id][0] for product_id in to_update]
+            ).update(product_quantity=Case(
+                *[
+                    When(
+                        pk=positions[product_id][0],
+                        then=(
+                            Value(final[product_id]) if product_id in absolute
+                            else F('product_quantity') + increments[product_id]
+                        )
+                    )
+                    for product_id in to_update
+                ],
+                output_field=models.IntegerField()
+            ))
+        if to_delete:
+            BasketPosition.objects.filter(pk__in=to_delete).delete()
+        if to_create:
+            BasketPosition.objects.bulk_create(to_create)
+
+        if to_create or to_delete or to_update:
+            reserve(basket, final)
+            basket.touch()
+
+
+def get_basket_for_read(**filters):
+    """
+    Корзина с итогами, посчитанными в базе, и позициями с товарами:
+    один запрос корзины и один prefetch позиций
+    """
+    return optimize_queryset(
+        Basket.objects.with_totals(), BasketSerializer, restrict_fields=False
+    ).filter(**filters).first()
+
+
+class DatabaseBasketStorage:
+    """Корзина пользователя в базе"""
+
+    def __init__(self, user=None, token=None):
+        if user is None:
+            raise ImproperlyConfigured('DatabaseBasketStorage не поддерживает гостевые корзины')
+        self.user = user
+        self.token = None
+        self.key = f'user:{user.pk}'
+
+    def get_basket(self):
+        basket, created = Basket.objects.get_or_create(user=self.user)
+        return basket
+
+    def load(self):
+        """Объект для BasketSerializer с полем date_of_update"""
+        basket = get_basket_for_read(user=self.user)
+        if basket is None:
+            self.get_basket()
+            basket = get_basket_for_read(user=self.user)
+        return basket
+
+    def apply(self, operations):
+        apply_basket_operations(self.get_basket(), operations)
+
+    def clear(self):
+        basket = self.get_basket()
+        basket.positions.all().delete()
+        release(basket)
+        basket.touch()
+
+    def flush(self, user):
+        """Содержимое уже в базе"""
+
+
+class CacheBasketStorage:
+    """
+    Корзина в кеше: {'items': {id товара: количество}, 'updated': unix time}.
+    Позиции адресуются id товара, он же служит basket_position_id в ответе.
+    """
+
+    def __init__(self, user=None, token=None):
+        self.user = user
+        self.token = token
+        self.cache = caches[BASKET_CACHE_ALIAS]
+
+    @property
+    def key(self):
+        if self.user is not None:
+            return f'user:{self.user.pk}'
+        return f'guest:{self.token}' if self.token else None
+
+    def read_state(self):
+        state = self.cache.get(self.key) if self.key else None
+        if state is None:
+            return {'items': {}, 'updated': None}
+        return {'items': {int(product_id): quantity for product_id, quantity in state['items'].items()},
+                'updated': state['updated']}
+
+    def write_state(self, items):
+        if self.key is None:
+            # Токен выдаётся при первом изменении гостевой корзины
+            self.token = secrets.token_urlsafe(24)
+        self.cache.set(self.key, {'items': items, 'updated': timezone.now().timestamp()})
+
+    @contextmanager
+    def lock(self):
+        """Замок корзины на время чтения-изменения-записи"""
+        if self.key is None:
+            # Новая гостевая корзина получит свой токен, конкурировать не с кем
+            yield
+            return
+
+        lock_key = f'lock:{self.key}'
+        owner = secrets.token_hex(8)
+        deadline = time.monotonic() + BASKET_LOCK_WAIT
+        while not self.cache.add(lock_key, owner, timeout=BASKET_LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                raise BasketError('Корзина изменяется другим запросом, повторите попытку',
+                                  status.HTTP_409_CONFLICT)
+            time.sleep(BASKET_LOCK_POLL)
+        try:
+            yield
+        finally:
+            # Замок, истёкший по таймауту, мог перейти другому запросу
+            if self.cache.get(lock_key) == owner:
+                self.cache.delete(lock_key)
+
+    def load(self):
+        state = self.read_state()
+        products = Product.objects.only(*ProductBriefSerializer.Meta.fields).in_bulk(list(state['items']))
+
+        positions = [
+            BasketPosition(basket_position_id=product_id, product=products[product_id],
+                           product_quantity=quantity)
+            for product_id, quantity in state['items'].items()
+            if product_id in products
+        ]
+        updated = state['updated']
+
+        return SimpleNamespace(
+            basket_id=None,
+            positions=positions,
+            total_price=sum(position.product_price * position.product_quantity for position in positions),
+            total_items=sum(position.product_quantity for position in positions),
+            date_of_update=(
+                datetime.fromtimestamp(updated, tz=dt_timezone.utc) if updated
+                else datetime.fromtimestamp(0, tz=dt_timezone.utc)
+            ),
+        )
+
+    def apply(self, operations):
+        with self.lock():
+            items = self.read_state()['items']
+            positions = {product_id: (product_id, quantity) for product_id, quantity in items.items()}
+            final, _, _ = plan_operations(positions, operations)
+            self.write_state({product_id: quantity for product_id, quantity in final.items() if quantity > 0})
+
+    def clear(self):
+        if self.key:
+            with self.lock():
+                self.write_state({})
+
+    def flush(self, user):
+        """Перенос содержимого в корзину пользователя в базе (с урезанием по остаткам)"""
+        items = self.read_state()['items']
+        if items:
+            basket, created = Basket.objects.get_or_create(user=user)
+            apply_basket_operations(
+                basket,
+                [{'op': 'add', 'product_id': product_id, 'quantity': quantity}
+                 for product_id, quantity in items.items()],
+                strict=False
+            )
+        if self.key:
+            # При откате транзакции (например, ошибке оформления) корзина остаётся в кеше
+            key = self.key
+            transaction.on_commit(lambda: self.cache.delete(key))
+
+
+def get_guest_token(request):
+    token = request.headers.get(GUEST_BASKET_HEADER, '')
+    # Токены выдаются secrets.token_urlsafe(24): 32 символа
+    if 16 <= len(token) <= 64 and token.replace('-', '').replace('_', '').isalnum():
+        return token
+    return None
+
+
+def get_basket_storage(request):
+    """Хранилище корзины для текущего пользователя или гостя"""
+    if request.user.is_authenticated:
+        return import_string(settings.BASKET_STORAGE)(user=request.user)
+    return import_string(settings.BASKET_GUEST_STORAGE)(token=get_guest_token(request))
+
+
+def merge_guest_basket(request, user):
+    """
+    Слияние гостевой корзины (заголовок X-Guest-Basket) и отложенной
+    корзины пользователя с корзиной в базе. Вызывается при входе и
+    перед оформлением заказа.
+    """
+    token = get_guest_token(request)
+    if token:
+        import_string(settings.BASKET_GUEST_STORAGE)(token=token).flush(user)
+    import_string(settings.BASKET_STORAGE)(user=user).flush(user)
@@ -0,0 +1,95 @@
+"""
+Массовое обновление цен и остатков товаров.
+
+Строки проверяются по правилам ProductSerializer, а затем применяются
+пакетными UPDATE ... CASE (bulk_update) в одной транзакции, без загрузки
+товаров и вызова save() для каждой строки.
+"""
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .caching import bump_catalog_version
+from .models import Product
+from .serializers import ProductBulkUpdateSerializer
+from .stock import sync_hot_stock
+
+# Максимальное количество строк в одном запросе
+MAX_BULK_UPDATE_ITEMS = 100000
+
+# Размер пачки для IN (...) и CASE в UPDATE
+BULK_BATCH_SIZE = 1000
+
+BULK_UPDATE_FIELDS = ['product_price', 'product_quantity_in_stock', 'product_is_active']
+
+
+def existing_product_ids(product_ids):
+    """Какие из товаров существуют (запросы пачками)"""
+    product_ids = list(product_ids)
+    existing = set()
+    for start in range(0, len(product_ids), BULK_BATCH_SIZE):
+        existing.update(
+            Product.objects.filter(
+                product_id__in=product_ids[start:start + BULK_BATCH_SIZE]
+            ).values_list('product_id', flat=True)
+        )
+    return existing
+
+
+def bulk_update_products(items):
+    """
+    Применяет список изменений {product_id, product_price?,
+    product_quantity_in_stock?, product_is_active?}.
+    Возвращает результат по каждой строке в исходном порядке.
+    """
+    results = []
+    valid = {}
+
+    # Один экземпляр сериализатора на все строки, как в ListSerializer:
+    # поля и валидаторы строятся один раз
+    serializer = ProductBulkUpdateSerializer()
+
+    for index, item in enumerate(items):
+        try:
+            data = serializer.run_validation(item)
+        except ValidationError as e:
+            results.append({
+                'product_id': item.get('product_id') if isinstance(item, dict) else None,
+                'status': 'invalid',
+                'errors': e.detail
+            })
+            continue
+
+        product_id = data['product_id']
+        # При повторе товара применяется последняя строка
+        if product_id in valid:
+            results[valid[product_id][0]]['status'] = 'duplicate'
+        valid[product_id] = (index, data)
+        results.append({'product_id': product_id, 'status': 'updated'})
+
+    existing = existing_product_ids(valid)
+
+    # Группы товаров с одинаковым набором обновляемых полей
+    groups = {}
+    for product_id, (index, data) in valid.items():
+        if product_id not in existing:
+            results[index]['status'] = 'not_found'
+            continue
+
+        fields = tuple(field for field in BULK_UPDATE_FIELDS if field in data)
+        groups.setdefault(fields, []).append(
+            Product(product_id=product_id, **{field: data[field] for field in fields})
+        )
+
+    with transaction.atomic():
+        for fields, products in groups.items():
+            Product.objects.bulk_update(products, fields, batch_size=BULK_BATCH_SIZE)
+            if 'product_quantity_in_stock' in fields:
+                sync_hot_stock([product.product_id for product in products])
+        if groups:
+            transaction.on_commit(bump_catalog_version)
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+
+    return {'summary': summary, 'results': results}
@@ -0,0 +1,162 @@
+"""
+Кеширование ответов каталога.
+
+Все ключи содержат номер версии каталога. Любая запись в Product или
+Category увеличивает версию (см. signals.py), после чего старые записи
+больше не читаются и вытесняются бэкендом по LRU/TTL. Версия хранится в том
+же бэкенде, что и ответы, поэтому при общем кеше (file, redis) все воркеры
+видят одно и то же состояние.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .conditional import PUBLIC_CACHE_CONTROL, conditional_response, make_etag
+
+CATALOG_CACHE_ALIAS = 'catalog'
+
+VERSION_KEY = 'version'
+MODIFIED_KEY = 'modified'
+HITS_KEY = 'stats:hits'
+MISSES_KEY = 'stats:misses'
+
+
+def get_catalog_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def _initial_version():
+    # Начальное значение уникально во времени: если ключ версии вытеснят,
+    # новая версия не совпадёт ни с одной из ранее выданных
+    return time.time_ns() // 1000
+
+
+def get_catalog_version():
+    """Текущая версия каталога"""
+    cache = get_catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_catalog_last_modified():
+    """Время последнего изменения каталога (unix time)"""
+    cache = get_catalog_cache()
+    modified = cache.get(MODIFIED_KEY)
+    if modified is None:
+        cache.add(MODIFIED_KEY, time.time(), timeout=None)
+        modified = cache.get(MODIFIED_KEY)
+    return modified
+
+
+def bump_catalog_version():
+    """Инвалидирует все закешированные ответы каталога"""
+    cache = get_catalog_cache()
+    cache.set(MODIFIED_KEY, time.time(), timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        version = _initial_version()
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def _increment(key):
+    cache = get_catalog_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cache_stats():
+    """Счётчики попаданий и промахов кеша"""
+    cache = get_catalog_cache()
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'version': get_catalog_version(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_cache_stats():
+    get_catalog_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def normalize_params(params):
+    """Параметры запроса без пустых значений в стабильном порядке"""
+    return sorted(
+        (key, sorted(value for value in params.getlist(key) if value != ''))
+        for key in params.keys()
+        if any(value != '' for value in params.getlist(key))
+    )
+
+
+def catalog_cache_key(prefix, *parts):
+    """Ключ с текущей версией каталога"""
+    digest = hashlib.sha1(
+        json.dumps(parts, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f'{prefix}:{get_catalog_version()}:{digest}'
+
+
+class CatalogCacheMixin:
+    """
+    Кеширование ответов list/retrieve для вьюсетов каталога.
+    Ключ учитывает действие, параметры URL и нормализованные параметры запроса.
+    Ключ же служит ETag, так что клиент с актуальной копией получает 304
+    без обращения к кешу и базе.
+    """
+    cached_actions = ('list', 'retrieve')
+
+    def get_response_cache_key(self, request):
+        return catalog_cache_key(
+            f'response:{self.basename}:{self.action}',
+            # Хост участвует в ключе, так как ссылки пагинации абсолютные
+            request.get_host(),
+            self.kwargs,
+            normalize_params(request.query_params),
+        )
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if self.action not in self.cached_actions:
+            return handler(request, *args, **kwargs)
+
+        cache = get_catalog_cache()
+        key = self.get_response_cache_key(request)
+
+        def build_response():
+            data = cache.get(key)
+            if data is not None:
+                _increment(HITS_KEY)
+                return Response(data)
+
+            _increment(MISSES_KEY)
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data)
+            return response
+
+        return conditional_response(
+            request,
+            build_response,
+            etag=make_etag(key),
+            last_modified=get_catalog_last_modified(),
+            cache_control=PUBLIC_CACHE_CONTROL,
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
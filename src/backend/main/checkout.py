@@ -0,0 +1,306 @@
+"""
+Оформление заказа из корзины.
+
+Синхронное оформление (checkout) создаёт заказ постоянным числом запросов
+независимо от количества позиций:
+    1. блокировка корзины и чтение её позиций;
+    2. блокировка товаров SELECT ... FOR UPDATE в порядке первичного ключа -
+       конкурентные оформления захватывают строки в одном порядке и не
+       взаимоблокируются;
+    3. списание остатков одним UPDATE ... CASE с условием остаток >= количество
+       (stock.decrement_stock); число изменённых строк должно совпасть
+       с числом товаров;
+    4. bulk_create позиций заказа и удаление позиций корзины одним DELETE.
+
+Товары, полностью покрытые активным резервом корзины (reservations.py),
+на шаге 2 не блокируются и не сверяются с остатками: резерв уже учёл их,
+и при списании остаётся только условный UPDATE. Остальные товары
+сверяются с остатком за вычетом чужих резервов. Резервы корзины
+удаляются вместе с её позициями.
+
+Асинхронное оформление (settings.CHECKOUT_MODE = 'async' или заголовок
+Prefer: respond-async) сохраняет снимок корзины в очередь CheckoutJob и сразу
+отвечает номером заявки. Воркер process_checkouts забирает заявки пачками
+(SELECT ... FOR UPDATE SKIP LOCKED) и обрабатывает пачку одной транзакцией:
+спрос по каждому товару суммируется, остатки блокируются и списываются
+одним UPDATE на всю пачку. Резервы снимаются при постановке в очередь,
+и воркер распределяет остаток за вычетом активных резервов корзин.
+
+Остатки горячих товаров списываются из шардов без блокировки строки
+товара (см. stock.py). При падении воркера транзакция откатывается,
+и заявки остаются в очереди.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+
+from .basket import apply_basket_operations
+from .caching import bump_catalog_version
+from .events import record_order_created
+from .models import Basket, BasketPosition, CheckoutJob, Order, OrderPosition, Product
+from .reservations import basket_reservations, held_stock, release
+from .rollups import record_created
+from .stock import available_stock, decrement_stock, shard_totals
+
+# Заявок в одной транзакции воркера
+CHECKOUT_BATCH_SIZE = 100
+
+
+class CheckoutError(Exception):
+    """Ошибка оформления: текст и тело ответа в формате API"""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST, **extra):
+        super().__init__(message)
+        self.status_code = status_code
+        self.data = {'error': message, **extra}
+
+
+def is_async_checkout(request):
+    """Асинхронный режим: глобально из настроек или по заголовку Prefer (RFC 7240)"""
+    if getattr(settings, 'CHECKOUT_MODE', 'sync') == 'async':
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def lock_products(product_ids, lock_ids=None):
+    """
+    ({id товара: (название, цена, остаток)}, горячие товары).
+    Строки обычных товаров из lock_ids (по умолчанию - всех) блокируются
+    в порядке первичного ключа. Строки горячих не блокируются: их остаток -
+    сумма шардов, и списание с шардов само проверяет остаток (см. stock.py).
+    """
+    lock_ids = set(product_ids if lock_ids is None else lock_ids)
+    rows = list(
+        Product.objects.filter(product_id__in=product_ids)
+        .values_list('product_id', 'product_title', 'product_price',
+                     'product_quantity_in_stock', 'product_is_hot')
+    )
+    hot_ids = {product_id for product_id, _, _, _, is_hot in rows if is_hot}
+
+    stock = {product_id: stock for product_id, _, _, stock, _ in rows}
+    stock.update(
+        Product.objects.select_for_update()
+        .filter(product_id__in=[
+            product_id for product_id, _, _, _, is_hot in rows
+            if not is_hot and product_id in lock_ids
+        ])
+        .order_by('product_id')
+        .values_list('product_id', 'product_quantity_in_stock')
+    )
+    if hot_ids:
+        stock.update(shard_totals(hot_ids))
+
+    products = {
+        product_id: (title, price, stock.get(product_id, 0))
+        for product_id, title, price, _, _ in rows
+    }
+    return products, hot_ids
+
+
+def take_basket(user):
+    """Блокирует корзину и забирает её позиции: (корзина, {id товара: количество})"""
+    basket = Basket.objects.select_for_update().filter(user=user).first()
+    if basket is None:
+        raise CheckoutError('Корзина не найдена')
+
+    quantities = dict(
+        BasketPosition.objects.filter(basket=basket).values_list('product_id', 'product_quantity')
+    )
+    if not quantities:
+        raise CheckoutError('Корзина пуста')
+
+    return basket, quantities
+
+
+def clear_basket(basket):
+    BasketPosition.objects.filter(basket=basket).delete()
+    release(basket)
+    basket.touch()
+
+
+def create_order(user, quantities, products, delivery_address, payment_method, user_comment=''):
+    """Заказ с позициями по ценам из products; остатки уже списаны"""
+    order = Order.objects.create(
+        user=user,
+        delivery_address=delivery_address,
+        payment_method=payment_method,
+        user_comment=user_comment,
+        price=sum(products[product_id][1] * quantity for product_id, quantity in quantities.items())
+    )
+    return order, [
+        OrderPosition(
+            order=order,
+            product_id=product_id,
+            product_quantity=quantity,
+            product_price_in_moment=products[product_id][1]
+        )
+        for product_id, quantity in sorted(quantities.items())
+    ]
+
+
+def find_shortage(quantities, products):
+    """Первый товар, которого не хватает: тело ошибки или None"""
+    for product_id, quantity in sorted(quantities.items()):
+        if product_id not in products:
+            return {'error': 'Товар больше не продаётся', 'product_id': product_id}
+        title, price, stock = products[product_id]
+        if quantity > stock:
+            return {'error': f'Недостаточно товара "{title}"', 'available': stock}
+    return None
+
+
+def checkout(user, delivery_address, payment_method, user_comment=''):
+    """Создаёт заказ из корзины пользователя и очищает корзину"""
+    with transaction.atomic():
+        basket, quantities = take_basket(user)
+
+        # Товары без полного активного резерва сверяются с остатком за
+        # вычетом чужих резервов; покрытые резервом - только при списании
+        reserved = basket_reservations(basket)
+        unreserved = {
+            product_id: quantity for product_id, quantity in quantities.items()
+            if reserved.get(product_id, 0) < quantity
+        }
+        products, hot_ids = lock_products(quantities, lock_ids=unreserved)
+
+        held = held_stock(unreserved, exclude_basket=basket) if unreserved else {}
+        shortage = find_shortage(unreserved, {
+            product_id: (title, price, stock - held.get(product_id, 0))
+            for product_id, (title, price, stock) in products.items()
+        })
+        if shortage:
+            raise CheckoutError(shortage.pop('error'), **shortage)
+
+        if not decrement_stock(quantities, hot_ids):
+            # Остаток горячего товара успели списать конкурентные оформления
+            # (строки обычных товаров заблокированы); транзакция откатывается
+            stock = available_stock(quantities)
+            shortage = find_shortage(quantities, {
+                product_id: (title, price, stock.get(product_id, 0))
+                for product_id, (title, price, _) in products.items()
+            }) or {'error': 'Остатки товаров изменились, повторите оформление'}
+            raise CheckoutError(shortage.pop('error'), **shortage)
+
+        order, positions = create_order(
+            user, quantities, products, delivery_address, payment_method, user_comment
+        )
+        OrderPosition.objects.bulk_create(positions)
+        record_created([order])
+        record_order_created([order])
+
+        clear_basket(basket)
+
+        # Остатки изменены UPDATE без сигналов: кеш каталога сбрасываем явно
+        transaction.on_commit(bump_catalog_version)
+
+    return order
+
+
+def enqueue_checkout(user, delivery_address, payment_method, user_comment=''):
+    """Снимок корзины в очередь оформления; корзина очищается сразу"""
+    with transaction.atomic():
+        basket, quantities = take_basket(user)
+        job = CheckoutJob.objects.create(
+            user=user,
+            payload={
+                'items': {str(product_id): quantity for product_id, quantity in quantities.items()},
+                'delivery_address': delivery_address,
+                'payment_method': payment_method,
+                'user_comment': user_comment,
+            }
+        )
+        clear_basket(basket)
+    return job
+
+
+def process_checkout_batch(batch_size=CHECKOUT_BATCH_SIZE):
+    """
+    Обрабатывает до batch_size заявок из очереди в порядке поступления.
+    Возвращает количество обработанных заявок (0 - очередь пуста).
+    """
+    with transaction.atomic():
+        jobs = list(
+            CheckoutJob.objects.select_for_update(skip_locked=True)
+            .select_related('user')
+            .filter(status=CheckoutJob.STATUS_PENDING)
+            .order_by('checkout_id')[:batch_size]
+        )
+        if not jobs:
+            return 0
+
+        demands = [
+            {int(product_id): quantity for product_id, quantity in job.payload['items'].items()}
+            for job in jobs
+        ]
+        # Корзины блокируются раньше товаров, как при изменении корзины:
+        # возврат отклонённых позиций не захватывает их в обратном порядке
+        list(
+            Basket.objects.select_for_update()
+            .filter(user_id__in={job.user_id for job in jobs})
+            .order_by('basket_id').values_list('pk')
+        )
+        products, hot_ids = lock_products({product_id for demand in demands for product_id in demand})
+
+        # Распределение остатков за вычетом резервов корзин в порядке очереди
+        held = held_stock(products)
+        available = {
+            product_id: stock - held.get(product_id, 0)
+            for product_id, (_, _, stock) in products.items()
+        }
+        totals = {}
+        accepted = []
+        now = timezone.now()
+
+        for job, demand in zip(jobs, demands):
+            shortage = find_shortage(demand, {
+                product_id: (title, price, available[product_id])
+                for product_id, (title, price, _) in products.items()
+            })
+            job.date_of_update = now
+            if shortage:
+                job.status = CheckoutJob.STATUS_FAILED
+                job.error = shortage
+                continue
+
+            for product_id, quantity in demand.items():
+                available[product_id] -= quantity
+                totals[product_id] = totals.get(product_id, 0) + quantity
+            accepted.append((job, demand))
+
+        # Один UPDATE на все обычные товары пачки; при гонке за шарды горячего
+        # товара пачка откатывается и обрабатывается повторно
+        if not decrement_stock(totals, hot_ids):
+            raise CheckoutError('Остатки товаров изменились, повторите обработку')
+
+        orders = []
+        positions = []
+        for job, demand in accepted:
+            payload = job.payload
+            order, order_positions = create_order(
+                job.user, demand, products, payload['delivery_address'],
+                payload['payment_method'], payload.get('user_comment', '')
+            )
+            orders.append(order)
+            positions.extend(order_positions)
+            job.order = order
+            job.status = CheckoutJob.STATUS_COMPLETED
+        OrderPosition.objects.bulk_create(positions)
+        record_created(orders)
+        record_order_created(orders)
+
+        CheckoutJob.objects.bulk_update(jobs, ['status', 'order', 'error', 'date_of_update'])
+
+        # Отклонённые позиции возвращаются в корзину (с урезанием по остаткам)
+        for job, demand in zip(jobs, demands):
+            if job.status == CheckoutJob.STATUS_FAILED:
+                basket, created = Basket.objects.get_or_create(user=job.user)
+                apply_basket_operations(basket, [
+                    {'op': 'add', 'product_id': product_id, 'quantity': quantity}
+                    for product_id, quantity in demand.items()
+                ], strict=False)
+
+        if totals:
+            transaction.on_commit(bump_catalog_version)
+
+    return len(jobs)
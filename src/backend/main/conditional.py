@@ -0,0 +1,58 @@
+"""
+Условные GET-запросы (ETag / Last-Modified / 304 Not Modified).
+
+Валидаторы считаются до сериализации ответа - по версии каталога или
+по времени последнего изменения - поэтому неизменившийся ресурс
+отдаётся ответом 304 без построения тела.
+"""
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+# Публичные данные каталога: браузер может показать закешированную копию,
+# пока в фоне перепроверяет её
+PUBLIC_CACHE_CONTROL = {'public': True, 'max_age': 0, 'stale_while_revalidate': 60}
+
+# Данные пользователя: кешировать только в браузере и всегда перепроверять
+PRIVATE_CACHE_CONTROL = {'private': True, 'no_cache': True}
+
+
+def make_etag(*parts):
+    """Сильный ETag из произвольных сериализуемых в JSON значений"""
+    digest = hashlib.sha1(
+        json.dumps(parts, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return quote_etag(digest)
+
+
+def to_timestamp(value):
+    """datetime или число -> целые секунды для Last-Modified"""
+    if value is None:
+        return None
+    if hasattr(value, 'timestamp'):
+        value = value.timestamp()
+    return int(value)
+
+
+def conditional_response(request, build_response, etag=None, last_modified=None,
+                         cache_control=PRIVATE_CACHE_CONTROL):
+    """
+    Возвращает 304, если клиентская копия актуальна, иначе вызывает
+    build_response() и добавляет к ответу валидаторы.
+    """
+    last_modified = to_timestamp(last_modified)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_response()
+        if response.status_code != 200:
+            return response
+
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, **cache_control)
+    return response
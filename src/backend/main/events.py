@@ -0,0 +1,233 @@
+"""
+Журнал событий заказов и поток Server-Sent Events для панели администратора.
+
+Создание заказа и смена статуса добавляют строки в order_event в той же
+транзакции, что и само изменение: событие видно тогда и только тогда,
+когда зафиксирован заказ. Панель получает события потоком
+GET /admin/orders/events/ вместо периодического перечитывания списка.
+
+Курсор потока - наибольший отданный event_id. Список заказов возвращает
+курсор на момент чтения (last_event_id), панель подписывается с него;
+браузер переподключается с заголовком Last-Event-ID.
+
+Значения автоинкремента выдаются при вставке, а фиксируются транзакции
+в другом порядке: событие с меньшим id может появиться позже большего.
+Поэтому пропуски в нумерации не останавливают поток: пропущенные id
+перепроверяются каждым опросом в течение settings.ORDER_EVENTS_GAP_WINDOW
+и отдаются, когда их транзакция зафиксируется. При подписке с курсора
+пропуски до него восстанавливаются по событиям за то же окно. Пропуск
+старше окна считается откаченной транзакцией.
+
+EventSource в браузере не передаёт заголовки, поэтому поток открывается
+по короткоживущему токену (?token=), выданному только для него: токен
+доступа JWT в адресе попал бы в журналы веб-сервера и прокси.
+
+Поток работает под ASGI (backend/asgi.py): база опрашивается раз
+в settings.ORDER_EVENTS_POLL_INTERVAL, не удерживая поток сервера.
+Старые события удаляются командой purge_order_events.
+"""
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import OrderEvent
+
+# Событий, читаемых одним запросом
+EVENTS_BATCH_SIZE = 100
+
+# Пропущенных id, перепроверяемых одновременно
+MAX_PENDING_GAPS = 1000
+
+STREAM_TOKEN_SALT = 'main.events.stream'
+
+# Комментарий-пинг при отсутствии событий, с: держит соединение через прокси
+HEARTBEAT_INTERVAL = 15
+
+# Пауза перед переподключением клиента, мс
+RETRY_INTERVAL = 3000
+
+# Событий, удаляемых одним DELETE
+PURGE_CHUNK_SIZE = 1000
+
+
+def get_poll_interval():
+    return getattr(settings, 'ORDER_EVENTS_POLL_INTERVAL', 1.0)
+
+
+def get_stream_timeout():
+    return getattr(settings, 'ORDER_EVENTS_STREAM_TIMEOUT', 300)
+
+
+def get_gap_window():
+    return timedelta(seconds=getattr(settings, 'ORDER_EVENTS_GAP_WINDOW', 300))
+
+
+def get_stream_token_ttl():
+    return getattr(settings, 'ORDER_EVENTS_TOKEN_TTL', 60)
+
+
+def make_stream_token(user):
+    """Подписанный токен только для открытия потока событий"""
+    return signing.TimestampSigner(salt=STREAM_TOKEN_SALT).sign(str(user.pk))
+
+
+def stream_token_user_id(token):
+    """id пользователя из действующего токена потока или None"""
+    try:
+        value = signing.TimestampSigner(salt=STREAM_TOKEN_SALT).unsign(token, max_age=get_stream_token_ttl())
+    except signing.BadSignature:
+        return None
+    return int(value)
+
+
+def get_events_ttl():
+    return timedelta(seconds=getattr(settings, 'ORDER_EVENTS_TTL', 7 * 24 * 3600))
+
+
+def record_order_created(orders):
+    """События создания заказов (объекты Order)"""
+    OrderEvent.objects.bulk_create([
+        OrderEvent(event_type=OrderEvent.EVENT_CREATED, order_id=order.order_id, user_id=order.user_id,
+                   order_status=order.order_status, price=order.price)
+        for order in orders
+    ])
+
+
+def record_status_changed(rows, new_status):
+    """События смены статуса: rows - (id заказа, прежний статус)"""
+    OrderEvent.objects.bulk_create([
+        OrderEvent(event_type=OrderEvent.EVENT_STATUS_CHANGED, order_id=order_id,
+                   order_status=new_status, previous_status=old_status)
+        for order_id, old_status in rows
+        if old_status != new_status
+    ])
+
+
+def last_event_id():
+    return OrderEvent.objects.order_by('-event_id').values_list('event_id', flat=True).first() or 0
+
+
+class EventReader:
+    """
+    Чтение журнала с курсора: новые события и события из пропусков
+    в нумерации, зафиксированные позже соседних
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        # {пропущенный id: момент, после которого он больше не ждётся}
+        self.pending = {}
+        self.restore_gaps()
+
+    def add_gaps(self, event_ids, expires_at):
+        for event_id in event_ids:
+            self.pending.setdefault(event_id, expires_at)
+        if len(self.pending) > MAX_PENDING_GAPS:
+            for event_id in sorted(self.pending)[:len(self.pending) - MAX_PENDING_GAPS]:
+                del self.pending[event_id]
+
+    def restore_gaps(self):
+        """Пропуски до курсора среди событий за окно ожидания"""
+        since = timezone.now() - get_gap_window()
+        recent = set(
+            OrderEvent.objects.filter(event_id__lte=self.cursor, date_of_create__gte=since)
+            .values_list('event_id', flat=True)
+        )
+        if not recent:
+            return
+        settled = (
+            OrderEvent.objects.filter(event_id__lte=self.cursor, date_of_create__lt=since)
+            .order_by('-event_id').values_list('event_id', flat=True).first()
+        )
+        start = settled + 1 if settled is not None else min(recent)
+        self.add_gaps(
+            (event_id for event_id in range(start, self.cursor + 1) if event_id not in recent),
+            timezone.now() + get_gap_window()
+        )
+
+    def read(self, limit=EVENTS_BATCH_SIZE):
+        """Следующие события по возрастанию id; курсор и пропуски обновляются"""
+        now = timezone.now()
+        self.pending = {event_id: expires_at for event_id, expires_at in self.pending.items() if expires_at > now}
+
+        condition = Q(event_id__gt=self.cursor)
+        if self.pending:
+            condition |= Q(event_id__in=list(self.pending))
+        events = list(OrderEvent.objects.filter(condition).order_by('event_id')[:limit])
+
+        new_ids = {event.event_id for event in events if event.event_id > self.cursor}
+        for event in events:
+            self.pending.pop(event.event_id, None)
+        if new_ids:
+            self.add_gaps(
+                (event_id for event_id in range(self.cursor + 1, max(new_ids)) if event_id not in new_ids),
+                now + get_gap_window()
+            )
+            self.cursor = max(new_ids)
+        return events
+
+
+def format_event(event, cursor):
+    data = {
+        'event_id': event.event_id,
+        'event_type': event.event_type,
+        'order_id': event.order_id,
+        'user_id': event.user_id,
+        'order_status': event.order_status,
+        'previous_status': event.previous_status or None,
+        'price': event.price,
+        'date_of_create': event.date_of_create,
+    }
+    # id сообщения - курсор, а не id события: события из пропусков приходят
+    # с меньшими id, а Last-Event-ID при переподключении не должен отступать
+    return f'id: {cursor}\nevent: order\ndata: {json.dumps(data, cls=JSONEncoder, ensure_ascii=False)}\n\n'
+
+
+async def stream_events(after):
+    """
+    Поток SSE с курсора after. Завершается через ORDER_EVENTS_STREAM_TIMEOUT:
+    клиент переподключается с Last-Event-ID, соединения не копятся.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + get_stream_timeout()
+    last_sent = loop.time()
+    reader = await sync_to_async(EventReader)(after)
+
+    yield f'retry: {RETRY_INTERVAL}\n\n'
+    while loop.time() < deadline:
+        events = await sync_to_async(reader.read)()
+        for event in events:
+            yield format_event(event, reader.cursor)
+
+        if events:
+            last_sent = loop.time()
+            if len(events) == EVENTS_BATCH_SIZE:
+                continue
+        elif loop.time() - last_sent >= HEARTBEAT_INTERVAL:
+            yield ': ping\n\n'
+            last_sent = loop.time()
+
+        await asyncio.sleep(get_poll_interval())
+
+
+def purge_expired(chunk_size=PURGE_CHUNK_SIZE):
+    """Удаляет события старше ORDER_EVENTS_TTL пачками; возвращает количество удалённых"""
+    before = timezone.now() - get_events_ttl()
+    deleted = 0
+    while True:
+        ids = list(
+            OrderEvent.objects.filter(date_of_create__lt=before)
+            .order_by('event_id').values_list('event_id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += OrderEvent.objects.filter(event_id__in=ids).delete()[0]
+        if len(ids) < chunk_size:
+            return deleted
@@ -0,0 +1,118 @@
+"""
+Потоковая выгрузка каталога и заказов в CSV / NDJSON.
+
+Кверисет читается пачками по первичному ключу (keyset), каждая пачка
+сериализуется и сразу отдаётся клиенту, поэтому память процесса не зависит
+от объёма выгрузки. Связанные данные подгружаются prefetch_related
+на уровне пачки, без запросов на каждую строку.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+EXPORT_CHUNK_SIZE = 2000
+
+PRODUCT_EXPORT_FIELDS = [
+    'product_id', 'product_supplier_sku', 'product_title', 'product_description',
+    'product_price', 'product_quantity_in_stock', 'product_image_url',
+    'category_id', 'product_brand_title', 'product_date_of_create', 'product_is_active',
+]
+
+ORDER_EXPORT_FIELDS = [
+    'order_id', 'date_of_create', 'order_status', 'user_id', 'user_mail',
+    'delivery_address', 'payment_method', 'price', 'user_comment',
+]
+
+ORDER_POSITION_EXPORT_FIELDS = [
+    'order_position_id', 'product_id', 'product_title',
+    'product_quantity', 'product_price_in_moment',
+]
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def iterate_in_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Обход кверисета пачками по возрастанию первичного ключа.
+    В отличие от OFFSET каждая пачка выбирается по индексу за одинаковое время,
+    а prefetch_related кверисета выполняется один раз на пачку.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def product_rows(queryset):
+    for chunk in iterate_in_chunks(queryset):
+        for product in chunk:
+            yield {field: getattr(product, field) for field in PRODUCT_EXPORT_FIELDS}
+
+
+def order_rows(queryset):
+    for chunk in iterate_in_chunks(queryset):
+        for order in chunk:
+            row = {field: getattr(order, field) for field in ORDER_EXPORT_FIELDS if field != 'user_mail'}
+            row['user_mail'] = order.user.user_mail if order.user else None
+            row['positions'] = [
+                {
+                    'order_position_id': position.order_position_id,
+                    'product_id': position.product_id,
+                    'product_title': position.product.product_title if position.product else None,
+                    'product_quantity': position.product_quantity,
+                    'product_price_in_moment': position.product_price_in_moment,
+                }
+                for position in order.positions.all()
+            ]
+            yield row
+
+
+def flatten_order_rows(rows):
+    """Для CSV: одна строка на позицию заказа"""
+    for row in rows:
+        positions = row.pop('positions') or [{}]
+        for position in positions:
+            yield {**row, **position}
+
+
+def csv_stream(rows, fields):
+    writer = csv.DictWriter(Echo(), fieldnames=fields, extrasaction='ignore')
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_stream(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def export_response(rows, fields, file_format, filename, flatten=None):
+    """StreamingHttpResponse с выгрузкой в нужном формате"""
+    if file_format == 'csv':
+        if flatten is not None:
+            rows = flatten(rows)
+        content = csv_stream(rows, fields)
+    else:
+        content = ndjson_stream(rows)
+
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
@@ -0,0 +1,146 @@
+"""
+Фасеты каталога: бренды, гистограмма цен, наличие и категории.
+
+Фасеты считаются дизъюнктивно: счётчики каждого фасета учитывают все
+активные фильтры, кроме собственного, чтобы в боковой панели были видны
+альтернативы уже выбранному значению. Скалярные фасеты (наличие, цены)
+считаются одним запросом через условную агрегацию, бренды и категории -
+группировкой с теми же условиями.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Max, Min, Q
+
+from .caching import catalog_cache_key
+
+# Границы корзин гистограммы цен по умолчанию
+DEFAULT_PRICE_EDGES = [0, 1000, 5000, 10000, 50000, 100000]
+
+# Ограничение длины списка брендов в ответе
+MAX_BRANDS = 50
+
+# Наибольшее число границ цен в ?price_buckets: каждая даёт агрегат в запросе
+MAX_PRICE_EDGES = 20
+
+# Параметры запроса, влияющие на результат фасетов
+FACET_PARAMS = [
+    'search', 'min_price', 'max_price', 'brand', 'availability',
+    'category', 'include_descendants', 'is_all'
+]
+
+
+def parse_price_edges(value):
+    """
+    Границы корзин цен из параметра ?price_buckets=0,1000,5000.
+    ValueError, если границ больше MAX_PRICE_EDGES
+    """
+    if not value:
+        return DEFAULT_PRICE_EDGES
+
+    parts = [edge.strip() for edge in value.split(',') if edge.strip()]
+    if len(parts) > MAX_PRICE_EDGES:
+        raise ValueError(f'Не более {MAX_PRICE_EDGES} границ цен')
+
+    try:
+        edges = sorted({Decimal(edge) for edge in parts})
+    except ArithmeticError:
+        return DEFAULT_PRICE_EDGES
+
+    edges = [edge for edge in edges if edge.is_finite()]
+    return edges or DEFAULT_PRICE_EDGES
+
+
+def facets_cache_key(params, price_edges):
+    """Ключ кеша по нормализованному набору фильтров и версии каталога"""
+    normalized = {}
+    for name in FACET_PARAMS:
+        value = (params.get(name) or '').strip()
+        if value:
+            normalized[name] = value.casefold() if name == 'search' else value
+    normalized['price_buckets'] = [str(edge) for edge in price_edges]
+
+    return catalog_cache_key('facets', normalized)
+
+
+def _excluding(conditions, name=None):
+    """Пересечение всех условий фильтров, кроме указанного"""
+    condition = Q()
+    for key, value in conditions.items():
+        if key != name:
+            condition &= value
+    return condition
+
+
+def compute_facets(queryset, conditions, availability_filters, price_edges):
+    """
+    Считает все фасеты для кверисета.
+    conditions - словарь {имя фильтра: Q} активных фильтров каталога.
+    """
+    queryset = queryset.order_by()
+
+    # Наличие и цены - один проход с условной агрегацией
+    without_availability = _excluding(conditions, 'availability')
+    without_price = _excluding(conditions, 'price')
+
+    aggregates = {
+        'total': Count('pk', filter=_excluding(conditions)),
+        'price_min': Min('product_price', filter=without_price),
+        'price_max': Max('product_price', filter=without_price),
+    }
+    for key, condition in availability_filters.items():
+        aggregates[f'availability_{key}'] = Count('pk', filter=without_availability & condition)
+
+    buckets = list(zip(price_edges, list(price_edges[1:]) + [None]))
+    for index, (lower, upper) in enumerate(buckets):
+        bucket = Q(product_price__gte=lower)
+        if upper is not None:
+            bucket &= Q(product_price__lt=upper)
+        aggregates[f'price_{index}'] = Count('pk', filter=without_price & bucket)
+
+    totals = queryset.aggregate(**aggregates)
+
+    # Бренды
+    brands = (
+        queryset.filter(_excluding(conditions, 'brand'))
+        .exclude(product_brand_title__isnull=True)
+        .exclude(product_brand_title='')
+        .values('product_brand_title')
+        .annotate(count=Count('pk'))
+        .order_by('-count', 'product_brand_title')[:MAX_BRANDS]
+    )
+
+    # Категории
+    categories = (
+        queryset.filter(_excluding(conditions, 'category'))
+        .filter(category__isnull=False)
+        .values('category_id', 'category__category_title')
+        .annotate(count=Count('pk'))
+        .order_by('-count', 'category_id')
+    )
+
+    return {
+        'total': totals['total'],
+        'brands': [
+            {'value': row['product_brand_title'], 'count': row['count']}
+            for row in brands
+        ],
+        'categories': [
+            {
+                'category_id': row['category_id'],
+                'category_title': row['category__category_title'],
+                'count': row['count']
+            }
+            for row in categories
+        ],
+        'availability': {
+            key: totals[f'availability_{key}'] for key in availability_filters
+        },
+        'price': {
+            'min': totals['price_min'],
+            'max': totals['price_max'],
+            'buckets': [
+                {'from': lower, 'to': upper, 'count': totals[f'price_{index}']}
+                for index, (lower, upper) in enumerate(buckets)
+            ]
+        }
+    }
@@ -0,0 +1,157 @@
+"""
+Идемпотентные запросы по заголовку Idempotency-Key.
+
+Клиент отправляет с изменяющим запросом уникальный ключ и повторяет
+запрос с тем же ключом при обрыве связи. Первый ответ сохраняется
+в таблице idempotency_key на settings.IDEMPOTENCY_KEY_TTL, повторы
+получают его без выполнения обработчика (заголовок Idempotent-Replayed).
+
+Строка ключа вставляется в точке сохранения в той же транзакции, что
+и работа обработчика, и фиксируется вместе с ней. Конкурентный дубль
+ждёт на уникальном индексе (scope, key), пока первый запрос не завершится:
+после фиксации он получает сохранённый ответ, после отката выполняется
+сам. Ответы 5xx и исключения не сохраняются - запрос можно повторить.
+
+Ключ принадлежит пользователю или гостевой корзине (X-Guest-Basket);
+гость без корзины ключом не пользуется.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .basket import GUEST_BASKET_HEADER, get_guest_token
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Заголовки ответа, которые сохраняются вместе с телом
+STORED_HEADERS = ('Location', 'Retry-After', GUEST_BASKET_HEADER)
+
+# Ключей, удаляемых одним DELETE
+PURGE_CHUNK_SIZE = 1000
+
+
+def get_key_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 3600))
+
+
+def get_scope(request):
+    """Владелец ключа или None, если ключ не к кому привязать"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    token = get_guest_token(request)
+    return f'guest:{token}' if token else None
+
+
+def request_fingerprint(request):
+    return hashlib.sha1(
+        json.dumps([request.method, request.path, request.data], sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def claim_key(scope, key, fingerprint):
+    """
+    (новая строка ключа, None) или (None, сохранённый ключ).
+    Вставка ждёт завершения конкурентной транзакции с тем же ключом.
+    """
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=fingerprint,
+                    expires_at=timezone.now() + get_key_ttl()
+                ), None
+        except IntegrityError:
+            # Блокирующее чтение видит последнюю зафиксированную версию строки
+            stored = IdempotencyKey.objects.select_for_update().filter(scope=scope, key=key).first()
+            if stored is None:
+                continue
+            if stored.expires_at <= timezone.now():
+                stored.delete()
+                continue
+            return None, stored
+    raise IntegrityError(f'Не удалось занять ключ идемпотентности {key}')
+
+
+def replay(stored):
+    response = Response(stored.response_body, status=stored.status_code)
+    for header, value in stored.response_headers.items():
+        response[header] = value
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """Декоратор метода ViewSet: ответ сохраняется и повторяется по Idempotency-Key"""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'Заголовок {IDEMPOTENCY_KEY_HEADER} должен быть от 1 до {MAX_KEY_LENGTH} символов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        scope = get_scope(request)
+        if scope is None:
+            return view_method(self, request, *args, **kwargs)
+
+        fingerprint = request_fingerprint(request)
+
+        with transaction.atomic():
+            record, stored = claim_key(scope, key, fingerprint)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    return Response(
+                        {'error': f'{IDEMPOTENCY_KEY_HEADER} уже использован для другого запроса'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                return replay(stored)
+
+            response = view_method(self, request, *args, **kwargs)
+
+            if response.status_code >= 500 or not hasattr(response, 'data'):
+                record.delete()
+                return response
+
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status_code=response.status_code,
+                # Тело в том виде, в каком его отдал JSONRenderer (Decimal -> число и т.п.)
+                response_body=json.loads(json.dumps(response.data, cls=JSONEncoder)),
+                response_headers={
+                    header: response[header] for header in STORED_HEADERS if response.has_header(header)
+                }
+            )
+
+        return response
+
+    return wrapper
+
+
+def purge_expired(chunk_size=PURGE_CHUNK_SIZE):
+    """Удаляет истёкшие ключи пачками по chunk_size; возвращает количество удалённых"""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now)
+            .order_by('expires_at').values_list('idempotency_key_id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(idempotency_key_id__in=ids).delete()[0]
+        if len(ids) < chunk_size:
+            return deleted
@@ -0,0 +1,94 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from main.basket import BasketError, CacheBasketStorage, DatabaseBasketStorage
+from main.models import CustomUser, Product
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение нагрузки на базу при изменениях корзины: хранение в базе '
+        'и в кеше с записью в базу при оформлении. Данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baskets', type=int, default=50, help='Количество корзин')
+        parser.add_argument('--edits', type=int, default=20, help='Изменений на корзину')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def make_operations(self, product_ids, edits, rng):
+        """Сценарий просмотра каталога: в основном добавления, иногда правки"""
+        operations = []
+        for _ in range(edits):
+            product_id = rng.choice(product_ids)
+            roll = rng.random()
+            if roll < 0.7:
+                operations.append({'op': 'add', 'product_id': product_id, 'quantity': 1})
+            elif roll < 0.9:
+                operations.append({'op': 'set', 'product_id': product_id, 'quantity': rng.randint(0, 3)})
+            else:
+                operations.append({'op': 'remove', 'product_id': product_id})
+        return operations
+
+    def run(self, storage_class, users, scenarios):
+        errors = 0
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            for user, operations in zip(users, scenarios):
+                storage = storage_class(user=user)
+                for operation in operations:
+                    try:
+                        storage.apply([operation])
+                    except BasketError:
+                        errors += 1
+                # Оформление заказа: отложенные изменения попадают в базу
+                storage.flush(user)
+            elapsed = time.perf_counter() - started
+
+        queries = context.captured_queries
+        writes = sum(1 for query in queries if query['sql'].lstrip().upper().startswith(WRITE_STATEMENTS))
+        return len(queries), writes, errors, elapsed
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            Product.objects.filter(product_is_active=True, product_quantity_in_stock__gt=3)
+            .values_list('product_id', flat=True)[:200]
+        )
+        if not product_ids:
+            raise CommandError('Нет активных товаров с остатком для сценария')
+
+        rng = random.Random(options['seed'])
+        scenarios = [
+            self.make_operations(product_ids, options['edits'], rng)
+            for _ in range(options['baskets'])
+        ]
+
+        results = {}
+        for name, storage_class in (('база', DatabaseBasketStorage), ('кеш', CacheBasketStorage)):
+            with transaction.atomic():
+                users = [
+                    CustomUser.objects.create(
+                        user_mail=f'benchmark-basket-{index}@example.invalid',
+                        user_surname='Benchmark', user_name=str(index)
+                    )
+                    for index in range(options['baskets'])
+                ]
+                results[name] = self.run(storage_class, users, scenarios)
+                for user in users:
+                    storage = CacheBasketStorage(user=user)
+                    storage.cache.delete(storage.key)
+                transaction.set_rollback(True)
+
+        total_edits = options['baskets'] * options['edits']
+        self.stdout.write(f'Корзин: {options["baskets"]}, изменений: {total_edits}')
+        for name, (queries, writes, errors, elapsed) in results.items():
+            self.stdout.write(
+                f'  {name}: запросов {queries}, записей {writes}, отклонено {errors}, '
+                f'{elapsed * 1000:.0f} мс ({total_edits / elapsed:.0f} изменений/с)'
+            )
@@ -0,0 +1,124 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from main.models import CustomUser, Order, normalize_search_value
+from main.order_search import search_orders
+
+BENCH_MAIL_DOMAIN = 'orders.bench'
+
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+            'Михайлов', 'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение поиска заказов администратором: прежний icontains по номеру, '
+        'email и фамилии через соединение таблиц против поиска по индексам. '
+        'Создаёт тестовых пользователей и заказы (--orders) и удаляет их после замера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', help='Поисковые запросы (по умолчанию - набор типовых)')
+        parser.add_argument('--orders', type=int, default=1000000, help='Создать тестовых заказов')
+        parser.add_argument('--users', type=int, default=20000, help='Создать тестовых пользователей')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого запроса')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные')
+
+    def create_dataset(self, options):
+        """
+        Пользователи и заказы через bulk_create. Накопительная статистика
+        (rollups.py) не обновляется: данные удаляются так же в обход неё.
+        """
+        started = time.perf_counter()
+        users = []
+        for index in range(options['users']):
+            mail = f'user{index}@{BENCH_MAIL_DOMAIN}'
+            surname = f'{SURNAMES[index % len(SURNAMES)]}{index}'
+            users.append(CustomUser(
+                user_mail=mail, user_surname=surname, user_name='Тест', user_password_hash='!',
+                user_mail_search=normalize_search_value(mail),
+                user_surname_search=normalize_search_value(surname),
+            ))
+        CustomUser.objects.bulk_create(users, batch_size=options['batch_size'])
+        user_ids = list(self.bench_users().values_list('user_id', flat=True))
+
+        statuses = [status for status, _ in Order.ORDER_STATUS_CHOICES]
+        created = 0
+        while created < options['orders']:
+            size = min(options['batch_size'], options['orders'] - created)
+            Order.objects.bulk_create([
+                Order(user_id=random.choice(user_ids), order_status=random.choice(statuses),
+                      delivery_address='Benchmark', payment_method='Онлайн', price=random.randint(100, 10000))
+                for _ in range(size)
+            ])
+            created += size
+            self.stdout.write(f'Создано заказов: {created}', ending='\r')
+
+        self.stdout.write(f'\nДанные созданы за {time.perf_counter() - started:.1f} с')
+
+    def bench_users(self):
+        return CustomUser.objects.filter(user_mail__endswith=f'@{BENCH_MAIL_DOMAIN}')
+
+    def cleanup(self, options):
+        user_ids = list(self.bench_users().values_list('user_id', flat=True))
+        for start in range(0, len(user_ids), 500):
+            orders = Order.objects.filter(user_id__in=user_ids[start:start + 500])
+            while True:
+                ids = list(orders.values_list('order_id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                Order.objects.filter(order_id__in=ids).delete()
+        self.bench_users().delete()
+
+    def icontains_queryset(self, query):
+        return Order.objects.filter(
+            Q(order_id__icontains=query) |
+            Q(user__user_mail__icontains=query) |
+            Q(user__user_surname__icontains=query)
+        ).order_by('-date_of_create')
+
+    def index_queryset(self, query):
+        queryset, _ = search_orders(Order.objects.all(), query)
+        return queryset.order_by('-search_rank', '-date_of_create')
+
+    def measure(self, build_queryset, query, repeat):
+        """Как страница списка заказов: COUNT и первые 20 строк"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = build_queryset(query)
+            count = queryset.count()
+            list(queryset[:20])
+            timings.append((time.perf_counter() - started) * 1000)
+        return count, statistics.median(timings), max(timings)
+
+    def handle(self, *args, **options):
+        if options['orders']:
+            self.create_dataset(options)
+
+        try:
+            last_order = Order.objects.order_by('-order_id').values_list('order_id', flat=True).first() or 1
+            queries = options['queries'] or [
+                str(last_order), f'user1@{BENCH_MAIL_DOMAIN}', 'user12', 'Иванов', 'семёнов15',
+            ]
+            self.stdout.write(f'Заказов в базе: {Order.objects.count()}')
+
+            for query in queries:
+                old_count, old_median, old_max = self.measure(self.icontains_queryset, query, options['repeat'])
+                new_count, new_median, new_max = self.measure(self.index_queryset, query, options['repeat'])
+
+                self.stdout.write(f'\n"{query}"')
+                self.stdout.write(
+                    f'  icontains: {old_count} найдено, медиана {old_median:.2f} мс, макс {old_max:.2f} мс')
+                self.stdout.write(
+                    f'  индекс:    {new_count} найдено, медиана {new_median:.2f} мс, макс {new_max:.2f} мс')
+                if new_median:
+                    self.stdout.write(f'  ускорение: x{old_median / new_median:.1f}')
+        finally:
+            if options['orders'] and not options['keep']:
+                self.cleanup(options)
@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from main.models import Product
+from main.search import search_products
+
+
+class Command(BaseCommand):
+    help = 'Сравнение поиска по индексу с поиском через icontains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='+', help='Поисковые запросы')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Количество повторов каждого запроса')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Размер страницы результатов')
+
+    def icontains_queryset(self, query):
+        return Product.objects.filter(product_is_active=True).filter(
+            Q(product_title__icontains=query) |
+            Q(product_description__icontains=query) |
+            Q(product_brand_title__icontains=query)
+        )
+
+    def index_queryset(self, query):
+        queryset = Product.objects.filter(product_is_active=True)
+        return search_products(queryset, query).order_by('-search_rank', 'product_id')
+
+    def measure(self, build_queryset, query, repeat, limit):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = build_queryset(query)
+            count = queryset.count()
+            list(queryset[:limit])
+            timings.append((time.perf_counter() - started) * 1000)
+        return count, statistics.median(timings), max(timings)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        limit = options['limit']
+
+        self.stdout.write(f'Товаров в каталоге: {Product.objects.count()}')
+        for query in options['queries']:
+            old_count, old_median, old_max = self.measure(
+                self.icontains_queryset, query, repeat, limit)
+            new_count, new_median, new_max = self.measure(
+                self.index_queryset, query, repeat, limit)
+
+            self.stdout.write(f'\n"{query}"')
+            self.stdout.write(
+                f'  icontains: {old_count} найдено, медиана {old_median:.2f} мс, макс {old_max:.2f} мс')
+            self.stdout.write(
+                f'  индекс:    {new_count} найдено, медиана {new_median:.2f} мс, макс {new_max:.2f} мс')
+            if new_median:
+                self.stdout.write(f'  ускорение: x{old_median / new_median:.1f}')
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from main.models import Category, Product
+from main.stock import decrement_stock, disable_sharding, enable_sharding, shard_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Конкурентное списание остатка одного товара: одна строка products '
+        'против шардированного остатка. Созданный товар удаляется.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--decrements', type=int, default=2000, help='Всего списаний')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--shards', type=int, default=8)
+        parser.add_argument('--hold-ms', type=float, default=2.0,
+                            help='Работа в транзакции после списания (имитация остального оформления)')
+
+    def run(self, product_id, hot, options):
+        hot_ids = {product_id} if hot else set()
+        hold = options['hold_ms'] / 1000
+
+        def decrement(_):
+            try:
+                for attempt in range(10):
+                    try:
+                        with transaction.atomic():
+                            ok = decrement_stock({product_id: 1}, hot_ids)
+                            # Блокировка строки держится до конца транзакции
+                            time.sleep(hold)
+                        return ok
+                    except OperationalError:
+                        time.sleep(0.005 * (attempt + 1))
+                return False
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            results = list(executor.map(decrement, range(options['decrements'])))
+        return results.count(True), time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        stock = options['decrements']
+        product = Product.objects.create(
+            product_title='Benchmark stock', product_price=1,
+            product_quantity_in_stock=stock, category=Category.objects.first()
+        )
+
+        try:
+            done, elapsed = self.run(product.product_id, False, options)
+            product.refresh_from_db()
+            self.stdout.write(
+                f'одна строка: {done} списаний за {elapsed:.2f} с ({done / elapsed:.0f}/с), '
+                f'остаток {product.product_quantity_in_stock}'
+            )
+
+            Product.objects.filter(pk=product.pk).update(product_quantity_in_stock=stock)
+            enable_sharding([product.product_id], options['shards'])
+            done, elapsed = self.run(product.product_id, True, options)
+            remaining = shard_totals([product.product_id]).get(product.product_id)
+            self.stdout.write(
+                f"шарды ({options['shards']}): {done} списаний за {elapsed:.2f} с "
+                f'({done / elapsed:.0f}/с), остаток {remaining}'
+            )
+        finally:
+            disable_sharding([product.product_id])
+            product.delete()
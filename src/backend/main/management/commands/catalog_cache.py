@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from main.caching import bump_catalog_version, get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Статистика и сброс кеша ответов каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invalidate', action='store_true',
+                            help='Увеличить версию каталога (сбросить все ответы)')
+        parser.add_argument('--reset-stats', action='store_true',
+                            help='Обнулить счётчики попаданий и промахов')
+
+    def handle(self, *args, **options):
+        if options['invalidate']:
+            version = bump_catalog_version()
+            self.stdout.write(self.style.SUCCESS(f'Новая версия каталога: {version}'))
+
+        if options['reset_stats']:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены'))
+
+        stats = get_cache_stats()
+        self.stdout.write(f"Версия каталога: {stats['version']}")
+        self.stdout.write(f"Попадания: {stats['hits']}")
+        self.stdout.write(f"Промахи: {stats['misses']}")
+        if stats['hit_rate'] is not None:
+            self.stdout.write(f"Доля попаданий: {stats['hit_rate']:.1%}")
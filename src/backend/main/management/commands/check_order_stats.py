@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.rollups import check
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка накопительной статистики заказов с таблицей заказов. '
+        'Завершается с ошибкой при расхождениях; исправление - rebuild_order_stats.'
+    )
+
+    def handle(self, *args, **options):
+        mismatches = check()
+        for day, order_status, expected, actual in mismatches:
+            self.stdout.write(
+                f'{day} {order_status}: по заказам {expected or (0, 0)}, в счётчиках {actual or (0, 0)}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}. Запустите rebuild_order_stats')
+        self.stdout.write(self.style.SUCCESS('Статистика совпадает с таблицей заказов'))
@@ -0,0 +1,238 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from main.caching import bump_catalog_version
+from main.models import Category, Product
+from main.search import index_products
+from main.serializers import ProductImportSerializer
+from main.stock import sync_hot_stock
+
+# Поля, которые upsert обновляет у существующих товаров
+UPDATE_FIELDS = [
+    'product_title', 'product_description', 'product_price',
+    'product_quantity_in_stock', 'product_image_url', 'category',
+    'product_brand_title', 'product_is_active',
+]
+
+
+def read_rows(path, file_format):
+    """Построчное чтение CSV или JSONL: (номер строки, словарь)"""
+    with open(path, encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                yield line_number, row
+        else:
+            for line_number, line in enumerate(file, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {'__error__': f'Некорректный JSON: {e}'}
+                yield line_number, row
+
+
+def resolve_category(value, category_map):
+    """Категория по id или названию из карты в памяти"""
+    if value is None or value == '':
+        return None, None
+
+    key = str(value).strip()
+    if key.isdigit() and int(key) in category_map['ids']:
+        return int(key), None
+
+    category_id = category_map['titles'].get(key.casefold())
+    if category_id is None:
+        return None, f'Категория "{value}" не найдена'
+    return category_id, None
+
+
+def validate_chunk(chunk, category_map):
+    """
+    Проверка пачки строк по правилам ProductImportSerializer.
+    Не обращается к базе, поэтому может выполняться в дочернем процессе.
+    Проверенная строка - (данные, обновляемые поля из колонок строки).
+    """
+    valid, rejects = [], []
+
+    for line_number, row in chunk:
+        if not isinstance(row, dict):
+            rejects.append((line_number, row, {'row': ['Ожидался объект']}))
+            continue
+        if '__error__' in row:
+            rejects.append((line_number, row, {'row': [row['__error__']]}))
+            continue
+
+        # Пустые ячейки CSV считаем отсутствующими значениями
+        data = {key: value for key, value in row.items() if value not in ('', None)}
+
+        category_id, category_error = resolve_category(data.pop('category', None), category_map)
+        serializer = ProductImportSerializer(data=data)
+
+        errors = {} if serializer.is_valid() else dict(serializer.errors)
+        if category_error:
+            errors['category'] = [category_error]
+
+        if errors:
+            rejects.append((line_number, row, errors))
+            continue
+
+        validated = dict(serializer.validated_data)
+        # Категория меняется, только если она есть в строке выгрузки
+        if 'category' in row and row['category'] not in ('', None):
+            validated['category_id'] = category_id
+        columns = tuple(field for field in UPDATE_FIELDS if row.get(field) not in ('', None))
+        valid.append((validated, columns))
+
+    return valid, rejects
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт товаров из CSV или JSONL с upsert по артикулу поставщика '
+        '(product_supplier_sku). Колонки совпадают с полями товара, category - '
+        'id или название категории.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки поставщика')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Количество строк в одной пачке upsert')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Процессов для разбора и проверки (0 - в текущем процессе)')
+        parser.add_argument('--rejects', help='Файл для отклонённых строк (JSONL)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        batch_size = options['batch_size']
+        workers = options['workers']
+        rejects_path = options['rejects'] or f'{path}.rejects.jsonl'
+
+        category_map = self.build_category_map()
+
+        self.stats = {'created': 0, 'updated': 0, 'rejected': 0}
+        self.started = time.monotonic()
+
+        rows = read_rows(path, file_format)
+        chunks = iter(lambda: list(islice(rows, batch_size)), [])
+
+        with open(rejects_path, 'w', encoding='utf-8') as rejects_file:
+            for valid, rejects in self.validated_chunks(chunks, category_map, workers):
+                self.write_rejects(rejects_file, rejects)
+                self.upsert(valid)
+                self.report()
+
+        elapsed = time.monotonic() - self.started
+        processed = sum(self.stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Импорт завершён за {elapsed:.1f} с: создано {self.stats['created']}, "
+            f"обновлено {self.stats['updated']}, отклонено {self.stats['rejected']} "
+            f"({processed / elapsed if elapsed else processed:.0f} строк/с)"
+        ))
+        if self.stats['rejected']:
+            self.stdout.write(f'Отклонённые строки: {rejects_path}')
+
+    def build_category_map(self):
+        ids = set()
+        titles = {}
+        for category_id, title in Category.objects.values_list('category_id', 'category_title'):
+            ids.add(category_id)
+            titles.setdefault(title.casefold(), category_id)
+        return {'ids': ids, 'titles': titles}
+
+    def validated_chunks(self, chunks, category_map, workers):
+        """Проверенные пачки в исходном порядке"""
+        if workers <= 0:
+            for chunk in chunks:
+                yield validate_chunk(chunk, category_map)
+            return
+
+        # Соединения с базой не должны наследоваться дочерними процессами
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            # Ограниченное окно задач: файл не читается в память целиком
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(validate_chunk, chunk, category_map))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def write_rejects(self, rejects_file, rejects):
+        for line_number, row, errors in rejects:
+            rejects_file.write(json.dumps(
+                {'line': line_number, 'row': row, 'errors': errors},
+                ensure_ascii=False, default=str
+            ) + '\n')
+        self.stats['rejected'] += len(rejects)
+
+    def upsert(self, valid):
+        """Upsert пачки: bulk_update существующих и bulk_create новых товаров"""
+        if not valid:
+            return
+
+        # При повторе артикула в пачке побеждает последняя строка
+        by_sku = {row['product_supplier_sku']: (row, columns) for row, columns in valid}
+
+        with transaction.atomic():
+            existing = Product.objects.filter(
+                product_supplier_sku__in=list(by_sku)
+            ).only('product_id', 'product_supplier_sku').in_bulk(field_name='product_supplier_sku')
+
+            # Существующие товары группируем по набору переданных колонок,
+            # чтобы не затирать поля, которых нет в строке выгрузки
+            to_update, to_create = {}, []
+            for sku, (row, columns) in by_sku.items():
+                product = existing.get(sku)
+                if product is None:
+                    to_create.append(Product(**row))
+                    continue
+
+                for field, value in row.items():
+                    setattr(product, field, value)
+                to_update.setdefault(columns, []).append(product)
+
+            for fields, products in to_update.items():
+                if not fields:
+                    # В строке только артикул: обновлять нечего
+                    continue
+                Product.objects.bulk_update(products, fields, batch_size=500)
+                if 'product_quantity_in_stock' in fields:
+                    sync_hot_stock([product.product_id for product in products])
+            if to_create:
+                Product.objects.bulk_create(to_create, batch_size=500)
+
+            # bulk-операции не вызывают сигналы: индекс обновляем пакетно
+            index_products(
+                Product.objects.filter(product_supplier_sku__in=list(by_sku)).only(
+                    'product_id', 'product_title', 'product_brand_title', 'product_description')
+            )
+            transaction.on_commit(bump_catalog_version)
+
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += sum(len(products) for products in to_update.values())
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        processed = sum(self.stats.values())
+        self.stdout.write(
+            f'Обработано строк: {processed} ({processed / elapsed if elapsed else processed:.0f} строк/с)'
+        )
@@ -0,0 +1,127 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import OperationalError, connection
+
+from main.checkout import CheckoutError, checkout, enqueue_checkout, process_checkout_batch
+from main.management.commands.stress_checkout import Command as StressCheckoutCommand
+from main.models import CheckoutJob, CustomUser, Order
+from main.rollups import delete_orders
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(StressCheckoutCommand):
+    help = (
+        'Сравнение синхронного и асинхронного оформления заказов под пиковой '
+        'нагрузкой на один товар: задержка ответа (p50/p99) и пропускная способность. '
+        'Созданные данные удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+        parser.add_argument('--workers', type=int, default=2, help='Воркеров очереди в режиме async')
+        parser.add_argument('--batch-size', type=int, default=100, help='Заявок в пачке воркера')
+
+    def timed(self, call, retries):
+        """Время вызова в мс; при блокировках - повтор"""
+        started = time.perf_counter()
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    call()
+                    break
+                except CheckoutError:
+                    break
+                except OperationalError:
+                    if attempt == retries:
+                        break
+                    time.sleep(0.01 * (attempt + 1))
+        finally:
+            connection.close()
+        return (time.perf_counter() - started) * 1000
+
+    def run_sync(self, users, options):
+        def buy(user):
+            return self.timed(
+                lambda: checkout(user, delivery_address='Load', payment_method='Онлайн'),
+                options['retries']
+            )
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            latencies = list(executor.map(buy, users))
+        return latencies, time.perf_counter() - started
+
+    def run_async(self, users, options):
+        done = threading.Event()
+
+        def worker():
+            try:
+                while not done.is_set():
+                    try:
+                        if not process_checkout_batch(options['batch_size']):
+                            time.sleep(0.01)
+                    except (OperationalError, CheckoutError):
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        def buy(user):
+            return self.timed(
+                lambda: enqueue_checkout(user, delivery_address='Load', payment_method='Онлайн'),
+                options['retries']
+            )
+
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(options['workers'])]
+        for thread in workers:
+            thread.start()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            latencies = list(executor.map(buy, users))
+
+        # Пропускная способность - до обработки последней заявки
+        while CheckoutJob.objects.filter(user__in=users, status=CheckoutJob.STATUS_PENDING).exists():
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+        done.set()
+        for thread in workers:
+            thread.join()
+        return latencies, elapsed
+
+    def handle(self, *args, **options):
+        modes = ['sync', 'async'] if options['mode'] == 'both' else [options['mode']]
+
+        for mode in modes:
+            product, users = self.setup(options)
+            try:
+                runner = self.run_sync if mode == 'sync' else self.run_async
+                latencies, elapsed = runner(users, options)
+
+                orders = Order.objects.filter(user__in=users).count()
+                product.refresh_from_db()
+                self.stdout.write(
+                    f'{mode}: покупателей {len(users)}, заказов {orders}, '
+                    f'остаток {product.product_quantity_in_stock}'
+                )
+                self.stdout.write(
+                    f'  ответ: p50 {statistics.median(latencies):.1f} мс, '
+                    f'p99 {percentile(latencies, 0.99):.1f} мс'
+                )
+                self.stdout.write(
+                    f'  {elapsed:.2f} с, {len(users) / elapsed:.1f} оформлений/с'
+                )
+            finally:
+                delete_orders(Order.objects.filter(user__in=users))
+                CustomUser.objects.filter(pk__in=[user.pk for user in users]).delete()
+                product.delete()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from main.checkout import CHECKOUT_BATCH_SIZE, CheckoutError, process_checkout_batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер асинхронного оформления заказов: обрабатывает очередь CheckoutJob '
+        'пачками. Несколько воркеров (потоков или процессов) делят очередь '
+        'через SELECT ... FOR UPDATE SKIP LOCKED.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Потоков обработки')
+        parser.add_argument('--batch-size', type=int, default=CHECKOUT_BATCH_SIZE,
+                            help='Заявок в одной транзакции')
+        parser.add_argument('--sleep', type=float, default=0.2,
+                            help='Пауза при пустой очереди, с')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и завершиться (с ошибкой при первом сбое пачки)')
+        parser.add_argument('--max-retries', type=int, default=5,
+                            help='Повторов пачки подряд до остановки воркера')
+
+    def handle(self, *args, **options):
+        self.processed = 0
+        self.error = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+        threads = [
+            threading.Thread(target=self.work, args=(options,), daemon=True)
+            for _ in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stopping.set()
+            for thread in threads:
+                thread.join()
+
+        if self.error is not None:
+            raise CommandError(f'Обработано заявок: {self.processed}, остановлено ошибкой: {self.error}')
+        self.stdout.write(self.style.SUCCESS(f'Обработано заявок: {self.processed}'))
+
+    def fail(self, error):
+        """Останавливает все потоки: команда завершится с ошибкой"""
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.stopping.set()
+
+    def work(self, options):
+        failures = 0
+        try:
+            while not self.stopping.is_set():
+                try:
+                    processed = process_checkout_batch(options['batch_size'])
+                except (OperationalError, CheckoutError) as e:
+                    # Взаимоблокировка, таймаут блокировки или гонка за остаток
+                    # горячего товара: пачка откатилась и останется в очереди.
+                    # Постоянная ошибка (например, недоступная база) не должна
+                    # крутить воркер бесконечно
+                    failures += 1
+                    if options['once'] or failures > options['max_retries']:
+                        self.fail(e)
+                        return
+                    self.stderr.write(f'Повтор пачки ({failures}/{options["max_retries"]}): {e}')
+                    time.sleep(options['sleep'])
+                    continue
+                except Exception as e:
+                    self.fail(e)
+                    raise
+                failures = 0
+
+                if processed:
+                    with self.lock:
+                        self.processed += processed
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+        finally:
+            connection.close()
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.events import PURGE_CHUNK_SIZE, purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из журнала событий заказов события старше ORDER_EVENTS_TTL пачками. '
+        'С --loop работает периодически.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE,
+                            help='Событий в одном DELETE')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Повторять с интервалом')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = purge_expired(options['chunk_size'])
+            self.stdout.write(f'Удалено событий: {deleted}')
+
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
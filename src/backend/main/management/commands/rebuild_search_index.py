@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.models import Product
+from main.search import index_products
+
+
+class Command(BaseCommand):
+    help = 'Полная перестройка поискового индекса товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество товаров в одной пачке')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.monotonic()
+
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(
+                Product.objects.filter(product_id__gt=last_id)
+                .order_by('product_id')
+                .only('product_id', 'product_title', 'product_brand_title', 'product_description')
+                [:batch_size]
+            )
+            if not batch:
+                break
+
+            index_products(batch)
+            last_id = batch[-1].product_id
+            total += len(batch)
+            self.stdout.write(f'Проиндексировано товаров: {total}')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс перестроен: {total} товаров за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.reservations import SWEEP_CHUNK_SIZE, sweep_expired
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет истёкшие резервы остатков пачками. Истёкшие резервы уже не '
+        'учитываются в доступном количестве, команда только освобождает таблицу. '
+        'С --loop работает периодически.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=SWEEP_CHUNK_SIZE,
+                            help='Резервов в одном DELETE')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Повторять с интервалом')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = sweep_expired(options['chunk_size'])
+            self.stdout.write(f'Удалено истёкших резервов: {deleted}')
+
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.stock import disable_sharding, enable_sharding, fold_stock, rebalance_stock
+
+
+class Command(BaseCommand):
+    help = (
+        'Шардированные остатки горячих товаров: включение и отключение, '
+        'свёртка суммы шардов в products.product_quantity_in_stock и выравнивание '
+        'шардов. Без флагов выполняет свёртку; с --loop - периодически.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enable', type=int, nargs='+', metavar='PRODUCT_ID',
+                            help='Перевести товары на шардированный остаток')
+        parser.add_argument('--disable', type=int, nargs='+', metavar='PRODUCT_ID',
+                            help='Вернуть товарам остаток в одной строке')
+        parser.add_argument('--shards', type=int, help='Количество шардов для --enable')
+        parser.add_argument('--rebalance', action='store_true', help='Выровнять шарды')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Повторять свёртку (и выравнивание) с интервалом')
+
+    def handle(self, *args, **options):
+        if options['shards'] is not None and options['shards'] < 1:
+            raise CommandError('--shards должно быть положительным')
+
+        if options['enable']:
+            enabled = enable_sharding(options['enable'], options['shards'])
+            self.stdout.write(f'Шардированы товары: {enabled or "нет (уже включено или не найдены)"}')
+        if options['disable']:
+            disable_sharding(options['disable'])
+            self.stdout.write(f"Шарды отключены: {options['disable']}")
+        if options['enable'] or options['disable']:
+            return
+
+        while True:
+            if options['rebalance']:
+                self.stdout.write(f'Выровнено товаров: {rebalance_stock()}')
+            self.stdout.write(f'Свёрнуто товаров: {fold_stock()}')
+
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from main.checkout import CheckoutError, checkout
+from main.models import Basket, BasketPosition, Category, CustomUser, Order, Product
+from main.rollups import delete_orders
+
+USER_MAIL_TEMPLATE = 'stress-checkout-{}@example.invalid'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка оформления заказов: много покупателей одновременно '
+        'покупают один товар с ограниченным остатком. Проверяет отсутствие '
+        'перепродажи и выводит число заказов в секунду. Созданные данные удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200, help='Количество покупателей')
+        parser.add_argument('--stock', type=int, default=50, help='Начальный остаток товара')
+        parser.add_argument('--quantity', type=int, default=1, help='Количество в каждой корзине')
+        parser.add_argument('--threads', type=int, default=16, help='Параллельных оформлений')
+        parser.add_argument('--retries', type=int, default=5,
+                            help='Повторов при взаимоблокировке или таймауте блокировки')
+
+    def setup(self, options):
+        product = Product.objects.create(
+            product_title='Stress checkout',
+            product_price=100,
+            product_quantity_in_stock=options['stock'],
+            category=Category.objects.first(),
+        )
+        users = CustomUser.objects.bulk_create([
+            CustomUser(user_mail=USER_MAIL_TEMPLATE.format(index),
+                       user_surname='Stress', user_name=str(index))
+            for index in range(options['buyers'])
+        ])
+        users = list(CustomUser.objects.filter(
+            user_mail__in=[user.user_mail for user in users]).order_by('pk'))
+        Basket.objects.bulk_create([Basket(user=user) for user in users])
+        baskets = Basket.objects.filter(user__in=users)
+        BasketPosition.objects.bulk_create([
+            BasketPosition(basket=basket, product=product, product_quantity=options['quantity'])
+            for basket in baskets
+        ])
+        return product, users
+
+    def buy(self, user, retries):
+        """Исход оформления: 'ok', 'rejected' или 'error'"""
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    checkout(user, delivery_address='Stress', payment_method='Онлайн')
+                    return 'ok'
+                except CheckoutError:
+                    return 'rejected'
+                except OperationalError:
+                    if attempt == retries:
+                        return 'error'
+                    time.sleep(0.01 * (attempt + 1))
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        product, users = self.setup(options)
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                outcomes = list(executor.map(lambda user: self.buy(user, options['retries']), users))
+            elapsed = time.perf_counter() - started
+
+            product.refresh_from_db()
+            orders = Order.objects.filter(user__in=users)
+            ordered = sum(
+                position.product_quantity
+                for order in orders.prefetch_related('positions')
+                for position in order.positions.all()
+            )
+            initial = options['stock']
+
+            self.stdout.write(
+                f"Покупателей: {len(users)}, остаток: {initial}, потоков: {options['threads']}"
+            )
+            self.stdout.write(
+                f"  оформлено: {outcomes.count('ok')}, отказано: {outcomes.count('rejected')}, "
+                f"ошибок: {outcomes.count('error')}"
+            )
+            self.stdout.write(
+                f'  продано: {ordered}, остаток после: {product.product_quantity_in_stock}'
+            )
+            self.stdout.write(
+                f"  {elapsed:.2f} с, {outcomes.count('ok') / elapsed:.1f} заказов/с"
+            )
+
+            oversold = product.product_quantity_in_stock < 0 or ordered + product.product_quantity_in_stock != initial
+            if oversold:
+                self.stdout.write(self.style.ERROR('Перепродажа: остатки не сходятся с заказами'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Перепродажи нет'))
+        finally:
+            delete_orders(Order.objects.filter(user__in=users))
+            CustomUser.objects.filter(pk__in=[user.pk for user in users]).delete()
+            product.delete()
@@ -0,0 +1,160 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:26
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Копия токенизатора main/search.py на момент миграции: его изменения не должны
+# менять результат исторической миграции. Индекс по текущему токенизатору
+# пересобирает команда rebuild_search_index.
+
+FIELD_WEIGHTS = {
+    'product_title': 3,
+    'product_brand_title': 2,
+    'product_description': 1,
+}
+
+MAX_TERM_LENGTH = 64
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class RussianStemmer:
+    """Стеммер Snowball для русского языка"""
+
+    VOWELS = 'аеиоуыэюя'
+
+    PERFECTIVE_GERUND = re.compile(
+        r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+    )
+    REFLEXIVE = re.compile(r'(ся|сь)$')
+    ADJECTIVE = re.compile(
+        r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|'
+        r'их|ых|ую|юю|ая|яя|ою|ею)$'
+    )
+    PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+    VERB = re.compile(
+        r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+        r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+        r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+    )
+    NOUN = re.compile(
+        r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|'
+        r'ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+    )
+    SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+    DERIVATIONAL = re.compile(r'(ость|ост)$')
+
+    def _region(self, word, start=0):
+        """Позиция после первой согласной, следующей за гласной"""
+        for i in range(start + 1, len(word)):
+            if word[i] not in self.VOWELS and word[i - 1] in self.VOWELS:
+                return i + 1
+        return len(word)
+
+    def stem(self, word):
+        word = word.replace('ё', 'е')
+
+        rv_start = next(
+            (i + 1 for i, char in enumerate(word) if char in self.VOWELS),
+            len(word)
+        )
+        r1_start = self._region(word)
+        r2_start = self._region(word, r1_start)
+
+        prefix, rv = word[:rv_start], word[rv_start:]
+
+        # Шаг 1: деепричастие, иначе возвратность + прилагательное/глагол/существительное
+        stripped = self.PERFECTIVE_GERUND.sub('', rv, count=1)
+        if stripped == rv:
+            rv = self.REFLEXIVE.sub('', rv, count=1)
+            stripped = self.ADJECTIVE.sub('', rv, count=1)
+            if stripped != rv:
+                rv = self.PARTICIPLE.sub('', stripped, count=1)
+            else:
+                stripped = self.VERB.sub('', rv, count=1)
+                if stripped == rv:
+                    rv = self.NOUN.sub('', rv, count=1)
+                else:
+                    rv = stripped
+        else:
+            rv = stripped
+
+        # Шаг 2
+        if rv.endswith('и'):
+            rv = rv[:-1]
+
+        # Шаг 3: словообразовательное окончание только в R2
+        match = self.DERIVATIONAL.search(rv)
+        if match and rv_start + match.start() >= r2_start:
+            rv = rv[:match.start()]
+
+        # Шаг 4
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+        else:
+            stripped = self.SUPERLATIVE.sub('', rv, count=1)
+            if stripped != rv:
+                rv = stripped[:-1] if stripped.endswith('нн') else stripped
+            elif rv.endswith('ь'):
+                rv = rv[:-1]
+
+        return prefix + rv
+
+
+stemmer = RussianStemmer()
+
+
+def normalize_token(token):
+    token = token.casefold().replace('ё', 'е')
+    if re.search('[а-я]', token):
+        token = stemmer.stem(token)
+    return token[:MAX_TERM_LENGTH]
+
+
+def product_terms(product):
+    terms = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in TOKEN_RE.findall(getattr(product, field) or ''):
+            term = normalize_token(token)
+            terms[term] = terms.get(term, 0) + weight
+    return terms
+
+
+def build_search_index(apps, schema_editor):
+    Product = apps.get_model('main', 'Product')
+    ProductSearchTerm = apps.get_model('main', 'ProductSearchTerm')
+
+    rows = []
+    for product in Product.objects.all().iterator(chunk_size=1000):
+        for term, weight in product_terms(product).items():
+            rows.append(ProductSearchTerm(product_id=product.product_id, term=term, weight=weight))
+        if len(rows) >= 5000:
+            ProductSearchTerm.objects.bulk_create(rows)
+            rows = []
+    ProductSearchTerm.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_basket_order_orderposition_basketposition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('product', models.ForeignKey(db_column='product_id', on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='main.product')),
+            ],
+            options={
+                'db_table': 'product_search_term',
+                'unique_together': {('term', 'product')},
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
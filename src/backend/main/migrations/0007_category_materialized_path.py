@@ -0,0 +1,48 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+def build_category_paths(apps, schema_editor):
+    Category = apps.get_model('main', 'Category')
+
+    categories = list(Category.objects.all())
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_category_id, []).append(category)
+
+    # Обход в ширину от корней
+    level = [(category, '/', 0) for category in children.get(None, [])]
+    while level:
+        next_level = []
+        for category, parent_path, depth in level:
+            category.category_path = f'{parent_path}{category.category_id}/'
+            category.category_depth = depth
+            next_level.extend(
+                (child, category.category_path, depth + 1)
+                for child in children.get(category.category_id, [])
+            )
+        level = next_level
+
+    Category.objects.bulk_update(categories, ['category_path', 'category_depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_basket_date_of_update_order_date_of_update'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='category_depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='category_path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_category_paths, migrations.RunPython.noop),
+    ]
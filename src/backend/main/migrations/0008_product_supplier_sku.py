@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_category_materialized_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='product_supplier_sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_product_supplier_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutJob',
+            fields=[
+                ('checkout_id', models.AutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('completed', 'Оформлен'), ('failed', 'Отклонён')], default='pending', max_length=20)),
+                ('payload', models.JSONField()),
+                ('error', models.JSONField(blank=True, null=True)),
+                ('date_of_create', models.DateTimeField(auto_now_add=True)),
+                ('date_of_update', models.DateTimeField(auto_now=True)),
+                ('order', models.OneToOneField(blank=True, db_column='order_id', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='checkout_job', to='main.order')),
+                ('user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='checkout_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'checkout_job',
+                'indexes': [models.Index(fields=['status', 'checkout_id'], name='checkout_job_queue_idx')],
+            },
+        ),
+    ]
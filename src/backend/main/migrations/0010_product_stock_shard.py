@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_checkout_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='product_is_hot',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ProductStockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_index', models.PositiveSmallIntegerField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(db_column='product_id', on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='main.product')),
+            ],
+            options={
+                'db_table': 'product_stock_shard',
+                'unique_together': {('product', 'shard_index')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_product_stock_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('reservation_id', models.AutoField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('basket', models.ForeignKey(db_column='basket_id', on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='main.basket')),
+                ('product', models.ForeignKey(db_column='product_id', on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='main.product')),
+            ],
+            options={
+                'db_table': 'stock_reservation',
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='reservation_active_idx'), models.Index(fields=['expires_at'], name='reservation_expires_idx')],
+                'unique_together': {('basket', 'product')},
+            },
+        ),
+    ]
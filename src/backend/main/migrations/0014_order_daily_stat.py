@@ -0,0 +1,47 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:30
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_order_daily_stats(apps, schema_editor):
+    Order = apps.get_model('main', 'Order')
+    OrderDailyStat = apps.get_model('main', 'OrderDailyStat')
+
+    rows = (
+        Order.objects.order_by()
+        .annotate(day=TruncDate('date_of_create'))
+        .values('day', 'order_status')
+        .annotate(count=Count('order_id'), revenue=Sum('price'))
+        .values_list('day', 'order_status', 'count', 'revenue')
+    )
+    OrderDailyStat.objects.bulk_create([
+        OrderDailyStat(day=day, order_status=order_status, order_count=count, revenue=revenue)
+        for day, order_status, count, revenue in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_order_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyStat',
+            fields=[
+                ('stat_id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('order_status', models.CharField(choices=[('В обработке', 'В обработке'), ('Собирается', 'Собирается'), ('Собран', 'Собран'), ('В пути', 'В пути'), ('Доставлен', 'Доставлен'), ('Отменён', 'Отменён')], max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'db_table': 'order_daily_stat',
+                'unique_together': {('day', 'order_status')},
+            },
+        ),
+        migrations.RunPython(fill_order_daily_stats, migrations.RunPython.noop),
+    ]
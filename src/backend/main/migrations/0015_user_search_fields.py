@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+def normalize(value):
+    return (value or '').strip().lower().replace('ё', 'е')
+
+
+def fill_user_search_fields(apps, schema_editor):
+    CustomUser = apps.get_model('main', 'CustomUser')
+
+    users = list(CustomUser.objects.only('user_id', 'user_mail', 'user_surname'))
+    for user in users:
+        user.user_mail_search = normalize(user.user_mail)
+        user.user_surname_search = normalize(user.user_surname)
+    CustomUser.objects.bulk_update(users, ['user_mail_search', 'user_surname_search'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_order_daily_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='user_mail_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='user_surname_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_user_search_fields, migrations.RunPython.noop),
+    ]
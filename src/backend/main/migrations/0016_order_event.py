@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_user_search_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('event_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event_type', models.CharField(choices=[('created', 'Создан'), ('status_changed', 'Изменён статус')], max_length=20)),
+                ('order_id', models.IntegerField()),
+                ('user_id', models.IntegerField(null=True)),
+                ('order_status', models.CharField(choices=[('В обработке', 'В обработке'), ('Собирается', 'Собирается'), ('Собран', 'Собран'), ('В пути', 'В пути'), ('Доставлен', 'Доставлен'), ('Отменён', 'Отменён')], max_length=20)),
+                ('previous_status', models.CharField(blank=True, choices=[('В обработке', 'В обработке'), ('Собирается', 'Собирается'), ('Собран', 'Собран'), ('В пути', 'В пути'), ('Доставлен', 'Доставлен'), ('Отменён', 'Отменён')], max_length=20)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('date_of_create', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'order_event',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_order_event'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='productsearchterm',
+            old_name='id',
+            new_name='search_term_id',
+        ),
+        migrations.AlterField(
+            model_name='productsearchterm',
+            name='search_term_id',
+            field=models.AutoField(primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_product_search_term_id'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='productstockshard',
+            old_name='id',
+            new_name='stock_shard_id',
+        ),
+        migrations.AlterField(
+            model_name='productstockshard',
+            name='stock_shard_id',
+            field=models.AutoField(primary_key=True, serialize=False),
+        ),
+    ]
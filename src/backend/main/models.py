@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, Concat, Substr
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 from django.core.validators import MinValueValidator
@@ -21,6 +23,11 @@ class UserManager(BaseUserManager):
         return self.create_user(user_mail, password, **extra_fields)
 
 
+def normalize_search_value(value):
+    """Значение для поиска по префиксу: нижний регистр, ё -> е, без крайних пробелов"""
+    return (value or '').strip().lower().replace('ё', 'е')
+
+
 class CustomUser(AbstractBaseUser, PermissionsMixin):
     USER_ROLES = [
         ('User', 'Пользователь'),
@@ -38,6 +45,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(default=timezone.now)
+    # Нормализованные копии для индексного поиска по префиксу (поиск заказов администратором)
+    user_mail_search = models.CharField(max_length=100, db_index=True, default='', editable=False)
+    user_surname_search = models.CharField(max_length=100, db_index=True, default='', editable=False)
 
     objects = UserManager()
 
@@ -47,6 +57,19 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return f"{self.user_surname} {self.user_name}"
 
+    def save(self, *args, **kwargs):
+        self.user_mail_search = normalize_search_value(self.user_mail)
+        self.user_surname_search = normalize_search_value(self.user_surname)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'user_mail' in update_fields:
+                update_fields.add('user_mail_search')
+            if 'user_surname' in update_fields:
+                update_fields.add('user_surname_search')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
     class Meta:
         db_table = 'users'
 
@@ -57,6 +80,9 @@ class Category(models.Model):
                                         related_name='children')
     category_title = models.CharField(max_length=60)
     category_description = models.TextField(blank=True, null=True)
+    # Материализованный путь от корня: "/1/5/12/"
+    category_path = models.CharField(max_length=255, db_index=True, default='', editable=False)
+    category_depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -65,6 +91,54 @@ class Category(models.Model):
     def __str__(self):
         return self.category_title
 
+    @property
+    def ancestor_ids(self):
+        """Идентификаторы категорий от корня до текущей включительно"""
+        return [int(part) for part in self.category_path.strip('/').split('/') if part]
+
+    def save(self, *args, **kwargs):
+        """Сохранение с пересчётом материализованного пути поддерева"""
+        with transaction.atomic():
+            # Пути берём из базы: объекты в памяти могли устареть после переноса поддерева
+            old_path, old_depth = '', 0
+            if self.pk is not None:
+                old_path, old_depth = Category.objects.filter(pk=self.pk).values_list(
+                    'category_path', 'category_depth').first() or ('', 0)
+
+            parent_path, parent_depth = '/', -1
+            if self.parent_category_id is not None:
+                parent_path, parent_depth = Category.objects.filter(
+                    pk=self.parent_category_id).values_list('category_path', 'category_depth').get()
+
+            if old_path and parent_path.startswith(old_path):
+                raise ValueError("Категория не может быть вложена в собственную подкатегорию")
+
+            super().save(*args, **kwargs)
+
+            new_path = f'{parent_path}{self.category_id}/'
+            new_depth = parent_depth + 1
+            self.category_path = new_path
+            self.category_depth = new_depth
+            if new_path == old_path:
+                return
+
+            Category.objects.filter(pk=self.pk).update(
+                category_path=new_path, category_depth=new_depth
+            )
+
+            # Перенос поддерева одним UPDATE
+            if old_path:
+                Category.objects.filter(
+                    category_path__startswith=old_path
+                ).exclude(pk=self.pk).update(
+                    category_path=Concat(
+                        Value(new_path),
+                        Substr('category_path', len(old_path) + 1),
+                        output_field=models.CharField()
+                    ),
+                    category_depth=F('category_depth') + (new_depth - old_depth)
+                )
+
 
 class Product(models.Model):
     product_id = models.AutoField(primary_key=True)
@@ -77,6 +151,10 @@ class Product(models.Model):
     product_brand_title = models.CharField(max_length=50, blank=True, null=True)
     product_date_of_create = models.DateTimeField(default=timezone.now)
     product_is_active = models.BooleanField(default=True)
+    product_supplier_sku = models.CharField(max_length=64, unique=True, blank=True, null=True)
+    # Остаток разбит на ProductStockShard (см. stock.py), а product_quantity_in_stock -
+    # периодически сворачиваемая сумма шардов
+    product_is_hot = models.BooleanField(default=False)
 
     def __str__(self):
         return self.product_title
@@ -85,6 +163,61 @@ class Product(models.Model):
         db_table = 'products'
 
 
+class ProductStockShard(models.Model):
+    """Часть остатка горячего товара: списания распределяются по шардам"""
+    stock_shard_id = models.AutoField(primary_key=True)
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_shards',
+        db_column='product_id'
+    )
+    shard_index = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'product_stock_shard'
+        unique_together = [['product', 'shard_index']]
+
+    def __str__(self):
+        return f"{self.product_id}[{self.shard_index}] = {self.quantity}"
+
+
+class ProductSearchTerm(models.Model):
+    """Инвертированный индекс для полнотекстового поиска товаров"""
+    search_term_id = models.AutoField(primary_key=True)
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        db_column='product_id'
+    )
+    term = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        db_table = 'product_search_term'
+        unique_together = [['term', 'product']]
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id} ({self.weight})"
+
+
+class BasketQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Сумма и количество товаров корзины, посчитанные в базе"""
+        return self.annotate(
+            annotated_total_price=Coalesce(
+                Sum(
+                    F('positions__product_quantity') * F('positions__product__product_price'),
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2)
+                ),
+                Value(0, output_field=models.DecimalField(max_digits=12, decimal_places=2))
+            ),
+            annotated_total_items=Coalesce(Sum('positions__product_quantity'), Value(0)),
+        )
+
+
 class Basket(models.Model):
     basket_id = models.AutoField(primary_key=True)
     user = models.OneToOneField(
@@ -93,6 +226,9 @@ class Basket(models.Model):
         related_name='basket',
         db_column='user_id'
     )
+    date_of_update = models.DateTimeField(auto_now=True)
+
+    objects = BasketQuerySet.as_manager()
 
     class Meta:
         db_table = 'basket'
@@ -100,8 +236,15 @@ class Basket(models.Model):
     def __str__(self):
         return f"Корзина #{self.basket_id} - {self.user}"
 
+    def touch(self):
+        """Отметка об изменении содержимого корзины"""
+        self.save(update_fields=['date_of_update'])
+
     @property
     def total_price(self):
+        # Значения из BasketQuerySet.with_totals() не требуют обхода позиций
+        if hasattr(self, 'annotated_total_price'):
+            return self.annotated_total_price
         return sum(
             pos.product_price * pos.product_quantity
             for pos in self.positions.all()
@@ -109,6 +252,8 @@ class Basket(models.Model):
 
     @property
     def total_items(self):
+        if hasattr(self, 'annotated_total_items'):
+            return self.annotated_total_items
         return sum(pos.product_quantity for pos in self.positions.all())
 
 
@@ -142,6 +287,41 @@ class BasketPosition(models.Model):
         return self.product.product_price
 
 
+class StockReservation(models.Model):
+    """
+    Резерв остатка под позицию корзины до expires_at.
+    Доступно к покупке: остаток минус активные (не истёкшие) резервы.
+    """
+    reservation_id = models.AutoField(primary_key=True)
+    basket = models.ForeignKey(
+        Basket,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        db_column='basket_id'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        db_column='product_id'
+    )
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'stock_reservation'
+        unique_together = [['basket', 'product']]
+        indexes = [
+            # Сумма активных резервов: WHERE product_id IN (...) AND expires_at > now
+            models.Index(fields=['product', 'expires_at'], name='reservation_active_idx'),
+            # Удаление истёкших резервов: WHERE expires_at <= now
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} x{self.quantity} до {self.expires_at}"
+
+
 class Order(models.Model):
     ORDER_STATUS_CHOICES = [
         ('В обработке', 'В обработке'),
@@ -166,6 +346,7 @@ class Order(models.Model):
         db_column='user_id'
     )
     date_of_create = models.DateTimeField(auto_now_add=True)
+    date_of_update = models.DateTimeField(auto_now=True)
     order_status = models.CharField(
         max_length=20,
         choices=ORDER_STATUS_CHOICES,
@@ -182,23 +363,23 @@ class Order(models.Model):
     class Meta:
         db_table = 'order'
         ordering = ['-date_of_create']
+        indexes = [
+            # История заказов пользователя: WHERE user_id = ? ORDER BY date_of_create DESC,
+            # order_id DESC (первичный ключ InnoDB входит в индекс неявно)
+            models.Index(fields=['user', 'date_of_create'], name='order_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.order_id} - {self.order_status}"
 
     def cancel(self):
-        """Отмена заказа с возвратом товаров на склад"""
-        if self.order_status != 'В обработке':
-            raise ValueError("Можно отменить только заказ 'В обработке'")
-
-        # Возврат товаров на склад
-        for position in self.positions.all():
-            product = position.product
-            product.product_quantity_in_stock += position.product_quantity
-            product.save()
+        """Отмена заказа с возвратом товаров на склад (orders.cancel_orders)"""
+        from .orders import cancel_orders
 
-        self.order_status = 'Отменён'
-        self.save()
+        result = cancel_orders([self.order_id])[0]
+        if result['status'] != 'cancelled':
+            raise ValueError(result['error'])
+        self.refresh_from_db(fields=['order_status', 'date_of_update'])
 
 
 class OrderPosition(models.Model):
@@ -222,4 +403,125 @@ class OrderPosition(models.Model):
         db_table = 'order_position'
 
     def __str__(self):
-        return f"{self.product.product_title if self.product else 'Удалённый товар'} x{self.product_quantity}"
\ No newline at end of file
+        return f"{self.product.product_title if self.product else 'Удалённый товар'} x{self.product_quantity}"
+
+class CheckoutJob(models.Model):
+    """
+    Заявка на асинхронное оформление заказа: снимок корзины, который
+    обрабатывает воркер process_checkouts
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_COMPLETED, 'Оформлен'),
+        (STATUS_FAILED, 'Отклонён'),
+    ]
+
+    checkout_id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='checkout_jobs',
+        db_column='user_id'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # {'items': {id товара: количество}, 'delivery_address', 'payment_method', 'user_comment'}
+    payload = models.JSONField()
+    order = models.OneToOneField(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='checkout_job',
+        db_column='order_id'
+    )
+    error = models.JSONField(null=True, blank=True)
+    date_of_create = models.DateTimeField(auto_now_add=True)
+    date_of_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'checkout_job'
+        indexes = [
+            # Выборка очереди воркером: WHERE status = 'pending' ORDER BY checkout_id
+            models.Index(fields=['status', 'checkout_id'], name='checkout_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Оформление #{self.checkout_id} - {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Сохранённый ответ на запрос с заголовком Idempotency-Key.
+    scope - владелец ключа: 'user:<id>' или 'guest:<токен корзины>'.
+    """
+    idempotency_key_id = models.AutoField(primary_key=True)
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    # sha1 метода, пути и тела запроса: ключ нельзя переиспользовать для другого запроса
+    fingerprint = models.CharField(max_length=40)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True)
+    response_headers = models.JSONField(default=dict)
+    date_of_create = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'idempotency_key'
+        unique_together = [['scope', 'key']]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} - {self.status_code}"
+
+
+class OrderDailyStat(models.Model):
+    """
+    Счётчики заказов за день (по дате создания) в разрезе статуса.
+    Обновляются в транзакциях создания и смены статуса заказов (rollups.py).
+    """
+    stat_id = models.AutoField(primary_key=True)
+    day = models.DateField()
+    order_status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'order_daily_stat'
+        unique_together = [['day', 'order_status']]
+
+    def __str__(self):
+        return f"{self.day} {self.order_status}: {self.order_count} / {self.revenue}"
+
+
+class OrderEvent(models.Model):
+    """
+    Журнал событий заказов (outbox): создание и смена статуса.
+    Пишется в транзакции изменения заказа, только добавлением строк;
+    event_id - курсор потока событий для панели администратора (events.py).
+    """
+    EVENT_CREATED = 'created'
+    EVENT_STATUS_CHANGED = 'status_changed'
+
+    EVENT_TYPE_CHOICES = [
+        (EVENT_CREATED, 'Создан'),
+        (EVENT_STATUS_CHANGED, 'Изменён статус'),
+    ]
+
+    event_id = models.BigAutoField(primary_key=True)
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPE_CHOICES)
+    # Без внешнего ключа: журнал переживает удаление заказа и не мешает ему
+    order_id = models.IntegerField()
+    user_id = models.IntegerField(null=True)
+    order_status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    previous_status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES, blank=True)
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    date_of_create = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'order_event'
+
+    def __str__(self):
+        return f"{self.event_id}: заказ {self.order_id} - {self.event_type} {self.order_status}"
@@ -0,0 +1,84 @@
+"""
+Поиск заказов в панели администратора.
+
+Запрос разбирается по виду, и каждая ветка идёт по своему индексу:
+    число        - точное совпадение с номером заказа (первичный ключ)
+                   и префикс email;
+    текст с "@"  - префикс нормализованного email (users.user_mail_search);
+    прочий текст - префикс нормализованного email или фамилии
+                   (users.user_surname_search).
+
+Пользователи ищутся отдельным запросом по индексам таблицы users,
+а заказы - по user_id IN (...) без соединения таблиц. Результаты
+ранжируются: номер заказа, затем точное совпадение email или фамилии,
+затем совпадение по префиксу.
+
+Найденных пользователей не больше MAX_MATCHED_USERS: точные совпадения
+первыми, затем по email и фамилии. Об усечении сообщает флаг truncated,
+панель просит уточнить запрос.
+"""
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import CustomUser, normalize_search_value
+
+# Ограничение числа найденных пользователей: короткий префикс
+# не должен превращаться в IN на всю таблицу
+MAX_MATCHED_USERS = 500
+
+RANK_ORDER_ID = 3
+RANK_EXACT = 2
+RANK_PREFIX = 1
+
+
+def match_users(query):
+    """(id пользователей с точным совпадением, id всех найденных, усечён ли список)"""
+    term = normalize_search_value(query)
+    if not term:
+        return set(), set(), False
+
+    # На MySQL istartswith - это LIKE 'term%' в регистронезависимой сортировке
+    # столбца, и такой LIKE идёт по индексу; значения уже в нижнем регистре
+    condition = Q(user_mail_search__istartswith=term)
+    exact = Q(user_mail_search=term)
+    if '@' not in term and not term.isdigit():
+        condition |= Q(user_surname_search__istartswith=term.split()[0])
+        exact |= Q(user_surname_search=term)
+
+    # Детерминированный порядок: при усечении теряются одни и те же,
+    # наименее точные совпадения
+    rows = list(
+        CustomUser.objects.filter(condition)
+        .annotate(is_exact=Case(When(exact, then=Value(0)), default=Value(1), output_field=IntegerField()))
+        .order_by('is_exact', 'user_mail_search', 'user_id')
+        .values_list('user_id', 'is_exact')[:MAX_MATCHED_USERS + 1]
+    )
+    truncated = len(rows) > MAX_MATCHED_USERS
+    rows = rows[:MAX_MATCHED_USERS]
+    return {user_id for user_id, is_exact in rows if not is_exact}, {user_id for user_id, _ in rows}, truncated
+
+
+def search_orders(queryset, query):
+    """
+    (заказы по запросу с аннотацией search_rank, усечён ли список пользователей).
+    Сортировку задаёт вызывающий код.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset, False
+
+    order_id = int(query) if query.isdigit() and len(query) < 10 else None
+    exact_users, users, truncated = match_users(query)
+
+    condition = Q(user_id__in=users) if users else Q()
+    if order_id is not None:
+        condition |= Q(order_id=order_id)
+    if not condition:
+        # Пустой результат, но с той же аннотацией для сортировки
+        condition = Q(pk__in=[])
+
+    return queryset.filter(condition).annotate(search_rank=Case(
+        *([When(order_id=order_id, then=Value(RANK_ORDER_ID))] if order_id is not None else []),
+        *([When(user_id__in=exact_users, then=Value(RANK_EXACT))] if exact_users else []),
+        default=Value(RANK_PREFIX),
+        output_field=IntegerField()
+    )), truncated
@@ -0,0 +1,165 @@
+"""
+Массовые операции с заказами: отмена и смена статусов.
+
+Отмена одного заказа или пачки заказов выполняется одной транзакцией
+постоянным числом запросов:
+    1. блокировка заказов SELECT ... FOR UPDATE в порядке первичного ключа -
+       повторная или конкурентная отмена видит уже изменённый статус
+       и не возвращает товары дважды;
+    2. количества к возврату суммируются по товарам в базе (GROUP BY);
+    3. возврат на склад одним UPDATE ... CASE с F()-выражениями
+       (stock.increment_stock, для горячих товаров - в шарды);
+    4. смена статуса одним UPDATE и перенос заказов между счётчиками
+       статистики (rollups.py), запись событий в журнал (events.py).
+
+Массовая смена статусов проверяет все переходы по VALID_TRANSITIONS на
+одном заблокированном наборе заказов и применяет их одним UPDATE на каждую
+пару (прежний статус, новый статус); отмены идут через cancel_orders.
+"""
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .events import record_status_changed
+from .models import Order, OrderPosition
+from .rollups import record_status_change
+from .stock import increment_stock
+
+CANCELLED_STATUS = 'Отменён'
+
+# Допустимые переходы между статусами заказа
+VALID_TRANSITIONS = {
+    'В обработке': ['Собирается', 'Отменён'],
+    'Собирается': ['Собран', 'Отменён'],
+    'Собран': ['В пути'],
+    'В пути': ['Доставлен'],
+    'Доставлен': [],
+    'Отменён': []
+}
+
+# Статусы, из которых заказ можно отменить с возвратом товаров
+CANCELLABLE_STATUSES = ('В обработке',)
+
+# Максимальное количество заказов в одной массовой операции
+MAX_BULK_ORDERS = 1000
+
+
+def cancel_orders(order_ids, user=None):
+    """
+    Отменяет заказы с возвратом товаров на склад. user ограничивает отмену
+    заказами пользователя. Возвращает результат по каждому заказу в исходном
+    порядке: {'order_id', 'status': 'cancelled' | 'not_found' | 'invalid_status'}.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+
+    with transaction.atomic():
+        orders = Order.objects.select_for_update().filter(order_id__in=order_ids)
+        if user is not None:
+            orders = orders.filter(user=user)
+        rows = {
+            order_id: (order_status, date_of_create, price)
+            for order_id, order_status, date_of_create, price in orders.order_by('order_id').values_list(
+                'order_id', 'order_status', 'date_of_create', 'price')
+        }
+
+        results = []
+        cancelled = []
+        for order_id in order_ids:
+            if order_id not in rows:
+                results.append({'order_id': order_id, 'status': 'not_found',
+                                'error': 'Заказ не найден'})
+            elif rows[order_id][0] not in CANCELLABLE_STATUSES:
+                results.append({'order_id': order_id, 'status': 'invalid_status',
+                                'error': "Можно отменить только заказ 'В обработке'"})
+            else:
+                results.append({'order_id': order_id, 'status': 'cancelled'})
+                cancelled.append(order_id)
+
+        if cancelled:
+            increment_stock(dict(
+                OrderPosition.objects.filter(order_id__in=cancelled, product__isnull=False)
+                .values('product_id').annotate(total=Sum('product_quantity'))
+                .values_list('product_id', 'total')
+            ))
+            # update() не вызывает auto_now: дату изменения задаём явно
+            Order.objects.filter(order_id__in=cancelled).update(
+                order_status=CANCELLED_STATUS, date_of_update=timezone.now()
+            )
+            record_status_change(
+                [(rows[order_id][1], rows[order_id][0], rows[order_id][2]) for order_id in cancelled],
+                CANCELLED_STATUS
+            )
+            record_status_changed([(order_id, rows[order_id][0]) for order_id in cancelled], CANCELLED_STATUS)
+
+    return results
+
+
+def transition_orders(transitions):
+    """
+    Смена статусов [(id заказа, новый статус)] одной транзакцией.
+    Возвращает результат по каждому заказу в исходном порядке:
+    {'order_id', 'status': 'updated' | 'cancelled' | 'not_found' |
+    'invalid_status' | 'duplicate', 'order_status'?, 'error'?}.
+    При повторе заказа применяется последняя строка.
+    """
+    results = []
+    latest = {}
+    for order_id, new_status in transitions:
+        if order_id in latest:
+            results[latest[order_id]] = {'order_id': order_id, 'status': 'duplicate'}
+        latest[order_id] = len(results)
+        results.append(None)
+
+    with transaction.atomic():
+        rows = {
+            order_id: (order_status, date_of_create, price)
+            for order_id, order_status, date_of_create, price in Order.objects.select_for_update()
+            .filter(order_id__in=latest).order_by('order_id')
+            .values_list('order_id', 'order_status', 'date_of_create', 'price')
+        }
+
+        # Проверка всех переходов и группировка по паре статусов
+        groups = {}
+        cancelled = []
+        for index, (order_id, new_status) in enumerate(transitions):
+            if latest[order_id] != index:
+                continue
+            if order_id not in rows:
+                results[index] = {'order_id': order_id, 'status': 'not_found', 'error': 'Заказ не найден'}
+                continue
+
+            old_status = rows[order_id][0]
+            if new_status not in VALID_TRANSITIONS.get(old_status, []):
+                results[index] = {'order_id': order_id, 'status': 'invalid_status',
+                                  'error': f"Нельзя изменить статус '{old_status}' на '{new_status}'"}
+            elif new_status == CANCELLED_STATUS:
+                cancelled.append(order_id)
+            else:
+                groups.setdefault((old_status, new_status), []).append(order_id)
+                results[index] = {'order_id': order_id, 'status': 'updated', 'order_status': new_status}
+
+        now = timezone.now()
+        for (old_status, new_status), order_ids in sorted(groups.items()):
+            # update() не вызывает auto_now: дату изменения задаём явно
+            Order.objects.filter(order_id__in=order_ids).update(order_status=new_status, date_of_update=now)
+            record_status_change(
+                [(rows[order_id][1], old_status, rows[order_id][2]) for order_id in order_ids],
+                new_status
+            )
+            record_status_changed([(order_id, old_status) for order_id in order_ids], new_status)
+
+        if cancelled:
+            for result in cancel_orders(cancelled):
+                if result['status'] == 'cancelled':
+                    result['order_status'] = CANCELLED_STATUS
+                results[latest[result['order_id']]] = result
+
+    return results
+
+
+def summarize(results):
+    """{статус результата: количество заказов}"""
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
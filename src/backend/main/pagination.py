@@ -0,0 +1,297 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class CustomPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+
+    def get_paginated_response(self, data):
+        return Response({
+            'total_objects': self.page.paginator.count,
+            'total_pages': math.ceil(self.page.paginator.count / self.page_size),
+            'current_page': self.page.number,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+
+def estimate_count(queryset):
+    """
+    Приблизительное количество строк по статистике планировщика (EXPLAIN).
+    Для СУБД без поддержки оценки выполняется точный COUNT(*).
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            plan = dict(zip(columns, cursor.fetchone()))
+        rows = plan.get('rows') or 0
+        filtered = plan.get('filtered') or 100
+        return int(rows * float(filtered) / 100)
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    return queryset.count()
+
+
+def cached_count(queryset):
+    """COUNT(*) с кешированием на settings.PAGINATION_COUNT_CACHE_TTL по тексту запроса"""
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    key = 'count:' + hashlib.sha1(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, 'PAGINATION_COUNT_CACHE_TTL', 30))
+    return count
+
+
+class PagePagination:
+    """
+    Постраничная выборка без обязательного COUNT(*): страница читается
+    с одной лишней строкой, по которой определяется has_next. Общее
+    количество считается по режиму ?count=:
+        exact    - COUNT(*) (или уже известное вызывающему коду значение);
+        cached   - COUNT(*), закешированный на короткое время;
+        estimate - оценка по статистике таблицы (estimate_count);
+        none     - не считается: count = null, num_pages - нижняя граница
+                   (текущая страница и ещё одна, если есть следующая).
+    Ответ совпадает по форме с прежним ответом на основе Paginator.
+    """
+    count_query_param = 'count'
+    count_modes = ('exact', 'cached', 'estimate', 'none')
+    max_per_page = 100
+
+    def __init__(self, per_page=20, default_count_mode='exact'):
+        self.per_page = per_page
+        self.default_count_mode = default_count_mode
+
+    def get_count_mode(self, request):
+        mode = request.query_params.get(self.count_query_param, self.default_count_mode)
+        return mode if mode in self.count_modes else self.default_count_mode
+
+    def get_int(self, value, default):
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return default
+
+    def get_count(self, queryset, mode, known_count=None):
+        if mode == 'exact':
+            return queryset.count() if known_count is None else known_count
+        if mode == 'cached':
+            return cached_count(queryset)
+        if mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    def paginate(self, queryset, request, known_count=None):
+        """(строки страницы, поля ответа без results)"""
+        per_page = min(self.get_int(request.query_params.get('per_page'), self.per_page), self.max_per_page)
+        page = self.get_int(request.query_params.get('page'), 1)
+        mode = self.get_count_mode(request)
+
+        count = self.get_count(queryset, mode, known_count)
+        num_pages = max(1, math.ceil(count / per_page)) if count is not None else None
+        if num_pages is not None and mode != 'estimate':
+            # Как Paginator.get_page: номер за последней страницей - последняя страница
+            page = min(page, num_pages)
+
+        offset = (page - 1) * per_page
+        rows = list(queryset[offset:offset + per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+
+        if num_pages is None or mode == 'estimate':
+            # Оценка может быть меньше фактического числа страниц
+            num_pages = max(num_pages or 1, page + (1 if has_next else 0))
+
+        return rows, {
+            'count': count,
+            'count_mode': mode,
+            'num_pages': num_pages,
+            'current_page': page,
+            'has_next': has_next,
+            'has_previous': page > 1,
+        }
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    Значения курсора без потери точности: DjangoJSONEncoder обрезает время
+    до миллисекунд, и сравнение > / < по округлённому значению пропускало
+    или повторяло строки с одинаковыми миллисекундами
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация.
+    Вместо OFFSET следующая страница выбирается условием по значениям
+    сортировки последней строки, поэтому стоимость не зависит от глубины.
+    Для устойчивости к одинаковым значениям к сортировке добавляется первичный ключ.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    # Режимы подсчёта общего количества: none - не считать, exact - COUNT(*),
+    # estimate - оценка по статистике таблицы
+    count_modes = ('none', 'exact', 'estimate')
+    default_count_mode = 'none'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """Список пар (поле, по убыванию) с уникальным первичным ключом в конце"""
+        pk_name = queryset.model._meta.pk.name
+        ordering = []
+        for field in queryset.query.order_by or queryset.model._meta.ordering or (pk_name,):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            if name == 'pk':
+                name = pk_name
+            ordering.append((name, descending))
+
+        if pk_name not in [name for name, _ in ordering]:
+            ordering.append((pk_name, ordering[-1][1] if ordering else False))
+        return ordering
+
+    def encode_cursor(self, values):
+        data = json.dumps(values, cls=CursorJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, request, queryset, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound('Некорректный курсор')
+
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound('Некорректный курсор')
+
+        # Приводим значения из JSON к типам полей модели (Decimal, datetime...)
+        result = []
+        for (name, _), value in zip(ordering, values):
+            try:
+                field = queryset.model._meta.get_field(name)
+                value = field.to_python(value)
+            except FieldDoesNotExist:
+                pass
+            except Exception:
+                raise NotFound('Некорректный курсор')
+            result.append(value)
+        return result
+
+    def build_filter(self, ordering, values):
+        """(a, b, pk) > (va, vb, vpk) с учётом направления каждого поля"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(ordering, values):
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            condition |= equal & Q(**{lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param, self.default_count_mode)
+        if mode not in self.count_modes:
+            mode = self.default_count_mode
+
+        self.count_is_estimate = mode == 'estimate'
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+
+        self.count = self.get_count(queryset, request)
+
+        queryset = queryset.order_by(
+            *[f'-{name}' if descending else name for name, descending in ordering]
+        )
+        cursor = self.decode_cursor(request, queryset, ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.build_filter(ordering, cursor))
+
+        # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+        self.next_cursor = None
+        if self.has_next:
+            last = rows[-1]
+            self.next_cursor = self.encode_cursor(
+                [getattr(last, name) for name, _ in ordering]
+            )
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'total_objects': self.count,
+            'count_is_estimate': self.count_is_estimate,
+            'has_next': self.has_next,
+            'next_cursor': self.next_cursor,
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+
+class OrderKeysetPagination(KeysetPagination):
+    """История заказов пользователя: размер страницы по ?per_page, как в постраничном режиме"""
+    page_size = 10
+    page_size_query_param = 'per_page'
@@ -0,0 +1,181 @@
+"""
+Автоматическая жадная загрузка связей по полям сериализатора.
+
+План строится один раз на класс сериализатора: вложенные сериализаторы и
+поля с точечным source (например, source='category.category_title')
+превращаются в select_related для связей "к одному" и Prefetch для связей
+"ко многим", а набор используемых полей - в only(). Благодаря этому
+список выполняет фиксированное число запросов независимо от размера страницы.
+
+Поля, которые план вывести не может (SerializerMethodField, свойства модели),
+описываются подсказками в Meta сериализатора:
+    eager_select - связи, которые нужно загрузить через select_related;
+    eager_prefetch - связи для prefetch_related;
+    eager_fields - поля модели, которые читают методы сериализатора.
+Если у сериализатора есть такие поля, а eager_fields не задан, only() для
+этого уровня не применяется, чтобы не получить N+1 на отложенных полях.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework import serializers
+
+
+class EagerPlan:
+    """План загрузки для одного кверисета"""
+
+    def __init__(self, model):
+        self.model = model
+        self.select = []
+        self.prefetch = []      # (путь, план вложенного кверисета)
+        self.fields = {model._meta.pk.name}
+        self.restrict = True    # можно ли ограничить загрузку полей через only()
+
+    def merge_to_one(self, path, plan):
+        """Вложение плана связи "к одному" с префиксом пути"""
+        self.select.append(path)
+        self.select.extend(f'{path}__{select}' for select in plan.select)
+        self.fields.update(f'{path}__{field}' for field in plan.fields)
+        self.prefetch.extend((f'{path}__{prefetch}', subplan) for prefetch, subplan in plan.prefetch)
+        self.restrict = self.restrict and plan.restrict
+
+
+def _nested_serializer_class(field):
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    if isinstance(field, serializers.ModelSerializer):
+        return type(field)
+    return None
+
+
+def _add_hints(plan, meta):
+    for path in getattr(meta, 'eager_select', []):
+        plan.select.append(path)
+        plan.fields.add(path.split('__')[0])
+    for path in getattr(meta, 'eager_prefetch', []):
+        plan.prefetch.append((path, None))
+    plan.fields.update(getattr(meta, 'eager_fields', []))
+
+
+@lru_cache(maxsize=None)
+def get_plan(serializer_class):
+    """План загрузки для класса ModelSerializer"""
+    meta = serializer_class.Meta
+    model = meta.model
+    plan = EagerPlan(model)
+    _add_hints(plan, meta)
+
+    for field in serializer_class().fields.values():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            if not hasattr(meta, 'eager_fields'):
+                plan.restrict = False
+            continue
+
+        _plan_source(plan, model, field.source_attrs, _nested_serializer_class(field), meta)
+
+    return plan
+
+
+def _plan_source(plan, model, attrs, nested_class, meta):
+    """Разбор цепочки атрибутов source относительно модели"""
+    current_model = model
+    path = []
+
+    for index, attr in enumerate(attrs):
+        try:
+            model_field = current_model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # Свойство или метод модели: какие поля ему нужны, неизвестно
+            if not hasattr(meta, 'eager_fields'):
+                plan.restrict = False
+            return
+
+        is_last = index == len(attrs) - 1
+        full_path = '__'.join(path + [model_field.name])
+
+        if not model_field.is_relation:
+            plan.fields.add(full_path)
+            return
+
+        related_model = model_field.related_model
+
+        if model_field.many_to_many or model_field.one_to_many:
+            subplan = get_plan(nested_class) if is_last and nested_class else EagerPlan(related_model)
+            if not (is_last and nested_class):
+                subplan.restrict = False
+            if model_field.one_to_many:
+                # Внешний ключ нужен Django, чтобы разложить строки по владельцам
+                subplan = _with_field(subplan, model_field.remote_field.name)
+            if path:
+                plan.prefetch.append((full_path, subplan))
+            else:
+                plan.prefetch.append((model_field.name, subplan))
+            return
+
+        # Связь "к одному"
+        if is_last:
+            if nested_class:
+                plan.merge_to_one(full_path, get_plan(nested_class))
+            elif model_field.concrete:
+                # PrimaryKeyRelatedField: достаточно значения внешнего ключа
+                plan.fields.add(full_path)
+            return
+
+        if model_field.concrete or model_field.one_to_one:
+            plan.select.append(full_path)
+            plan.fields.add(full_path)
+        path.append(model_field.name)
+        current_model = related_model
+
+
+def _with_field(plan, field):
+    copy = EagerPlan(plan.model)
+    copy.select = list(plan.select)
+    copy.prefetch = list(plan.prefetch)
+    copy.fields = set(plan.fields) | {field}
+    copy.restrict = plan.restrict
+    return copy
+
+
+def _build_prefetch(path, subplan):
+    if subplan is None:
+        return path
+    return Prefetch(path, queryset=apply_plan(subplan.model._default_manager.all(), subplan))
+
+
+def apply_plan(queryset, plan, restrict_fields=True):
+    if plan.select:
+        queryset = queryset.select_related(*plan.select)
+    if plan.prefetch:
+        queryset = queryset.prefetch_related(
+            *[_build_prefetch(path, subplan) for path, subplan in plan.prefetch]
+        )
+    if restrict_fields and plan.restrict:
+        queryset = queryset.only(*sorted(plan.fields))
+    return queryset
+
+
+def optimize_queryset(queryset, serializer_class, restrict_fields=True):
+    """
+    Добавляет к кверисету select_related / prefetch_related / only()
+    по полям сериализатора. restrict_fields=False отключает only(),
+    если объекты будут использоваться не только для чтения.
+    """
+    return apply_plan(queryset, get_plan(serializer_class), restrict_fields)
+
+
+def prefetch_for_serializer(instances, serializer_class):
+    """Подгрузка связей для уже полученных объектов (например, после save())"""
+    if not isinstance(instances, (list, tuple)):
+        instances = [instances]
+
+    plan = get_plan(serializer_class)
+    lookups = list(plan.select) + [
+        _build_prefetch(path, subplan) for path, subplan in plan.prefetch
+    ]
+    if lookups:
+        prefetch_related_objects(instances, *lookups)
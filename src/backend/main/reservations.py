@@ -0,0 +1,86 @@
+"""
+Резервы остатков под позиции корзин.
+
+Каждое изменение корзины в базе переписывает её резервы: на каждую позицию
+по строке stock_reservation с количеством позиции и сроком
+now + settings.STOCK_RESERVATION_TTL. Доступное для корзины количество -
+остаток товара минус активные резервы других корзин; сумма считается одним
+агрегатом по индексу (product_id, expires_at). Резервы переписываются
+под блокировкой строк товаров (basket.apply_basket_operations), поэтому
+их сумма не превышает остаток на момент записи.
+
+Оформление заказа забирает резервы корзины: товары, полностью покрытые
+активным резервом, не перепроверяются по остаткам и не блокируются, их
+списание проверяет только условный UPDATE. Истёкшие резервы в расчётах не
+участвуют и удаляются пачками командой release_reservations.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import StockReservation
+
+# Резервов, удаляемых одним DELETE
+SWEEP_CHUNK_SIZE = 1000
+
+
+def get_reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+
+
+def held_stock(product_ids, exclude_basket=None):
+    """{id товара: количество в активных резервах}, кроме резервов exclude_basket"""
+    reservations = StockReservation.objects.filter(
+        product_id__in=product_ids, expires_at__gt=timezone.now()
+    )
+    if exclude_basket is not None:
+        reservations = reservations.exclude(basket_id=exclude_basket.pk)
+    return dict(
+        reservations.values('product_id').annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+
+
+def basket_reservations(basket):
+    """{id товара: количество} в активных резервах корзины"""
+    return dict(
+        StockReservation.objects.filter(basket_id=basket.pk, expires_at__gt=timezone.now())
+        .values_list('product_id', 'quantity')
+    )
+
+
+def reserve(basket, quantities):
+    """Переписывает резервы корзины по {id товара: количество} с новым сроком"""
+    StockReservation.objects.filter(basket_id=basket.pk).delete()
+    expires_at = timezone.now() + get_reservation_ttl()
+    StockReservation.objects.bulk_create([
+        StockReservation(basket_id=basket.pk, product_id=product_id,
+                         quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+        if quantity > 0
+    ])
+
+
+def release(basket):
+    StockReservation.objects.filter(basket_id=basket.pk).delete()
+
+
+def sweep_expired(chunk_size=SWEEP_CHUNK_SIZE):
+    """
+    Удаляет истёкшие резервы пачками по chunk_size, каждая пачка - отдельный
+    короткий DELETE по первичному ключу. Возвращает количество удалённых.
+    """
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .order_by('expires_at').values_list('reservation_id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += StockReservation.objects.filter(reservation_id__in=ids).delete()[0]
+        if len(ids) < chunk_size:
+            return deleted
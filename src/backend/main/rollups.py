@@ -0,0 +1,193 @@
+"""
+Накопительная статистика заказов для панели администратора.
+
+Таблица order_daily_stat хранит по строке на (день создания, статус):
+количество заказов и их сумму. Счётчики меняются приращениями в той же
+транзакции, что и создание заказа или смена его статуса, поэтому
+статистика читает несколько строк вместо просмотра таблицы заказов.
+
+Приращения применяются в порядке ключа (день, статус): конкурентные
+транзакции блокируют строки счётчиков в одном порядке. Пересборка и
+проверка по таблице заказов - команды rebuild_order_stats и check_order_stats.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderDailyStat
+
+# Статусы, заказы в которых учитываются в выручке
+REVENUE_STATUSES = ('Собирается', 'Собран', 'В пути', 'Доставлен')
+
+# Заказы в работе
+IN_PROGRESS_STATUSES = ('В обработке', 'Собирается', 'Собран', 'В пути')
+
+RECENT_DAYS = 30
+
+
+def order_day(value):
+    """День заказа в текущем часовом поясе, как у TruncDate в пересборке"""
+    return timezone.localdate(value)
+
+
+def apply_deltas(deltas):
+    """Применяет {(день, статус): (количество, сумма)} к счётчикам"""
+    for (day, order_status), (count, revenue) in sorted(deltas.items()):
+        if not count and not revenue:
+            continue
+        changes = {'order_count': F('order_count') + count, 'revenue': F('revenue') + revenue}
+        if OrderDailyStat.objects.filter(day=day, order_status=order_status).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                OrderDailyStat.objects.create(
+                    day=day, order_status=order_status, order_count=count, revenue=revenue
+                )
+        except IntegrityError:
+            # Строку успела создать конкурентная транзакция
+            OrderDailyStat.objects.filter(day=day, order_status=order_status).update(**changes)
+
+
+def add_delta(deltas, day, order_status, count, revenue):
+    old_count, old_revenue = deltas.get((day, order_status), (0, Decimal(0)))
+    deltas[(day, order_status)] = (old_count + count, old_revenue + revenue)
+
+
+def record_created(orders):
+    """Новые заказы (объекты Order)"""
+    deltas = {}
+    for order in orders:
+        add_delta(deltas, order_day(order.date_of_create), order.order_status, 1, order.price)
+    apply_deltas(deltas)
+
+
+def record_status_change(rows, new_status):
+    """Смена статуса заказов: rows - (дата создания, прежний статус, сумма)"""
+    deltas = {}
+    for date_of_create, old_status, price in rows:
+        if old_status == new_status:
+            continue
+        day = order_day(date_of_create)
+        add_delta(deltas, day, old_status, -1, -price)
+        add_delta(deltas, day, new_status, 1, price)
+    apply_deltas(deltas)
+
+
+def delete_orders(queryset):
+    """Удаляет заказы с вычитанием из счётчиков"""
+    with transaction.atomic():
+        deltas = {}
+        for day, order_status, count, revenue in aggregate_orders(queryset):
+            add_delta(deltas, day, order_status, -count, -revenue)
+        apply_deltas(deltas)
+        return queryset.delete()
+
+
+def aggregate_orders(queryset=None):
+    """(день, статус, количество, сумма) по таблице заказов"""
+    queryset = Order.objects.all() if queryset is None else queryset
+    return (
+        queryset.order_by()
+        .annotate(day=TruncDate('date_of_create'))
+        .values('day', 'order_status')
+        .annotate(count=Count('order_id'), revenue=Sum('price'))
+        .values_list('day', 'order_status', 'count', 'revenue')
+    )
+
+
+def rebuild():
+    """
+    Пересобирает счётчики по таблице заказов. Конкурентные приращения ждут
+    на блокировках удалённых строк и применяются после фиксации пересборки.
+    Возвращает количество строк счётчиков.
+    """
+    with transaction.atomic():
+        OrderDailyStat.objects.all().delete()
+        stats = OrderDailyStat.objects.bulk_create([
+            OrderDailyStat(day=day, order_status=order_status, order_count=count, revenue=revenue)
+            for day, order_status, count, revenue in aggregate_orders()
+        ], batch_size=1000)
+    return len(stats)
+
+
+def check():
+    """Расхождения счётчиков с таблицей заказов: [(день, статус, ожидалось, в счётчиках)]"""
+    expected = {
+        (day, order_status): (count, revenue)
+        for day, order_status, count, revenue in aggregate_orders()
+    }
+    actual = {
+        (day, order_status): (count, revenue)
+        for day, order_status, count, revenue in OrderDailyStat.objects.values_list(
+            'day', 'order_status', 'order_count', 'revenue')
+        if count or revenue
+    }
+    return [
+        (day, order_status, expected.get((day, order_status)), actual.get((day, order_status)))
+        for day, order_status in sorted(expected.keys() | actual.keys())
+        if expected.get((day, order_status)) != actual.get((day, order_status))
+    ]
+
+
+def status_totals(since=None):
+    """
+    {статус: (количество, сумма, количество с since, сумма с since)}
+    одним запросом к счётчикам
+    """
+    recent = Q(day__gte=since) if since else Q()
+    rows = OrderDailyStat.objects.values('order_status').annotate(
+        total_count=Sum('order_count'),
+        total_revenue=Sum('revenue'),
+        recent_count=Sum('order_count', filter=recent),
+        recent_revenue=Sum('revenue', filter=recent),
+    ).values_list('order_status', 'total_count', 'total_revenue', 'recent_count', 'recent_revenue')
+    return {
+        order_status: (count or 0, revenue or Decimal(0), recent_count or 0, recent_revenue or Decimal(0))
+        for order_status, count, revenue, recent_count, recent_revenue in rows
+    }
+
+
+def list_stats():
+    """Сводка для списка заказов администратора"""
+    totals = status_totals()
+    count = {order_status: values[0] for order_status, values in totals.items()}
+    return {
+        'total': sum(count.values()),
+        'in_progress': sum(count.get(order_status, 0) for order_status in IN_PROGRESS_STATUSES),
+        'delivered': count.get('Доставлен', 0),
+        'cancelled': count.get('Отменён', 0),
+    }
+
+
+def dashboard_stats():
+    """Статистика заказов: всего и за последние RECENT_DAYS дней"""
+    # RECENT_DAYS календарных дней, включая сегодняшний
+    since = timezone.localdate() - timedelta(days=RECENT_DAYS - 1)
+    totals = status_totals(since)
+
+    def total(index, statuses=None):
+        return sum(
+            values[index] for order_status, values in totals.items()
+            if statuses is None or order_status in statuses
+        )
+
+    revenue_orders = total(0, REVENUE_STATUSES)
+    total_revenue = total(1, REVENUE_STATUSES)
+
+    return {
+        'total_orders': total(0),
+        'total_revenue': total_revenue,
+        'recent_orders': total(2),
+        'recent_revenue': total(3, REVENUE_STATUSES),
+        'avg_order_value': (
+            (total_revenue / revenue_orders).quantize(Decimal('0.01')) if revenue_orders else 0
+        ),
+        'by_status': {
+            order_status: totals.get(order_status, (0,))[0]
+            for order_status, _ in Order.ORDER_STATUS_CHOICES
+        }
+    }
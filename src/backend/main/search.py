@@ -0,0 +1,244 @@
+"""
+Полнотекстовый поиск по товарам.
+
+Инвертированный индекс хранится в таблице product_search_term: одна строка
+на пару (термин, товар) с весом, накопленным по полям названия, бренда и
+описания. Термины - это основы слов после приведения регистра и стемминга
+(алгоритм Snowball для русского языка), поэтому запрос "телефоны" находит
+товар "Телефон", а поиск идёт по индексу, а не сканированием TextField.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Q, OuterRef, Subquery, Sum, IntegerField
+from django.db.models.functions import Coalesce
+
+from .models import ProductSearchTerm
+
+
+# Веса полей товара при ранжировании
+FIELD_WEIGHTS = {
+    'product_title': 3,
+    'product_brand_title': 2,
+    'product_description': 1,
+}
+
+# Максимальная длина термина (совпадает с max_length поля term)
+MAX_TERM_LENGTH = 64
+
+# Минимальная длина префикса для поиска "по мере ввода"
+MIN_PREFIX_LENGTH = 2
+
+# Минимальная длина основы недописанного слова для точного совпадения:
+# короткая основа обрывка ("нау" -> "на") совпадает со служебными словами
+MIN_PREFIX_STEM_LENGTH = 3
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class RussianStemmer:
+    """Стеммер Snowball для русского языка"""
+
+    VOWELS = 'аеиоуыэюя'
+
+    PERFECTIVE_GERUND = re.compile(
+        r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+    )
+    REFLEXIVE = re.compile(r'(ся|сь)$')
+    ADJECTIVE = re.compile(
+        r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|'
+        r'их|ых|ую|юю|ая|яя|ою|ею)$'
+    )
+    PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+    VERB = re.compile(
+        r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+        r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+        r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+    )
+    NOUN = re.compile(
+        r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|'
+        r'ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+    )
+    SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+    DERIVATIONAL = re.compile(r'(ость|ост)$')
+
+    def _region(self, word, start=0):
+        """Позиция после первой согласной, следующей за гласной"""
+        for i in range(start + 1, len(word)):
+            if word[i] not in self.VOWELS and word[i - 1] in self.VOWELS:
+                return i + 1
+        return len(word)
+
+    def stem(self, word):
+        word = word.replace('ё', 'е')
+
+        rv_start = next(
+            (i + 1 for i, char in enumerate(word) if char in self.VOWELS),
+            len(word)
+        )
+        r1_start = self._region(word)
+        r2_start = self._region(word, r1_start)
+
+        prefix, rv = word[:rv_start], word[rv_start:]
+
+        # Шаг 1: деепричастие, иначе возвратность + прилагательное/глагол/существительное
+        stripped = self.PERFECTIVE_GERUND.sub('', rv, count=1)
+        if stripped == rv:
+            rv = self.REFLEXIVE.sub('', rv, count=1)
+            stripped = self.ADJECTIVE.sub('', rv, count=1)
+            if stripped != rv:
+                rv = self.PARTICIPLE.sub('', stripped, count=1)
+            else:
+                stripped = self.VERB.sub('', rv, count=1)
+                if stripped == rv:
+                    rv = self.NOUN.sub('', rv, count=1)
+                else:
+                    rv = stripped
+        else:
+            rv = stripped
+
+        # Шаг 2
+        if rv.endswith('и'):
+            rv = rv[:-1]
+
+        # Шаг 3: словообразовательное окончание только в R2
+        match = self.DERIVATIONAL.search(rv)
+        if match and rv_start + match.start() >= r2_start:
+            rv = rv[:match.start()]
+
+        # Шаг 4
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+        else:
+            stripped = self.SUPERLATIVE.sub('', rv, count=1)
+            if stripped != rv:
+                rv = stripped[:-1] if stripped.endswith('нн') else stripped
+            elif rv.endswith('ь'):
+                rv = rv[:-1]
+
+        return prefix + rv
+
+
+stemmer = RussianStemmer()
+
+
+def fold_token(token):
+    """Приведение регистра и ё -> е без стемминга"""
+    return token.casefold().replace('ё', 'е')[:MAX_TERM_LENGTH]
+
+
+def normalize_token(token):
+    """Приведение регистра и стемминг одного слова"""
+    token = fold_token(token)
+    if re.search('[а-я]', token):
+        token = stemmer.stem(token)
+    return token[:MAX_TERM_LENGTH]
+
+
+def tokenize(text):
+    """Разбивает текст на нормализованные термины"""
+    if not text:
+        return []
+    return [normalize_token(token) for token in TOKEN_RE.findall(text)]
+
+
+def product_terms(product):
+    """Словарь {термин: вес} для товара"""
+    terms = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(getattr(product, field)):
+            terms[term] = terms.get(term, 0) + weight
+    return terms
+
+
+def index_products(products):
+    """Перестраивает индекс для переданных товаров (пакетно)"""
+    products = list(products)
+    if not products:
+        return
+
+    rows = [
+        ProductSearchTerm(product_id=product.product_id, term=term, weight=weight)
+        for product in products
+        for term, weight in product_terms(product).items()
+    ]
+
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(
+            product_id__in=[product.product_id for product in products]
+        ).delete()
+        ProductSearchTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+def index_product(product):
+    """Инкрементальное обновление индекса для одного товара"""
+    terms = product_terms(product)
+    existing = dict(
+        ProductSearchTerm.objects.filter(product_id=product.product_id)
+        .values_list('term', 'weight')
+    )
+
+    # Текстовые поля не менялись (например, изменили цену или сняли с продажи)
+    if existing == terms:
+        return
+
+    index_products([product])
+
+
+def parse_query(query):
+    """
+    Разбирает поисковую строку на условия (Q) по индексу.
+    Последнее слово ищется по префиксу, пока пользователь его дописывает.
+    """
+    raw_tokens = TOKEN_RE.findall(query)
+    if not raw_tokens:
+        return []
+
+    conditions = [Q(term=normalize_token(token)) for token in raw_tokens]
+
+    prefix = fold_token(raw_tokens[-1])
+    if not query[-1].isspace() and len(prefix) >= MIN_PREFIX_LENGTH:
+        # Префикс берём от слова как есть: основа обрывка даёт ложные
+        # префиксы ("нау" -> "на" нашло бы "набор"). Дописанное слово
+        # ("телефоны") находит товар по точному совпадению основы
+        conditions[-1] = Q(term__startswith=prefix)
+        stem = normalize_token(raw_tokens[-1])
+        if stem != prefix and len(stem) >= MIN_PREFIX_STEM_LENGTH:
+            conditions[-1] |= Q(term=stem)
+
+    # Убираем повторы, сохраняя порядок
+    unique = []
+    for condition in conditions:
+        if condition not in unique:
+            unique.append(condition)
+    return unique
+
+
+def search_products(queryset, query):
+    """
+    Фильтрует кверисет товаров по поисковой строке.
+    Каждое слово запроса должно встретиться в индексе (AND), к результату
+    добавляется аннотация search_rank - суммарный вес совпавших терминов.
+    """
+    conditions = parse_query(query)
+    if not conditions:
+        return queryset.none()
+
+    rank_filter = Q()
+    for condition in conditions:
+        matched = ProductSearchTerm.objects.filter(condition).values('product_id')
+        queryset = queryset.filter(product_id__in=matched)
+        rank_filter |= condition
+
+    rank = (
+        ProductSearchTerm.objects
+        .filter(product_id=OuterRef('product_id'))
+        .filter(rank_filter)
+        .values('product_id')
+        .annotate(rank=Sum('weight'))
+        .values('rank')
+    )
+
+    return queryset.annotate(
+        search_rank=Coalesce(Subquery(rank, output_field=IntegerField()), 0)
+    )
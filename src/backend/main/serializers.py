@@ -1,8 +1,10 @@
+from django.db import models
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from rest_framework.validators import UniqueValidator
 
 from .models import CustomUser, Category, Product, Basket, BasketPosition, Order, OrderPosition
+from .orders import VALID_TRANSITIONS
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -52,24 +54,54 @@ class LoginSerializer(serializers.Serializer):
         return user
 
 
+class CategoryListSerializer(serializers.ListSerializer):
+    """
+    Список категорий: названия предков собираются один раз для всего списка,
+    поэтому full_path не делает запросов на каждую категорию
+    """
+
+    def to_representation(self, data):
+        categories = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+
+        titles = {category.category_id: category.category_title for category in categories}
+        missing = {
+            ancestor_id
+            for category in categories
+            for ancestor_id in category.ancestor_ids
+            if ancestor_id not in titles
+        }
+        if missing:
+            titles.update(
+                Category.objects.filter(category_id__in=missing)
+                .values_list('category_id', 'category_title')
+            )
+
+        self.child.category_titles = titles
+        return super().to_representation(categories)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     full_path = serializers.SerializerMethodField()
 
     class Meta:
         model = Category
         fields = ['category_id', 'category_title', 'category_description', 'parent_category_id', 'full_path']
+        list_serializer_class = CategoryListSerializer
+        # Поля, которые читает get_full_path (см. prefetch.py)
+        eager_fields = ['category_path', 'category_title']
 
     def get_full_path(self, obj):
-        path = []
-        current = obj
+        ancestor_ids = obj.ancestor_ids or [obj.category_id]
+        titles = getattr(self, 'category_titles', None)
 
-        depth = 0
-        while current and depth < 10:
-            path.append(current.category_title)
-            current = current.parent_category
-            depth += 1
+        if titles is None or any(ancestor_id not in titles for ancestor_id in ancestor_ids):
+            titles = dict(
+                Category.objects.filter(category_id__in=ancestor_ids)
+                .values_list('category_id', 'category_title')
+            )
+        titles[obj.category_id] = obj.category_title
 
-        return '/'.join(reversed(path))
+        return '/'.join(titles[ancestor_id] for ancestor_id in ancestor_ids if ancestor_id in titles)
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -101,6 +133,42 @@ class ProductSerializer(serializers.ModelSerializer):
         return value
 
 
+class ProductImportSerializer(ProductSerializer):
+    """
+    Строка выгрузки поставщика: те же правила, что у ProductSerializer,
+    но без обращений к базе - категория определяется по карте в памяти,
+    а уникальность артикула обеспечивает upsert.
+    """
+
+    class Meta:
+        model = Product
+        fields = ['product_supplier_sku', 'product_title', 'product_description',
+                  'product_price', 'product_quantity_in_stock', 'product_image_url',
+                  'product_brand_title', 'product_is_active']
+        extra_kwargs = {
+            'product_supplier_sku': {'required': True, 'allow_null': False, 'validators': []},
+        }
+
+
+class ProductBulkUpdateSerializer(ProductSerializer):
+    """Строка массового обновления цены и остатков (правила ProductSerializer)"""
+    product_id = serializers.IntegerField()
+
+    class Meta:
+        model = Product
+        fields = ['product_id', 'product_price', 'product_quantity_in_stock', 'product_is_active']
+        extra_kwargs = {
+            'product_price': {'required': False},
+            'product_quantity_in_stock': {'required': False},
+            'product_is_active': {'required': False},
+        }
+
+    def validate(self, data):
+        if len(data) < 2:
+            raise serializers.ValidationError("Не передано ни одного поля для обновления")
+        return data
+
+
 class ProductBriefSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
@@ -115,6 +183,7 @@ class BasketPositionSerializer(serializers.ModelSerializer):
     class Meta:
         model = BasketPosition
         fields = ['basket_position_id', 'product', 'product_id', 'product_quantity', 'total_price']
+        eager_fields = ['product_quantity', 'product__product_price']
 
     def get_total_price(self, obj):
         return obj.product_price * obj.product_quantity
@@ -133,6 +202,8 @@ class BasketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Basket
         fields = ['basket_id', 'positions', 'total_price', 'total_items']
+        # total_price и total_items считаются по загруженным позициям
+        eager_fields = []
 
 
 class OrderPositionSerializer(serializers.ModelSerializer):
@@ -156,6 +227,7 @@ class OrderSerializer(serializers.ModelSerializer):
             'positions', 'can_cancel'
         ]
         read_only_fields = ['order_id', 'date_of_create', 'order_status', 'price']
+        eager_fields = ['order_status']
 
     def get_status_display(self, obj):
         status_colors = {
@@ -180,26 +252,6 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['delivery_address', 'payment_method', 'user_comment']
 
-    def validate(self, data):
-        # Проверка наличия товаров в корзине
-        user = self.context['request'].user
-        try:
-            basket = user.basket
-            if not basket.positions.exists():
-                raise serializers.ValidationError("Корзина пуста")
-        except Basket.DoesNotExist:
-            raise serializers.ValidationError("Корзина не найдена")
-
-        # Проверка наличия на складе
-        for position in basket.positions.all():
-            if position.product_quantity > position.product.product_quantity_in_stock:
-                raise serializers.ValidationError(
-                    f"Недостаточно товара '{position.product.product_title}' на склаке. "
-                    f"Доступно: {position.product.product_quantity_in_stock}"
-                )
-
-        return data
-
 
 class AdminOrderSerializer(serializers.ModelSerializer):
     """Расширенный сериализатор для администраторов"""
@@ -215,6 +267,9 @@ class AdminOrderSerializer(serializers.ModelSerializer):
             'delivery_address', 'payment_method', 'price', 'user_comment',
             'positions', 'can_cancel', 'user_info'
         ]
+        eager_select = ['user']
+        eager_fields = ['order_status', 'user__user_surname', 'user__user_name',
+                        'user__user_mail']
 
     def get_user_info(self, obj):
         print(obj.user)
@@ -253,18 +308,9 @@ class OrderStatusUpdateSerializer(serializers.ModelSerializer):
         fields = ['order_status']
 
     def validate_order_status(self, value):
-        valid_transitions = {
-            'В обработке': ['Собирается', 'Отменён'],
-            'Собирается': ['Собран', 'Отменён'],
-            'Собран': ['В пути'],
-            'В пути': ['Доставлен'],
-            'Доставлен': [],
-            'Отменён': []
-        }
-
         current_status = self.instance.order_status if self.instance else None
 
-        if current_status and value not in valid_transitions.get(current_status, []):
+        if current_status and value not in VALID_TRANSITIONS.get(current_status, []):
             raise serializers.ValidationError(
                 f"Нельзя изменить статус '{current_status}' на '{value}'"
             )
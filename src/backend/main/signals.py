@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_catalog_version
+from .models import Category, Product
+from .search import FIELD_WEIGHTS, index_product
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Поддержание поискового индекса в актуальном состоянии"""
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(FIELD_WEIGHTS):
+        return
+    index_product(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, raw=False, **kwargs):
+    """Новая версия каталога после фиксации транзакции"""
+    if raw:
+        return
+    transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,267 @@
+"""
+Остатки товаров.
+
+Обычный товар хранит остаток в products.product_quantity_in_stock, и
+списание с него - один условный UPDATE ... CASE для всех товаров заказа.
+
+У горячего товара (product_is_hot) остаток разбит на settings.STOCK_SHARD_COUNT
+строк product_stock_shard. Списание начинает со случайного шарда и уменьшает
+его условным UPDATE ... WHERE quantity >= qty, поэтому конкурентные
+оформления блокируют разные строки вместо одной строки товара. Если ни в
+одном шарде не хватает остатка, шарды товара блокируются по порядку и
+списание делится между ними. Возвраты добавляются в случайный шард;
+у горячего товара без шардов они создаются заново (write_shards).
+
+Для горячих товаров поле product_quantity_in_stock - свёрнутая сумма шардов.
+Её обновляет fold_stock (команда stock_shards --fold, запускается
+периодически). Каталог и фильтры наличия читают это поле, а списание при
+оформлении сверяется с шардами.
+"""
+import random
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .caching import bump_catalog_version
+from .models import Product, ProductStockShard
+
+
+def get_shard_count():
+    return getattr(settings, 'STOCK_SHARD_COUNT', 8)
+
+
+def split_stock(total, shards):
+    """Равномерное разбиение остатка: [5, 5, 4, 4] для 18 и 4 шардов"""
+    base, extra = divmod(max(total, 0), shards)
+    return [base + (1 if index < extra else 0) for index in range(shards)]
+
+
+def hot_product_ids(product_ids):
+    return set(
+        Product.objects.filter(product_id__in=product_ids, product_is_hot=True)
+        .values_list('product_id', flat=True)
+    )
+
+
+def shard_totals(product_ids):
+    """{id товара: сумма шардов}"""
+    return dict(
+        ProductStockShard.objects.filter(product_id__in=product_ids)
+        .values('product_id').annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+
+
+def write_shards(product_id, total, shards=None):
+    """Раскладывает остаток товара по шардам заново"""
+    shards = shards or get_shard_count()
+    ProductStockShard.objects.filter(product_id=product_id).delete()
+    ProductStockShard.objects.bulk_create([
+        ProductStockShard(product_id=product_id, shard_index=index, quantity=quantity)
+        for index, quantity in enumerate(split_stock(total, shards))
+    ])
+
+
+def enable_sharding(product_ids, shards=None):
+    """Переводит товары на шардированный остаток"""
+    with transaction.atomic():
+        products = (
+            Product.objects.select_for_update()
+            .filter(product_id__in=product_ids, product_is_hot=False)
+            .order_by('product_id')
+            .values_list('product_id', 'product_quantity_in_stock')
+        )
+        enabled = []
+        for product_id, stock in products:
+            write_shards(product_id, stock, shards)
+            enabled.append(product_id)
+        Product.objects.filter(product_id__in=enabled).update(product_is_hot=True)
+    return enabled
+
+
+def disable_sharding(product_ids):
+    """Возвращает товарам остаток в одной строке"""
+    with transaction.atomic():
+        fold_stock(product_ids)
+        Product.objects.filter(product_id__in=product_ids, product_is_hot=True).update(product_is_hot=False)
+        ProductStockShard.objects.filter(product_id__in=product_ids).delete()
+
+
+def fold_stock(product_ids=None):
+    """
+    product_quantity_in_stock = сумма шардов для горячих товаров.
+    Возвращает количество обновлённых товаров.
+    """
+    queryset = Product.objects.filter(product_is_hot=True)
+    if product_ids is not None:
+        queryset = queryset.filter(product_id__in=product_ids)
+
+    total = (
+        ProductStockShard.objects.filter(product_id=OuterRef('product_id'))
+        .values('product_id').annotate(total=Sum('quantity')).values('total')
+    )
+    updated = queryset.update(product_quantity_in_stock=Coalesce(Subquery(total), Value(0)))
+    if updated:
+        transaction.on_commit(bump_catalog_version)
+    return updated
+
+
+def rebalance_stock(product_ids=None):
+    """Выравнивает шарды: остаток скапливается в шардах, куда идут возвраты"""
+    queryset = Product.objects.filter(product_is_hot=True)
+    if product_ids is not None:
+        queryset = queryset.filter(product_id__in=product_ids)
+
+    rebalanced = 0
+    for product_id in queryset.order_by('product_id').values_list('product_id', flat=True):
+        with transaction.atomic():
+            shards = list(
+                ProductStockShard.objects.select_for_update()
+                .filter(product_id=product_id).order_by('shard_index')
+            )
+            if not shards:
+                continue
+            for shard, quantity in zip(shards, split_stock(sum(s.quantity for s in shards), len(shards))):
+                shard.quantity = quantity
+            ProductStockShard.objects.bulk_update(shards, ['quantity'])
+            rebalanced += 1
+    return rebalanced
+
+
+def sync_hot_stock(product_ids):
+    """
+    После прямой записи product_quantity_in_stock (админка, импорт, массовое
+    обновление) раскладывает новое значение по шардам горячих товаров
+    """
+    for product_id, stock in Product.objects.filter(
+            product_id__in=product_ids, product_is_hot=True
+    ).values_list('product_id', 'product_quantity_in_stock'):
+        with transaction.atomic():
+            list(ProductStockShard.objects.select_for_update().filter(product_id=product_id))
+            write_shards(product_id, stock, ProductStockShard.objects.filter(product_id=product_id).count())
+
+
+def available_stock(product_ids):
+    """Точный остаток: сумма шардов для горячих товаров, поле товара для остальных"""
+    stock = dict(
+        Product.objects.filter(product_id__in=product_ids)
+        .values_list('product_id', 'product_quantity_in_stock')
+    )
+    stock.update(shard_totals(hot_product_ids(product_ids)))
+    return stock
+
+
+def _decrement_shards(product_id, quantity):
+    """Списание с горячего товара; False, если остатка не хватает"""
+    shard_count = ProductStockShard.objects.filter(product_id=product_id).count()
+    if not shard_count:
+        return False
+
+    # Быстрый путь: один шард со случайным началом обхода
+    start = random.randrange(shard_count)
+    for offset in range(shard_count):
+        updated = ProductStockShard.objects.filter(
+            product_id=product_id,
+            shard_index=(start + offset) % shard_count,
+            quantity__gte=quantity
+        ).update(quantity=F('quantity') - quantity)
+        if updated:
+            return True
+
+    # Медленный путь: остаток размазан по шардам
+    shards = list(
+        ProductStockShard.objects.select_for_update()
+        .filter(product_id=product_id).order_by('shard_index')
+    )
+    if sum(shard.quantity for shard in shards) < quantity:
+        return False
+
+    remaining = quantity
+    for shard in shards:
+        taken = min(shard.quantity, remaining)
+        shard.quantity -= taken
+        remaining -= taken
+    ProductStockShard.objects.bulk_update(shards, ['quantity'])
+    return True
+
+
+def _increment_shards(product_id, quantity):
+    """Возврат на горячий товар в случайный из существующих шардов"""
+    shard_indexes = list(
+        ProductStockShard.objects.filter(product_id=product_id).values_list('shard_index', flat=True)
+    )
+    if shard_indexes and ProductStockShard.objects.filter(
+            product_id=product_id, shard_index=random.choice(shard_indexes)
+    ).update(quantity=F('quantity') + quantity):
+        return
+
+    # Шардов нет (ручная очистка, прерванная перераскладка): под блокировкой
+    # товара раскладываем возврат по новым шардам, если их не создали раньше
+    Product.objects.select_for_update().filter(product_id=product_id).first()
+    shard = ProductStockShard.objects.filter(product_id=product_id).order_by('shard_index').first()
+    if shard is not None:
+        ProductStockShard.objects.filter(pk=shard.pk).update(quantity=F('quantity') + quantity)
+    else:
+        write_shards(product_id, quantity)
+
+
+def decrement_stock(quantities, hot_ids=()):
+    """
+    Списание {id товара: количество}. hot_ids - горячие товары из quantities.
+    Возвращает True, если хватило остатков по всем товарам; при False
+    вызывающий код откатывает транзакцию.
+    """
+    regular = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in hot_ids}
+
+    if regular:
+        updated = Product.objects.filter(
+            reduce(or_, (
+                Q(product_id=product_id, product_quantity_in_stock__gte=quantity)
+                for product_id, quantity in regular.items()
+            ))
+        ).update(product_quantity_in_stock=Case(
+            *[
+                When(product_id=product_id, then=F('product_quantity_in_stock') - quantity)
+                for product_id, quantity in regular.items()
+            ],
+            output_field=models.IntegerField()
+        ))
+        if updated != len(regular):
+            return False
+
+    for product_id in sorted(hot_ids):
+        if product_id in quantities and not _decrement_shards(product_id, quantities[product_id]):
+            return False
+
+    return True
+
+
+def increment_stock(quantities):
+    """
+    Возврат {id товара: количество} на склад (отмена заказа).
+    Кеш каталога сбрасывается после коммита.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+    if not quantities:
+        return
+
+    transaction.on_commit(bump_catalog_version)
+
+    hot_ids = hot_product_ids(quantities)
+    regular = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in hot_ids}
+
+    if regular:
+        Product.objects.filter(product_id__in=regular).update(product_quantity_in_stock=Case(
+            *[
+                When(product_id=product_id, then=F('product_quantity_in_stock') + quantity)
+                for product_id, quantity in regular.items()
+            ],
+            output_field=models.IntegerField()
+        ))
+
+    for product_id in sorted(hot_ids):
+        _increment_shards(product_id, quantities[product_id])
@@ -1,3 +1,515 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Count, Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .basket import BasketError, CacheBasketStorage, get_basket_for_read
+from .checkout import CheckoutError, checkout, enqueue_checkout, process_checkout_batch
+from .events import EventReader, make_stream_token, stream_token_user_id
+from .facets import MAX_PRICE_EDGES
+from .models import (
+    Basket, BasketPosition, CheckoutJob, CustomUser, Order, OrderEvent, Product, ProductStockShard
+)
+from .order_search import match_users
+from .rollups import RECENT_DAYS, dashboard_stats, rebuild
+from .search import search_products
+from .stock import enable_sharding, increment_stock, shard_totals
+from .views import get_stream_user
+
+# Запросов на чтение корзины и на изменение с ответом-корзиной
+# (не зависят от количества позиций)
+LIST_QUERIES = 4
+UPDATE_QUANTITY_QUERIES = 15
+
+
+class ProductSearchTests(TestCase):
+    """Поиск товаров по инвертированному индексу"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pan_set = Product.objects.create(
+            product_title='Набор кастрюль', product_price=1000, product_quantity_in_stock=5
+        )
+        cls.phone = Product.objects.create(
+            product_title='Телефон', product_price=2000, product_quantity_in_stock=5
+        )
+
+    def search(self, query):
+        return set(search_products(Product.objects.all(), query).values_list('product_id', flat=True))
+
+    def test_prefix_uses_raw_token(self):
+        # Основа обрывка "нау" - "на", префикс по ней нашёл бы "набор"
+        self.assertNotIn(self.pan_set.product_id, self.search('нау'))
+        self.assertIn(self.pan_set.product_id, self.search('наб'))
+
+    def test_prefix_matches_stem_of_complete_word(self):
+        self.assertEqual(self.search('телеф'), {self.phone.product_id})
+        self.assertEqual(self.search('телефоны'), {self.phone.product_id})
+        self.assertEqual(self.search('Телефоны '), {self.phone.product_id})
+
+
+class ProductFacetsTests(TestCase):
+    """Параметры фасетов каталога"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_price_edges_limit(self):
+        edges = ','.join(str(edge * 100) for edge in range(MAX_PRICE_EDGES + 1))
+        response = self.client.get('/products/facets/', {'price_buckets': edges})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+
+        edges = ','.join(str(edge * 100) for edge in range(MAX_PRICE_EDGES))
+        response = self.client.get('/products/facets/', {'price_buckets': edges})
+        self.assertEqual(response.status_code, 200)
+
+
+class BasketQueryCountTests(TestCase):
+    """
+    Корзина читается постоянным числом запросов: позиции с товарами
+    и итоги (with_totals) не должны откатиться к запросам на каждую позицию
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            'basket@test.ru', 'password', user_name='Тест', user_surname='Тестов'
+        )
+        cls.products = [
+            Product.objects.create(product_title=f'Товар {index}', product_price=100 + index,
+                                   product_quantity_in_stock=50)
+            for index in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_basket(self, count):
+        basket, _ = Basket.objects.get_or_create(user=self.user)
+        BasketPosition.objects.bulk_create([
+            BasketPosition(basket=basket, product=product, product_quantity=2)
+            for product in self.products[:count]
+        ])
+
+    def test_list(self):
+        for count in (1, len(self.products)):
+            with self.subTest(positions=count):
+                BasketPosition.objects.filter(basket__user=self.user).delete()
+                self.fill_basket(count)
+                with self.assertNumQueries(LIST_QUERIES):
+                    response = self.client.get('/basket/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['positions']), count)
+                self.assertEqual(response.data['total_items'], 2 * count)
+
+    def test_totals_are_annotated(self):
+        self.fill_basket(len(self.products))
+        basket = get_basket_for_read(user=self.user)
+        # Итоги считает база, а не обход позиций в Python
+        self.assertTrue(hasattr(basket, 'annotated_total_price'))
+        with self.assertNumQueries(0):
+            self.assertEqual(basket.total_items, 2 * len(self.products))
+            self.assertEqual(basket.total_price, sum(2 * product.product_price for product in self.products))
+
+    def test_update_quantity(self):
+        for count in (1, len(self.products)):
+            with self.subTest(positions=count):
+                BasketPosition.objects.filter(basket__user=self.user).delete()
+                self.fill_basket(count)
+                position = BasketPosition.objects.filter(basket__user=self.user).first()
+                with self.assertNumQueries(UPDATE_QUANTITY_QUERIES):
+                    response = self.client.post(
+                        '/basket/update_quantity/',
+                        {'position_id': position.pk, 'quantity': 3}, format='json'
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['positions']), count)
+
+
+class StockReservationTests(TestCase):
+    """Резерв корзины уменьшает остаток, доступный другим корзинам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            product_title='Товар', product_price=100, product_quantity_in_stock=5
+        )
+        cls.users = [
+            CustomUser.objects.create_user(f'reserve{index}@test.ru', 'password',
+                                           user_name='Тест', user_surname='Тестов')
+            for index in range(2)
+        ]
+
+    def add(self, user, quantity):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post('/basket/add_item/', {'product_id': self.product.product_id, 'quantity': quantity},
+                           format='json')
+
+    def test_reservation_blocks_second_basket(self):
+        self.assertEqual(self.add(self.users[0], 4).status_code, 201)
+
+        response = self.add(self.users[1], 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['available'], 1)
+        self.assertEqual(self.add(self.users[1], 1).status_code, 201)
+        self.assertEqual(self.add(self.users[0], 1).status_code, 400)
+
+
+class CheckoutQueueTests(TestCase):
+    """Асинхронное оформление через очередь CheckoutJob"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            product_title='Товар', product_price=100, product_quantity_in_stock=3
+        )
+        cls.users = [
+            CustomUser.objects.create_user(f'queue{index}@test.ru', 'password',
+                                           user_name='Тест', user_surname='Тестов')
+            for index in range(2)
+        ]
+
+    def enqueue(self, user, quantity):
+        basket = Basket.objects.create(user=user)
+        BasketPosition.objects.create(basket=basket, product=self.product, product_quantity=quantity)
+        return enqueue_checkout(user, delivery_address='Адрес', payment_method='Онлайн')
+
+    def test_process_batch(self):
+        completed = self.enqueue(self.users[0], 2)
+        failed = self.enqueue(self.users[1], 2)
+
+        self.assertEqual(process_checkout_batch(), 2)
+        self.assertEqual(process_checkout_batch(), 0)
+
+        completed.refresh_from_db()
+        self.assertEqual(completed.status, CheckoutJob.STATUS_COMPLETED)
+        self.assertEqual(completed.order.user, self.users[0])
+        self.assertEqual(completed.order.price, 200)
+        self.assertEqual(
+            list(completed.order.positions.values_list('product_id', 'product_quantity')),
+            [(self.product.product_id, 2)]
+        )
+
+        # Второй заявке остатка не хватило: позиции вернулись в корзину
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, CheckoutJob.STATUS_FAILED)
+        self.assertIsNone(failed.order)
+        self.assertEqual(failed.error['available'], 1)
+        self.assertEqual(
+            list(BasketPosition.objects.filter(basket__user=self.users[1])
+                 .values_list('product_id', 'product_quantity')),
+            [(self.product.product_id, 1)]
+        )
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.product_quantity_in_stock, 1)
+
+    @mock.patch('main.management.commands.process_checkouts.process_checkout_batch',
+                side_effect=CheckoutError('Остатки товаров изменились'))
+    def test_worker_stops_on_repeated_errors(self, process):
+        with self.assertRaises(CommandError):
+            call_command('process_checkouts', '--once', stderr=StringIO())
+        self.assertEqual(process.call_count, 1)
+
+        process.reset_mock()
+        with self.assertRaises(CommandError):
+            call_command('process_checkouts', '--max-retries', '2', '--sleep', '0', stderr=StringIO())
+        self.assertEqual(process.call_count, 3)
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite не поддерживает SELECT ... FOR UPDATE и конкурентную запись')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Одновременные оформления одного товара не перепродают остаток"""
+
+    STOCK = 5
+    BUYERS = 12
+    THREADS = 8
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            product_title='Товар', product_price=100, product_quantity_in_stock=self.STOCK
+        )
+        self.users = [
+            CustomUser.objects.create_user(f'concurrent{index}@test.ru', 'password',
+                                           user_name='Тест', user_surname='Тестов')
+            for index in range(self.BUYERS)
+        ]
+        for user in self.users:
+            basket = Basket.objects.create(user=user)
+            BasketPosition.objects.create(basket=basket, product=self.product, product_quantity=1)
+
+    def buy(self, user):
+        try:
+            for attempt in range(5):
+                try:
+                    checkout(user, delivery_address='Адрес', payment_method='Онлайн')
+                    return 'ok'
+                except CheckoutError:
+                    return 'rejected'
+                except OperationalError:
+                    # Взаимоблокировка или таймаут блокировки: повторяем
+                    continue
+            return 'error'
+        finally:
+            connection.close()
+
+    def test_no_oversell(self):
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            outcomes = list(executor.map(self.buy, self.users))
+
+        self.product.refresh_from_db()
+        orders = Order.objects.filter(user__in=self.users).count()
+        self.assertGreaterEqual(self.product.product_quantity_in_stock, 0)
+        self.assertLessEqual(orders, self.STOCK)
+        self.assertEqual(orders, outcomes.count('ok'))
+        self.assertEqual(orders + self.product.product_quantity_in_stock, self.STOCK)
+
+
+class GuestBasketLockTests(TestCase):
+    """Замок гостевой корзины в кеше"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            product_title='Товар', product_price=100, product_quantity_in_stock=10
+        )
+
+    def setUp(self):
+        self.storage = CacheBasketStorage(token='guest-basket-token-0001')
+        self.storage.cache.clear()
+
+    def add(self, storage):
+        storage.apply([{'op': 'add', 'product_id': self.product.product_id, 'quantity': 1}])
+
+    @mock.patch('main.basket.BASKET_LOCK_WAIT', 0)
+    def test_concurrent_apply_is_rejected(self):
+        with self.storage.lock():
+            with self.assertRaises(BasketError) as context:
+                self.add(CacheBasketStorage(token=self.storage.token))
+        self.assertEqual(context.exception.status_code, 409)
+
+        # После освобождения замка изменение проходит, замок снят
+        self.add(self.storage)
+        self.add(self.storage)
+        self.assertEqual(self.storage.read_state()['items'], {self.product.product_id: 2})
+        self.assertIsNone(self.storage.cache.get(f'lock:{self.storage.key}'))
+
+
+class HotStockTests(TestCase):
+    """Возврат остатка горячему товару"""
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            product_title='Горячий товар', product_price=100, product_quantity_in_stock=8
+        )
+        enable_sharding([self.product.product_id], shards=4)
+
+    def test_increment_without_shards(self):
+        ProductStockShard.objects.filter(product=self.product).delete()
+        increment_stock({self.product.product_id: 3})
+        self.assertEqual(shard_totals([self.product.product_id]), {self.product.product_id: 3})
+
+    def test_increment_with_missing_shard_index(self):
+        # Остались шарды 1-3 по 2 единицы: индекс 0 выбираться не должен
+        ProductStockShard.objects.filter(product=self.product, shard_index=0).delete()
+        for _ in range(10):
+            increment_stock({self.product.product_id: 1})
+        self.assertEqual(shard_totals([self.product.product_id]), {self.product.product_id: 16})
+
+
+class OrderSearchTests(TestCase):
+    """Поиск пользователей для поиска заказов администратором"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            surname: CustomUser.objects.create_user(
+                f'{mail}@test.ru', 'password', user_name='Тест', user_surname=surname
+            ).user_id
+            for mail, surname in [('c', 'Иванова'), ('z', 'Иванов'), ('b', 'Иванченко')]
+        }
+
+    @mock.patch('main.order_search.MAX_MATCHED_USERS', 1)
+    def test_truncation_keeps_exact_match(self):
+        exact, users, truncated = match_users('иванов')
+        self.assertTrue(truncated)
+        self.assertEqual(exact, {self.users['Иванов']})
+        self.assertEqual(users, {self.users['Иванов']})
+
+    @mock.patch('main.order_search.MAX_MATCHED_USERS', 2)
+    def test_truncation_is_ordered_by_email(self):
+        _, users, truncated = match_users('иван')
+        self.assertTrue(truncated)
+        self.assertEqual(users, {self.users['Иванченко'], self.users['Иванова']})
+
+    def test_not_truncated(self):
+        _, users, truncated = match_users('иван')
+        self.assertFalse(truncated)
+        self.assertEqual(len(users), 3)
+
+
+class OrderEventTests(TestCase):
+    """Журнал событий заказов и поток для панели администратора"""
+
+    def create_events(self, *event_ids):
+        OrderEvent.objects.bulk_create([
+            OrderEvent(event_id=event_id, event_type=OrderEvent.EVENT_CREATED,
+                       order_id=event_id, order_status='В обработке')
+            for event_id in event_ids
+        ])
+
+    def read_ids(self, reader):
+        return [event.event_id for event in reader.read()]
+
+    def test_late_commit_in_gap_is_delivered(self):
+        self.create_events(1, 2, 4)
+        reader = EventReader(0)
+        self.assertEqual(self.read_ids(reader), [1, 2, 4])
+        self.assertEqual(reader.cursor, 4)
+
+        # Транзакция с id 3 зафиксировалась позже события 4
+        self.create_events(3)
+        self.assertEqual(self.read_ids(reader), [3])
+        self.assertEqual(reader.cursor, 4)
+        self.assertEqual(self.read_ids(reader), [])
+
+    def test_gaps_before_cursor_are_restored(self):
+        self.create_events(1, 2, 4)
+        reader = EventReader(4)
+        self.create_events(3, 5)
+        self.assertEqual(self.read_ids(reader), [3, 5])
+
+    @override_settings(ORDER_EVENTS_GAP_WINDOW=0)
+    def test_gap_is_dropped_after_window(self):
+        self.create_events(1, 3)
+        reader = EventReader(0)
+        self.assertEqual(self.read_ids(reader), [1, 3])
+        self.create_events(2)
+        self.assertEqual(self.read_ids(reader), [])
+
+    def test_stream_token(self):
+        user = CustomUser.objects.create_user('events@test.ru', 'password', user_name='Тест', user_surname='Тестов')
+        token = make_stream_token(user)
+        self.assertEqual(stream_token_user_id(token), user.user_id)
+        self.assertIsNone(stream_token_user_id(token + 'x'))
+        with override_settings(ORDER_EVENTS_TOKEN_TTL=-1):
+            self.assertIsNone(stream_token_user_id(token))
+
+    def test_stream_token_inactive_user(self):
+        user = CustomUser.objects.create_user('events@test.ru', 'password', user_name='Тест', user_surname='Тестов')
+        request = RequestFactory().get('/admin/orders/events/', {'token': make_stream_token(user)})
+        self.assertEqual(get_stream_user(request), user)
+
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        self.assertIsNone(get_stream_user(request))
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсорная пагинация каталога по значениям с одинаковым временем"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Одно время с микросекундами у всех товаров: порядок решает первичный ключ
+        created = datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+        cls.product_ids = [
+            Product.objects.create(
+                product_title=f'Товар {index}', product_price=100 + index,
+                product_quantity_in_stock=5, product_date_of_create=created
+            ).product_id
+            for index in range(6)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def collect(self, sort):
+        ids = []
+        params = {'pagination': 'cursor', 'sort': sort, 'page_size': 2}
+        for _ in range(10):
+            response = self.client.get('/products/', params)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(product['product_id'] for product in response.data['results'])
+            if not response.data['next_cursor']:
+                return ids
+            params['cursor'] = response.data['next_cursor']
+        self.fail('Курсорная пагинация не завершилась')
+
+    def test_tied_timestamps(self):
+        self.assertEqual(self.collect('newest'), sorted(self.product_ids, reverse=True))
+        self.assertEqual(self.collect('price_asc'), self.product_ids)
+
+
+class OrderHistoryCursorTests(TestCase):
+    """Курсорная история заказов по одинаковому date_of_create"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            'orders@test.ru', 'password', user_name='Тест', user_surname='Тестов'
+        )
+        cls.order_ids = [
+            Order.objects.create(user=cls.user, delivery_address='Адрес', payment_method='Онлайн',
+                                 price=100).order_id
+            for _ in range(5)
+        ]
+        # auto_now_add не даёт задать время при создании
+        Order.objects.filter(order_id__in=cls.order_ids).update(
+            date_of_create=datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+        )
+
+    def test_tied_date_of_create(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        ids = []
+        params = {'pagination': 'cursor', 'per_page': 2}
+        for _ in range(10):
+            response = client.get('/orders/', params)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(order['order_id'] for order in response.data['results'])
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+        self.assertEqual(ids, sorted(self.order_ids, reverse=True))
+
+
+class DashboardStatsTests(TestCase):
+    """Статистика панели по счётчикам совпадает с таблицей заказов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user(
+            'stats@test.ru', 'password', user_name='Тест', user_surname='Тестов'
+        )
+        # Заказы на границах окна: сегодня, первый день окна и день до него
+        now = timezone.now()
+        for days, price in [(0, 100), (RECENT_DAYS - 1, 200), (RECENT_DAYS, 400)]:
+            order = Order.objects.create(user=user, delivery_address='Адрес', payment_method='Онлайн',
+                                         price=price, order_status='Доставлен')
+            Order.objects.filter(pk=order.pk).update(date_of_create=now - timedelta(days=days))
+        rebuild()
+
+    def test_recent_window_matches_orders(self):
+        since = timezone.localdate() - timedelta(days=RECENT_DAYS - 1)
+        expected = Order.objects.filter(date_of_create__date__gte=since).aggregate(
+            count=Count('order_id'), revenue=Sum('price')
+        )
+
+        stats = dashboard_stats()
+        self.assertEqual(stats['recent_orders'], expected['count'])
+        self.assertEqual(stats['recent_revenue'], expected['revenue'])
+        self.assertEqual(stats['recent_orders'], 2)
+        self.assertEqual(stats['total_orders'], 3)
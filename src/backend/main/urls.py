@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
 from django.urls import get_resolver
 from .views import (UserViewSet, ProductViewSet,
-                    CategoryViewSet, BasketViewSet, OrderViewSet, AdminOrderViewSet)
+                    CategoryViewSet, BasketViewSet, OrderViewSet, AdminOrderViewSet, order_events)
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename="user")
@@ -13,7 +13,10 @@ router.register(r'basket', BasketViewSet, basename='basket')
 router.register(r'orders', OrderViewSet, basename='orders')
 router.register(r'admin/orders', AdminOrderViewSet, basename='admin-orders')
 
-urlpatterns = router.urls + [
+urlpatterns = [
+    # До маршрутов роутера: иначе "events" разбирается как id заказа
+    path('admin/orders/events/', order_events, name='admin-order-events'),
+] + router.urls + [
     #path('logout/', LogoutView.as_view(), name='logout'),
 ]
 
@@ -1,24 +1,45 @@
-import math
-
-from django.http import Http404
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from rest_framework import viewsets, permissions
-from django.db.models import Q
-from django.db import transaction, models
-from django.core.paginator import Paginator
-from rest_framework.exceptions import NotFound
-from rest_framework.pagination import PageNumberPagination
-from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import Q, Count, Max
+from django.db import transaction
+from rest_framework.exceptions import AuthenticationFailed, NotFound
 
 from .permissions import IsAdmin
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import AccessToken
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 from rest_framework.viewsets import ViewSet
 
-from .models import CustomUser, Product, Category, Basket, BasketPosition, Order, OrderPosition
+from .models import CustomUser, Product, Category, CheckoutJob, Order
+from .basket import (
+    GUEST_BASKET_HEADER, MAX_BATCH_OPERATIONS, BasketError, get_basket_storage, merge_guest_basket
+)
+from .bulk import MAX_BULK_UPDATE_ITEMS, bulk_update_products
+from .caching import CatalogCacheMixin, get_catalog_cache, get_catalog_last_modified, get_catalog_version
+from .checkout import CheckoutError, checkout, enqueue_checkout, is_async_checkout
+from .conditional import conditional_response, make_etag
+from .exports import (
+    EXPORT_FORMATS, ORDER_EXPORT_FIELDS, ORDER_POSITION_EXPORT_FIELDS, PRODUCT_EXPORT_FIELDS,
+    export_response, flatten_order_rows, order_rows, product_rows
+)
+from .facets import compute_facets, facets_cache_key, parse_price_edges
+from .events import (
+    get_stream_token_ttl, last_event_id, make_stream_token, record_status_changed, stream_events,
+    stream_token_user_id
+)
+from .idempotency import idempotent
+from .order_search import search_orders
+from .orders import MAX_BULK_ORDERS, VALID_TRANSITIONS, cancel_orders, summarize, transition_orders
+from .pagination import CustomPagination, KeysetPagination, OrderKeysetPagination, PagePagination
+from .prefetch import optimize_queryset, prefetch_for_serializer
+from .rollups import dashboard_stats, list_stats, record_status_change
+from .search import search_products
 from .serializers import (
     UserSerializer, LoginSerializer, RegisterSerializer,
     CategorySerializer, ProductSerializer,
@@ -26,28 +47,32 @@ from .serializers import (
     OrderSerializer, OrderCreateSerializer,
     AdminOrderSerializer, OrderStatusUpdateSerializer
 )
+from .stock import sync_hot_stock
 
 
-class CustomPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-
-    def get_paginated_response(self, data):
-        return Response({
-            'total_objects': self.page.paginator.count,
-            'total_pages': math.ceil(self.page.paginator.count / self.page_size),
-            'current_page': self.page.number,
-            'next': self.get_next_link(),
-            'previous': self.get_previous_link(),
-            'results': data
-        })
-
-
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['category']
+
+    @property
+    def paginator(self):
+        """
+        Курсорная пагинация включается параметром ?pagination=cursor
+        (или передачей ?cursor=) - для бесконечной прокрутки каталога
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or params.get('cursor'):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # Остаток, заданный администратором, раскладывается по шардам горячего товара
+        if 'product_quantity_in_stock' in serializer.validated_data:
+            sync_hot_stock([serializer.instance.product_id])
 
     def destroy(self, request, *args, **kwargs):
         try:
@@ -62,65 +87,106 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-    def get_queryset(self):
+    # Корзины наличия товара (используются фильтром и фасетами)
+    AVAILABILITY_FILTERS = {
+        'in_stock': Q(product_quantity_in_stock__gt=10),
+        'low_stock': Q(product_quantity_in_stock__gt=0, product_quantity_in_stock__lte=10),
+        'out_of_stock': Q(product_quantity_in_stock=0),
+    }
+
+    def get_base_queryset(self):
         """
-        Возвращает отфильтрованный и отсортированный кверисет продуктов
+        Кверисет до применения фильтров: активность товара и поиск
         """
         is_all = self.request.query_params.get('is_all')
-        sort_by_id = self.request.query_params.get('sortById')
 
         if is_all:
             queryset = Product.objects.all()
         else:
             queryset = Product.objects.filter(product_is_active=True)
 
-        if sort_by_id:
-            queryset = queryset.order_by('-product_id')
-
-        # Поиск
+        # Поиск по инвертированному индексу
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(product_title__icontains=search) |
-                Q(product_description__icontains=search) |
-                Q(product_brand_title__icontains=search)
-            )
+            queryset = search_products(queryset, search)
+
+        return queryset
+
+    def get_filter_conditions(self):
+        """
+        Условия фильтров каталога по именам: price, brand, availability, category.
+        Отдельные Q нужны фасетам, где каждый фасет исключает собственный фильтр.
+        """
+        params = self.request.query_params
+        conditions = {}
 
         # Цена
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
+        price = Q()
+        min_price = params.get('min_price')
+        max_price = params.get('max_price')
 
         if min_price:
             try:
-                min_price_value = float(min_price)
-                queryset = queryset.filter(product_price__gte=min_price_value)
+                price &= Q(product_price__gte=float(min_price))
             except ValueError:
                 pass
 
         if max_price:
             try:
-                max_price_value = float(max_price)
-                queryset = queryset.filter(product_price__lte=max_price_value)
+                price &= Q(product_price__lte=float(max_price))
             except ValueError:
                 pass
 
+        if price:
+            conditions['price'] = price
+
         # Бренд
-        brand = self.request.query_params.get('brand')
+        brand = params.get('brand')
         if brand:
-            queryset = queryset.filter(product_brand_title=brand)
+            conditions['brand'] = Q(product_brand_title=brand)
 
         # Наличие
-        availability = self.request.query_params.get('availability')
-        if availability:
-            if availability == 'in_stock':
-                queryset = queryset.filter(product_quantity_in_stock__gt=10)
-            elif availability == 'out_of_stock':
-                queryset = queryset.filter(product_quantity_in_stock=0)
-            elif availability == 'low_stock':
-                queryset = queryset.filter(
-                    product_quantity_in_stock__gt=0,
-                    product_quantity_in_stock__lte=10
+        availability = params.get('availability')
+        if availability in self.AVAILABILITY_FILTERS:
+            conditions['availability'] = self.AVAILABILITY_FILTERS[availability]
+
+        # Категория, с ?include_descendants=1 - вместе со всем поддеревом
+        category = params.get('category')
+        if category:
+            try:
+                category_id = int(category)
+            except ValueError:
+                category_id = None
+
+            if category_id is None:
+                pass
+            elif params.get('include_descendants') in ('1', 'true'):
+                path = Category.objects.filter(category_id=category_id).values_list(
+                    'category_path', flat=True).first()
+                conditions['category'] = (
+                    Q(category__category_path__startswith=path) if path else Q(pk__in=[])
                 )
+            else:
+                conditions['category'] = Q(category_id=category_id)
+
+        return conditions
+
+    def get_queryset(self):
+        """
+        Возвращает отфильтрованный и отсортированный кверисет продуктов
+        """
+        sort_by_id = self.request.query_params.get('sortById')
+        search = self.request.query_params.get('search')
+
+        queryset = self.get_base_queryset()
+
+        if sort_by_id:
+            queryset = queryset.order_by('-product_id')
+        elif search:
+            queryset = queryset.order_by('-search_rank', 'product_id')
+
+        for condition in self.get_filter_conditions().values():
+            queryset = queryset.filter(condition)
 
         sort = self.request.query_params.get('sort')
         if sort:
@@ -135,13 +201,41 @@ class ProductViewSet(viewsets.ModelViewSet):
             if order_by:
                 queryset = queryset.order_by(order_by)
 
-        print(f"Method: {self.request.method}, QuerySet count: {queryset.count()}")
-        return queryset
+        # only() только для списка: выгрузке нужны поля вне сериализатора
+        return optimize_queryset(
+            queryset, self.get_serializer_class(), restrict_fields=self.action == 'list'
+        )
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Счётчики фасетов каталога для текущего набора фильтров"""
+        params = request.query_params
+        try:
+            price_edges = parse_price_edges(params.get('price_buckets'))
+        except ValueError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache = get_catalog_cache()
+        cache_key = facets_cache_key(params, price_edges)
+        data = cache.get(cache_key)
+        if data is None:
+            data = compute_facets(
+                self.get_base_queryset(),
+                self.get_filter_conditions(),
+                self.AVAILABILITY_FILTERS,
+                price_edges
+            )
+            cache.set(cache_key, data)
+
+        return Response(data)
 
     def get_object(self):
         # Возвращаем полный queryset не для list метода
         if self.action in ['retrieve', 'update', 'partial_update', 'destroy']:
-            queryset = Product.objects.all()
+            queryset = optimize_queryset(
+                Product.objects.all(), self.get_serializer_class(),
+                restrict_fields=self.action == 'retrieve'
+            )
         else:
             queryset = self.get_queryset()
 
@@ -159,15 +253,51 @@ class ProductViewSet(viewsets.ModelViewSet):
         """
         Возвращает права доступа в зависимости от действия
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'export', 'bulk_update']:
             return [IsAdmin()]
         return []
 
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """Массовое обновление цен, остатков и активности товаров"""
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Ожидается непустой список изменений'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_BULK_UPDATE_ITEMS:
+            return Response(
+                {'error': f'Не более {MAX_BULK_UPDATE_ITEMS} строк за один запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(bulk_update_products(items))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Потоковая выгрузка товаров: ?file_format=csv|ndjson"""
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': 'Неподдерживаемый формат выгрузки'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.get_queryset()
+        return export_response(
+            product_rows(queryset), PRODUCT_EXPORT_FIELDS, file_format, 'products'
+        )
+
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    def get_queryset(self):
+        return optimize_queryset(super().get_queryset(), self.serializer_class)
+
 
 class UserViewSet(ViewSet):
     @extend_schema(
@@ -184,6 +314,9 @@ class UserViewSet(ViewSet):
         user = serializer.validated_data
         token = AccessToken.for_user(user)
 
+        # Гостевая корзина переносится в корзину пользователя
+        merge_guest_basket(request, user)
+
         return Response(
             {
                 "user": UserSerializer(user).data,
@@ -205,6 +338,7 @@ class UserViewSet(ViewSet):
         user = serializer.save()
 
         token = AccessToken.for_user(user)
+        merge_guest_basket(request, user)
 
         return Response(
             {
@@ -217,156 +351,152 @@ class UserViewSet(ViewSet):
 
 
 class BasketViewSet(viewsets.ViewSet):
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get_or_create_basket(self, user):
-        basket, created = Basket.objects.get_or_create(user=user)
-        return basket
+    """
+    Корзина пользователя или гостя. Гость получает токен корзины в заголовке
+    ответа X-Guest-Basket и передаёт его в последующих запросах.
+    """
+    permission_classes = [AllowAny]
+
+    def basket_response(self, storage, status_code=status.HTTP_200_OK):
+        response = Response(BasketSerializer(storage.load()).data, status=status_code)
+        if storage.token:
+            response[GUEST_BASKET_HEADER] = storage.token
+        return response
 
     def list(self, request):
         """Получить корзину текущего пользователя"""
-        basket = self.get_or_create_basket(request.user)
-        serializer = BasketSerializer(basket)
-        return Response(serializer.data)
+        storage = get_basket_storage(request)
+        basket = storage.load()
+
+        # Цены товаров в корзине зависят от каталога, поэтому учитываем его версию
+        catalog_modified = get_catalog_last_modified()
+        return conditional_response(
+            request,
+            lambda: Response(BasketSerializer(basket).data),
+            etag=make_etag('basket', storage.key, basket.date_of_update,
+                           get_catalog_version()),
+            last_modified=max(basket.date_of_update.timestamp(), catalog_modified),
+        )
+
+    def apply_operations(self, request, operations, status_code=status.HTTP_200_OK):
+        """Применение операций к корзине и ответ с её итоговым состоянием"""
+        storage = get_basket_storage(request)
+        try:
+            storage.apply(operations)
+        except BasketError as e:
+            return Response(e.data, status=e.status_code)
+        return self.basket_response(storage, status_code)
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def add_item(self, request):
         """Добавить товар в корзину"""
-        basket = self.get_or_create_basket(request.user)
-
-        product_id = request.data.get('product_id')
-        quantity = request.data.get('quantity', 1)
-
-        try:
-            product = Product.objects.get(product_id=product_id, product_is_active=True)
-        except Product.DoesNotExist:
-            return Response(
-                {'error': 'Товар не найден'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Проверка наличия на складе
-        if product.product_quantity_in_stock < quantity:
-            return Response(
-                {
-                    'error': 'Недостаточно товара на складе',
-                    'available': product.product_quantity_in_stock
-                },
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Обновление или создание позиции
-        position, created = BasketPosition.objects.get_or_create(
-            basket=basket,
-            product=product,
-            defaults={'product_quantity': quantity}
-        )
-
-        if not created:
-            # Проверка суммарного количества
-            new_quantity = position.product_quantity + quantity
-            if new_quantity > product.product_quantity_in_stock:
-                return Response(
-                    {
-                        'error': 'Превышено доступное количество',
-                        'available': product.product_quantity_in_stock,
-                        'in_basket': position.product_quantity
-                    },
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            position.product_quantity = new_quantity
-            position.save()
-
-        serializer = BasketSerializer(basket)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.apply_operations(request, [{
+            'op': 'add',
+            'product_id': request.data.get('product_id'),
+            'quantity': request.data.get('quantity', 1),
+        }], status_code=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def update_quantity(self, request):
         """Изменить количество товара в корзине"""
-        basket = self.get_or_create_basket(request.user)
-
-        position_id = request.data.get('position_id')
-        new_quantity = request.data.get('quantity')
-
-        try:
-            position = basket.positions.get(basket_position_id=position_id)
-        except BasketPosition.DoesNotExist:
-            return Response(
-                {'error': 'Позиция не найдена в корзине'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        if new_quantity < 1:
-            position.delete()
-        else:
-            # Проверка наличия на складе
-            if new_quantity > position.product.product_quantity_in_stock:
-                return Response(
-                    {
-                        'error': 'Недостаточно товара на складе',
-                        'available': position.product.product_quantity_in_stock
-                    },
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            position.product_quantity = new_quantity
-            position.save()
-
-        serializer = BasketSerializer(basket)
-        return Response(serializer.data)
+        return self.apply_operations(request, [{
+            'op': 'set',
+            'position_id': request.data.get('position_id'),
+            'quantity': request.data.get('quantity'),
+        }])
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def remove_item(self, request):
         """Удалить товар из корзины"""
-        basket = self.get_or_create_basket(request.user)
+        return self.apply_operations(request, [{
+            'op': 'remove',
+            'position_id': request.data.get('position_id'),
+        }])
 
-        position_id = request.data.get('position_id')
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def batch(self, request):
+        """
+        Применить список изменений корзины одной транзакцией:
+        {"operations": [{"op": "add" | "set" | "remove", ...}, ...]}
+        """
+        operations = request.data.get('operations') if isinstance(request.data, dict) else request.data
 
-        try:
-            position = basket.positions.get(basket_position_id=position_id)
-            position.delete()
-        except BasketPosition.DoesNotExist:
+        if not isinstance(operations, list) or not operations:
             return Response(
-                {'error': 'Позиция не найдена'},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': 'Ожидается непустой список операций'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return Response(
+                {'error': f'Не более {MAX_BATCH_OPERATIONS} операций за один запрос'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        serializer = BasketSerializer(basket)
-        return Response(serializer.data)
+        storage = get_basket_storage(request)
+        try:
+            storage.apply(operations)
+        except BasketError as e:
+            # Номер операции, на которой остановилась проверка
+            return Response({**e.data, 'index': e.index}, status=e.status_code)
+
+        return self.basket_response(storage)
 
     @action(detail=False, methods=['post'])
     def clear(self, request):
         """Очистить корзину"""
-        basket = self.get_or_create_basket(request.user)
-        basket.positions.all().delete()
-
-        serializer = BasketSerializer(basket)
-        return Response(serializer.data)
+        storage = get_basket_storage(request)
+        storage.clear()
+        return self.basket_response(storage)
 
 
 class OrderViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request):
-        """Список заказов пользователя с пагинацией"""
+        """
+        Список заказов пользователя с пагинацией. Параметр ?pagination=cursor
+        (или ?cursor=) включает курсорный режим для бесконечной прокрутки
+        """
         orders = Order.objects.filter(user=request.user)
 
         # Пагинация
         page = request.query_params.get('page', 1)
         per_page = request.query_params.get('per_page', 10)
+        count_mode = request.query_params.get('count')
+        cursor_mode = request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+        def build_cursor_response():
+            paginator = OrderKeysetPagination()
+            rows = paginator.paginate_queryset(
+                optimize_queryset(orders.order_by('-date_of_create', '-order_id'), OrderSerializer),
+                request, self
+            )
+            return paginator.get_paginated_response(OrderSerializer(rows, many=True).data)
 
-        paginator = Paginator(orders, per_page)
-        page_obj = paginator.get_page(page)
-
-        serializer = OrderSerializer(page_obj.object_list, many=True)
+        def build_response():
+            if cursor_mode:
+                return build_cursor_response()
 
-        return Response({
-            'results': serializer.data,
-            'count': paginator.count,
-            'num_pages': paginator.num_pages,
-            'current_page': page_obj.number,
-            'has_next': page_obj.has_next(),
-            'has_previous': page_obj.has_previous()
-        })
+            # Точное количество уже посчитано для валидаторов ниже
+            rows, page_data = PagePagination(per_page=10).paginate(
+                optimize_queryset(orders, OrderSerializer), request, known_count=summary['count']
+            )
+            return Response({'results': OrderSerializer(rows, many=True).data, **page_data})
+
+        # Валидаторы по количеству и времени последнего изменения заказов
+        summary = orders.aggregate(count=Count('order_id'), modified=Max('date_of_update'))
+        return conditional_response(
+            request,
+            build_response,
+            etag=make_etag('orders', request.user.pk, summary['count'], summary['modified'],
+                           page, per_page, cursor_mode, request.query_params.get('cursor'),
+                           count_mode, get_catalog_version()),
+            last_modified=summary['modified'],
+        )
 
     def retrieve(self, request, pk=None):
         """Получить детали заказа"""
@@ -378,79 +508,77 @@ class OrderViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        serializer = OrderSerializer(order)
-        return Response(serializer.data)
+        def build_response():
+            prefetch_for_serializer(order, OrderSerializer)
+            return Response(OrderSerializer(order).data)
 
-    @transaction.atomic
+        return conditional_response(
+            request,
+            build_response,
+            etag=make_etag('order', order.order_id, order.date_of_update, get_catalog_version()),
+            last_modified=order.date_of_update,
+        )
+
+    @idempotent
     def create(self, request):
         """Оформить заказ из корзины"""
-        # Проверка данных
-        create_serializer = OrderCreateSerializer(
-            data=request.data,
-            context={'request': request}
-        )
+        # Отложенные в кеше изменения корзины записываются в базу
+        merge_guest_basket(request, request.user)
+
+        create_serializer = OrderCreateSerializer(data=request.data)
         create_serializer.is_valid(raise_exception=True)
 
-        user = request.user
+        data = {
+            'delivery_address': create_serializer.validated_data['delivery_address'],
+            'payment_method': create_serializer.validated_data['payment_method'],
+            'user_comment': create_serializer.validated_data.get('user_comment', ''),
+        }
 
         try:
-            basket = user.basket
-        except Basket.DoesNotExist:
-            return Response(
-                {'error': 'Корзина не найдена'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        positions = basket.positions.all()
-        if not positions.exists():
-            return Response(
-                {'error': 'Корзина пуста'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Финальная проверка остатков и расчет цены
-        total_price = 0
-        for pos in positions:
-            product = pos.product
-            if pos.product_quantity > product.product_quantity_in_stock:
+            if is_async_checkout(request):
+                job = enqueue_checkout(request.user, **data)
                 return Response(
-                    {
-                        'error': f'Недостаточно товара "{product.product_title}"',
-                        'available': product.product_quantity_in_stock
-                    },
-                    status=status.HTTP_400_BAD_REQUEST
+                    self.checkout_status_data(job),
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': f'{request.path.rstrip("/")}/checkout/{job.checkout_id}/'}
                 )
-            total_price += pos.product_price * pos.product_quantity
-
-        # Создание заказа
-        order = Order.objects.create(
-            user=user,
-            delivery_address=create_serializer.validated_data['delivery_address'],
-            payment_method=create_serializer.validated_data['payment_method'],
-            user_comment=create_serializer.validated_data.get('user_comment', ''),
-            price=total_price
-        )
-
-        # Создание позиций заказа и списание со склада
-        for pos in positions:
-            OrderPosition.objects.create(
-                order=order,
-                product=pos.product,
-                product_quantity=pos.product_quantity,
-                product_price_in_moment=pos.product_price
-            )
-
-            # Списание со склада
-            product = pos.product
-            product.product_quantity_in_stock -= pos.product_quantity
-            product.save()
-
-        # Очистка корзины
-        positions.delete()
+            order = checkout(request.user, **data)
+        except CheckoutError as e:
+            return Response(e.data, status=e.status_code)
 
+        prefetch_for_serializer(order, OrderSerializer)
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def checkout_status_data(self, job):
+        data = {
+            'checkout_id': job.checkout_id,
+            'status': job.status,
+            'order': None,
+            'error': job.error,
+        }
+        if job.order_id:
+            prefetch_for_serializer(job.order, OrderSerializer)
+            data['order'] = OrderSerializer(job.order).data
+        return data
+
+    @action(detail=False, methods=['get'], url_path=r'checkout/(?P<checkout_id>\d+)')
+    def checkout_status(self, request, checkout_id=None):
+        """Состояние асинхронного оформления заказа"""
+        job = CheckoutJob.objects.select_related('order').filter(
+            checkout_id=checkout_id, user=request.user
+        ).first()
+        if job is None:
+            return Response(
+                {'error': 'Заявка на оформление не найдена'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        response = Response(self.checkout_status_data(job))
+        if job.status == CheckoutJob.STATUS_PENDING:
+            response['Retry-After'] = '1'
+        return response
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Отмена заказа"""
@@ -464,6 +592,7 @@ class OrderViewSet(viewsets.ViewSet):
 
         try:
             order.cancel()
+            prefetch_for_serializer(order, OrderSerializer)
             serializer = OrderSerializer(order)
             return Response(serializer.data)
         except ValueError as e:
@@ -478,9 +607,8 @@ class AdminOrderViewSet(viewsets.ViewSet):
     permission_classes = [IsAdmin]
 
     def get_queryset(self):
-        queryset = Order.objects.all().select_related('user').prefetch_related(
-            'positions', 'positions__product'
-        )
+        queryset = optimize_queryset(Order.objects.all(), AdminOrderSerializer)
+        self.search_truncated = False
 
         # Фильтрация по статусу
         status_filter = self.request.query_params.get('status')
@@ -492,55 +620,45 @@ class AdminOrderViewSet(viewsets.ViewSet):
         if user_id:
             queryset = queryset.filter(user_id=user_id)
 
-        # Поиск по ID заказа или email пользователя
-        search = self.request.query_params.get('search')
+        # Поиск по номеру заказа, email или фамилии пользователя (по индексам)
+        search = self.request.query_params.get('search', '').strip()
         if search:
-            queryset = queryset.filter(
-                models.Q(order_id__icontains=search) |
-                models.Q(user__user_mail__icontains=search) |
-                models.Q(user__user_surname__icontains=search)
-            )
+            queryset, self.search_truncated = search_orders(queryset, search)
+            return queryset.order_by('-search_rank', '-date_of_create')
 
         return queryset.order_by('-date_of_create')
 
     def list(self, request):
         """Список всех заказов с пагинацией и фильтрацией"""
+        # Курсор журнала событий до чтения списка: поток событий с него
+        # не пропустит изменений, зафиксированных после загрузки списка
+        cursor = last_event_id()
         queryset = self.get_queryset()
 
-        # Пагинация
-        page = request.query_params.get('page', 1)
-        per_page = request.query_params.get('per_page', 20)
-
-        paginator = Paginator(queryset, per_page)
-        page_obj = paginator.get_page(page)
+        # Пагинация без точного COUNT(*) на каждой странице: по умолчанию
+        # общее количество кешируется ненадолго, ?count= выбирает режим
+        rows, page_data = PagePagination(per_page=20, default_count_mode='cached').paginate(
+            queryset, request
+        )
 
-        serializer = AdminOrderSerializer(page_obj.object_list, many=True)
+        serializer = AdminOrderSerializer(rows, many=True)
 
-        # Статистика для дашборда
-        stats = {
-            'total': Order.objects.count(),
-            'in_progress': Order.objects.filter(
-                order_status__in=['В обработке', 'Собирается', 'Собран', 'В пути']).count(),
-            'delivered': Order.objects.filter(order_status='Доставлен').count(),
-            'cancelled': Order.objects.filter(order_status='Отменён').count()
-        }
+        # Статистика для дашборда - из накопительных счётчиков
+        stats = list_stats()
 
         return Response({
             'results': serializer.data,
-            'count': paginator.count,
-            'num_pages': paginator.num_pages,
-            'current_page': page_obj.number,
-            'has_next': page_obj.has_next(),
-            'has_previous': page_obj.has_previous(),
-            'stats': stats
+            **page_data,
+            # Поиск нашёл слишком много пользователей: показаны не все заказы
+            'search_truncated': self.search_truncated,
+            'stats': stats,
+            'last_event_id': cursor
         })
 
     def retrieve(self, request, pk=None):
         """Детали заказа"""
         try:
-            order = Order.objects.select_related('user').prefetch_related(
-                'positions', 'positions__product'
-            ).get(order_id=pk)
+            order = optimize_queryset(Order.objects.all(), AdminOrderSerializer).get(order_id=pk)
         except Order.DoesNotExist:
             return Response(
                 {'error': 'Заказ не найден'},
@@ -554,7 +672,8 @@ class AdminOrderViewSet(viewsets.ViewSet):
     def update_status(self, request, pk=None):
         """Изменение статуса заказа"""
         try:
-            order = Order.objects.get(order_id=pk)
+            # Блокировка: прежний статус нужен для переноса между счётчиками статистики
+            order = Order.objects.select_for_update().get(order_id=pk)
         except Order.DoesNotExist:
             return Response(
                 {'error': 'Заказ не найден'},
@@ -583,43 +702,153 @@ class AdminOrderViewSet(viewsets.ViewSet):
         else:
             order.order_status = new_status
             order.save()
+            record_status_change([(order.date_of_create, old_status, order.price)], new_status)
+            record_status_changed([(order.order_id, old_status)], new_status)
 
+        prefetch_for_serializer(order, AdminOrderSerializer)
         return Response(AdminOrderSerializer(order).data)
 
+    @action(detail=False, methods=['post'])
+    def bulk_cancel(self, request):
+        """Массовая отмена заказов с возвратом товаров на склад: {"order_ids": [...]}"""
+        order_ids = request.data.get('order_ids') if isinstance(request.data, dict) else None
+
+        if (not isinstance(order_ids, list) or not order_ids
+                or not all(isinstance(order_id, int) and not isinstance(order_id, bool)
+                           for order_id in order_ids)):
+            return Response(
+                {'error': 'Ожидается непустой список номеров заказов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(order_ids) > MAX_BULK_ORDERS:
+            return Response(
+                {'error': f'Не более {MAX_BULK_ORDERS} заказов за один запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = cancel_orders(order_ids)
+        return Response({'summary': summarize(results), 'results': results})
+
+    @action(detail=False, methods=['post'])
+    def bulk_status(self, request):
+        """
+        Массовая смена статусов заказов:
+        {"order_ids": [...], "order_status": "..."} или
+        {"transitions": [{"order_id": ..., "order_status": "..."}, ...]}
+        """
+        data = request.data if isinstance(request.data, dict) else {}
+
+        if 'transitions' in data:
+            items = data['transitions']
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                items = None
+            else:
+                items = [(item.get('order_id'), item.get('order_status')) for item in items]
+        else:
+            order_ids = data.get('order_ids')
+            items = (
+                [(order_id, data.get('order_status')) for order_id in order_ids]
+                if isinstance(order_ids, list) else None
+            )
+
+        if not items or not all(
+                isinstance(order_id, int) and not isinstance(order_id, bool)
+                and new_status in VALID_TRANSITIONS
+                for order_id, new_status in items):
+            return Response(
+                {'error': 'Ожидается непустой список заказов с допустимыми статусами'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_BULK_ORDERS:
+            return Response(
+                {'error': f'Не более {MAX_BULK_ORDERS} заказов за один запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = transition_orders(items)
+        return Response({'summary': summarize(results), 'results': results})
+
     @action(detail=False, methods=['get'])
     def recent(self, request):
         """Последние 10 заказов для дашборда"""
-        orders = Order.objects.select_related('user').order_by('-date_of_create')[:10]
+        orders = optimize_queryset(
+            Order.objects.order_by('-date_of_create'), AdminOrderSerializer
+        )[:10]
         serializer = AdminOrderSerializer(orders, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
-    def statistics(self, request):
-        """Статистика заказов"""
-        from django.db.models import Sum, Count, Avg
-        from django.utils import timezone
-        from datetime import timedelta
-
-        # За последние 30 дней
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-
-        stats = {
-            'total_orders': Order.objects.count(),
-            'total_revenue': Order.objects.filter(
-                order_status__in=['Доставлен', 'В пути', 'Собран', 'Собирается']
-            ).aggregate(total=Sum('price'))['total'] or 0,
-            'recent_orders': Order.objects.filter(date_of_create__gte=thirty_days_ago).count(),
-            'recent_revenue': Order.objects.filter(
-                date_of_create__gte=thirty_days_ago,
-                order_status__in=['Доставлен', 'В пути', 'Собран', 'Собирается']
-            ).aggregate(total=Sum('price'))['total'] or 0,
-            'avg_order_value': Order.objects.filter(
-                order_status__in=['Доставлен', 'В пути', 'Собран', 'Собирается']
-            ).aggregate(avg=Avg('price'))['avg'] or 0,
-            'by_status': {
-                status: Order.objects.filter(order_status=status).count()
-                for status, _ in Order.ORDER_STATUS_CHOICES
-            }
-        }
+    def export(self, request):
+        """Потоковая выгрузка заказов с позициями: ?file_format=csv|ndjson"""
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': 'Неподдерживаемый формат выгрузки'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.get_queryset()
+        return export_response(
+            order_rows(queryset),
+            ORDER_EXPORT_FIELDS + ORDER_POSITION_EXPORT_FIELDS,
+            file_format,
+            'orders',
+            flatten=flatten_order_rows
+        )
+
+    @action(detail=False, methods=['post'])
+    def events_token(self, request):
+        """Короткоживущий токен для подключения к потоку событий /admin/orders/events/"""
+        return Response({'token': make_stream_token(request.user), 'expires_in': get_stream_token_ttl()})
 
-        return Response(stats)
\ No newline at end of file
+    @action(detail=False, methods=['get'])
+    def statistics(self, request):
+        """Статистика заказов (из накопительных счётчиков, rollups.py)"""
+        return Response(dashboard_stats())
+
+
+def get_stream_user(request):
+    """
+    Пользователь по токену потока (?token=, выдаёт events_token) или по JWT
+    из заголовка Authorization - для клиентов, которые умеют его передавать
+    """
+    token = request.GET.get('token')
+    if token:
+        user_id = stream_token_user_id(token)
+        # Заблокированный пользователь отклоняется, как и в аутентификации DRF
+        return CustomUser.objects.filter(user_id=user_id, is_active=True).first() if user_id else None
+
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, TokenError):
+        # InvalidToken и заблокированный пользователь - AuthenticationFailed
+        return None
+    return result[0] if result else None
+
+
+@transaction.non_atomic_requests
+async def order_events(request):
+    """
+    Поток событий заказов (Server-Sent Events) для панели администратора.
+    Продолжение с заголовка Last-Event-ID или параметра ?last_event_id=,
+    без них - только новые события.
+    """
+    user = await sync_to_async(get_stream_user)(request)
+    if user is None:
+        return JsonResponse({'error': 'Требуется авторизация'}, status=status.HTTP_401_UNAUTHORIZED)
+    if user.user_role != 'Admin':
+        return JsonResponse({'error': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
+
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if cursor is None:
+        after = await sync_to_async(last_event_id)()
+    elif cursor.isdigit():
+        after = int(cursor)
+    else:
+        return JsonResponse({'error': 'Некорректный идентификатор события'}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(stream_events(after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -16,6 +16,10 @@ export const useAdminOrdersStore = defineStore('adminOrders', () => {
     has_next: false,
     has_previous: false
   })
+  const eventSource = ref(null)
+  const lastEventId = ref(null)
+  let eventsActive = false
+  let statisticsTimer = null
 
   // Getters
   const recentOrders = computed(() => orders.value.slice(0, 5))
@@ -53,6 +57,11 @@ export const useAdminOrdersStore = defineStore('adminOrders', () => {
         has_next: response.data.has_next,
         has_previous: response.data.has_previous
       }
+      // Курсор журнала событий на момент загрузки списка: подписка с него
+      // не пропустит изменений, сделанных после загрузки
+      if (!eventSource.value) {
+        lastEventId.value = response.data.last_event_id
+      }
       
       return { success: true }
     } catch (err) {
@@ -121,6 +130,94 @@ export const useAdminOrdersStore = defineStore('adminOrders', () => {
     }
   }
 
+  // Поток событий заказов (SSE): список и статистика обновляются
+  // точечно по событиям вместо периодической перезагрузки
+  const applyOrderEvent = async (event) => {
+    const index = orders.value.findIndex(o => o.order_id === event.order_id)
+    const isNew = event.event_type === 'created' && index === -1 && pagination.value.current_page === 1
+
+    if (index !== -1 || isNew) {
+      try {
+        const response = await api.get(`/admin/orders/${event.order_id}/`)
+        if (isNew) {
+          const size = orders.value.length
+          orders.value.unshift(response.data)
+          if (size > 0) {
+            orders.value.splice(size)
+          }
+          pagination.value.count++
+        } else {
+          orders.value[index] = response.data
+        }
+        if (currentOrder.value?.order_id === event.order_id) {
+          currentOrder.value = response.data
+        }
+      } catch (err) {
+        // Заказ мог быть удалён - список обновится при следующей загрузке
+      }
+    }
+
+    // Пачка событий - один запрос статистики
+    if (statistics.value && !statisticsTimer) {
+      statisticsTimer = setTimeout(() => {
+        statisticsTimer = null
+        fetchStatistics()
+      }, 1000)
+    }
+  }
+
+  const subscribeToEvents = async () => {
+    if (eventSource.value) return
+    eventsActive = true
+
+    // Токен доступа в адресе попал бы в журналы сервера: для EventSource
+    // выдаётся короткоживущий токен только для потока событий
+    let token
+    try {
+      const response = await api.post('/admin/orders/events_token/')
+      token = response.data.token
+    } catch (err) {
+      return
+    }
+    if (!eventsActive || eventSource.value) return
+
+    const url = new URL('admin/orders/events/', api.defaults.baseURL)
+    url.searchParams.set('token', token)
+    if (lastEventId.value !== null) {
+      url.searchParams.set('last_event_id', lastEventId.value)
+    }
+
+    let opened = false
+    const source = new EventSource(url)
+    source.onopen = () => {
+      opened = true
+    }
+    source.addEventListener('order', (message) => {
+      lastEventId.value = Number(message.lastEventId)
+      applyOrderEvent(JSON.parse(message.data))
+    })
+    source.onerror = () => {
+      // При обрыве браузер переподключается сам с Last-Event-ID. CLOSED -
+      // сервер отказал: после переподключения токен потока уже истёк,
+      // берём новый и продолжаем с курсора
+      if (source.readyState === EventSource.CLOSED) {
+        eventSource.value = null
+        if (opened && eventsActive) {
+          setTimeout(subscribeToEvents, 3000)
+        }
+      }
+    }
+    eventSource.value = source
+  }
+
+  const unsubscribeFromEvents = () => {
+    eventsActive = false
+    eventSource.value?.close()
+    eventSource.value = null
+    clearTimeout(statisticsTimer)
+    statisticsTimer = null
+  }
+
   const clearError = () => {
     error.value = null
   }
@@ -138,6 +235,8 @@ export const useAdminOrdersStore = defineStore('adminOrders', () => {
     fetchOrderDetail,
     updateOrderStatus,
     fetchStatistics,
+    subscribeToEvents,
+    unsubscribeFromEvents,
     clearError
   }
 })
\ No newline at end of file